@@ -1,71 +1,359 @@
+import argparse
+import glob
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
 import pandas as pd
+import matplotlib
 import matplotlib.pyplot as plt
+import net_metering
 
-# Load the data
-file_path = 'energy1.dat'  # Adjust the file path as necessary
-energy_data = pd.read_csv(file_path, delimiter='\t', parse_dates=['start_time', 'end_time'])
-
-# Convert the timezone to UTC and then remove the timezone information
-energy_data['start_time'] = pd.to_datetime(energy_data['start_time'], utc=True).dt.tz_convert(None)
-energy_data['end_time'] = pd.to_datetime(energy_data['end_time'], utc=True).dt.tz_convert(None)
-
-# Calculate the total energy consumed and the total cost
-total_energy_consumed = energy_data['consumption'].sum()
-total_cost = energy_data['provided_cost'].sum()
-
-# Energy generated by solar panels in kWh (converted from MWh)
-solar_generation_kWh = 4.95 * 1000  # 4.95 MWh to kWh
-
-# Adjust total energy consumed by subtracting the energy generated by the solar panel
-adjusted_energy_consumed = total_energy_consumed - solar_generation_kWh
-
-# Calculate cost per kWh and adjust the total cost based on the new energy consumption
-cost_per_kWh = total_cost / total_energy_consumed
-adjusted_total_cost = adjusted_energy_consumed * cost_per_kWh
-
-# Output the results
-print(f"Original Total Energy Consumed: {total_energy_consumed} kWh")
-print(f"Original Total Cost: ${total_cost:.2f}")
-print(f"Adjusted Total Energy Consumed after Solar Contribution: {adjusted_energy_consumed} kWh")
-print(f"Adjusted Total Cost after Solar Contribution: ${adjusted_total_cost:.2f}")
-
-# Set the index for resampling purposes
-energy_data.set_index('start_time', inplace=True)
-
-# Resample the data to daily, weekly, monthly sums
-daily_energy_consumption = energy_data['consumption'].resample('D').sum()
-weekly_energy_consumption = energy_data['consumption'].resample('W').sum()
-monthly_energy_consumption = energy_data['consumption'].resample('ME').sum()
-
-
-# Plot the daily energy consumption
-plt.figure(figsize=(12, 6))  # Adjust the figure size as needed
-plt.plot(daily_energy_consumption.index, daily_energy_consumption, marker='o', linestyle='-', color='purple')
-plt.title('Daily Energy Consumption')
-plt.xlabel('Date')
-plt.ylabel('Energy Consumption (kWh)')
-plt.grid(True)
-plt.savefig('Daily_Energy_Consumption.png')  # Save the plot as a PNG file
-plt.show()
-
-# Plot the weekly energy consumption
-plt.figure(figsize=(10, 5))
-plt.plot(weekly_energy_consumption.index, weekly_energy_consumption, marker='o', linestyle='-', color='blue')
-plt.title('Weekly Energy Consumption')
-plt.xlabel('Week')
-plt.ylabel('Energy Consumption (kWh)')
-plt.grid(True)
-plt.savefig('Weekly_Energy_Consumption.png')
-plt.show()
-
-# Plot the monthly energy consumption
-plt.figure(figsize=(10, 5))
-plt.plot(monthly_energy_consumption.index, monthly_energy_consumption, marker='o', linestyle='-', color='green')
-plt.title('Monthly Energy Consumption')
-plt.xlabel('Month')
-plt.ylabel('Energy Consumption (kWh)')
-plt.grid(True)
-plt.savefig('Monthly_Energy_Consumption.png')
-plt.show()
+# The binary sidecar format is shared with the Flask app's load_data, so dat_cache is
+# imported from ../watt-seer-flask. Appended to the path so it cannot shadow local modules.
+FLASK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'watt-seer-flask')
+sys.path.append(FLASK_DIR)
+try:
+    import dat_cache
+except ImportError as e:
+    raise ImportError(f"energy-use.py needs dat_cache.py from the watt-seer-flask directory ({FLASK_DIR})") from e
 
+# Columns read from the exports; the rest of each row is skipped while parsing
+COLUMNS = ['start_time', 'end_time', 'consumption', 'provided_cost']
+DTYPES = {'start_time': str, 'end_time': str, 'consumption': np.float64, 'provided_cost': np.float64}
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S%z'
 
+# Rows parsed at a time per file
+CHUNK_SIZE = 100_000
+
+# Solar system size evaluated when none is given; about 5 MWh a year in Portland
+DEFAULT_SOLAR_KW = 5.0
+
+# Consumption charts written for every run or report
+CHARTS = [
+    {'name': 'Daily_Energy_Consumption', 'freq': 'D', 'title': 'Daily Energy Consumption',
+     'xlabel': 'Date', 'color': 'purple', 'figsize': (12, 6)},
+    {'name': 'Weekly_Energy_Consumption', 'freq': 'W', 'title': 'Weekly Energy Consumption',
+     'xlabel': 'Week', 'color': 'blue', 'figsize': (10, 5)},
+    {'name': 'Monthly_Energy_Consumption', 'freq': 'ME', 'title': 'Monthly Energy Consumption',
+     'xlabel': 'Month', 'color': 'green', 'figsize': (10, 5)},
+]
+
+
+class EnergyTotals:
+    """Running hourly consumption and cost sums.
+
+    Each chunk of intervals is reduced to per-hour sums before it is added,
+    so memory grows with the number of hours covered, not the number of
+    rows. Daily, weekly and monthly series are resampled from the hourly
+    sums. Totals of files read in other processes are combined with merge().
+    The longest interval seen tells whether the hourly sums are real hours
+    or whole days floored into their first hour.
+    """
+
+    def __init__(self):
+        self.total_energy = 0.0
+        self.total_cost = 0.0
+        self.rows = 0
+        self.longest_interval = pd.Timedelta(0)
+        self.hourly = pd.DataFrame(columns=['consumption', 'provided_cost'], dtype=np.float64)
+
+    def add(self, chunk):
+        """Add a chunk of intervals with UTC start_time, consumption and provided_cost columns"""
+        self.total_energy += chunk['consumption'].sum()
+        self.total_cost += chunk['provided_cost'].sum()
+        self.rows += len(chunk)
+        longest = (chunk['end_time'] - chunk['start_time']).max()
+        if pd.notna(longest):
+            self.longest_interval = max(self.longest_interval, longest)
+        hourly = chunk[['consumption', 'provided_cost']].groupby(chunk['start_time'].dt.floor('h').to_numpy()).sum()
+        self._add_hourly(hourly)
+
+    def merge(self, other):
+        """Add the totals of another accumulator"""
+        self.total_energy += other.total_energy
+        self.total_cost += other.total_cost
+        self.rows += other.rows
+        self.longest_interval = max(self.longest_interval, other.longest_interval)
+        self._add_hourly(other.hourly)
+
+    def resample(self, freq, column='consumption'):
+        """Return the sums at an hourly ('h'), daily ('D'), weekly ('W') or monthly ('ME') frequency, including empty periods"""
+        if self.hourly.empty:
+            return pd.Series(dtype=np.float64)
+        return self.hourly[column].sort_index().resample(freq).sum()
+
+    def _add_hourly(self, hourly):
+        self.hourly = hourly if self.hourly.empty else self.hourly.add(hourly, fill_value=0)
+
+
+def find_inputs(patterns):
+    """Expand files, directories (searched recursively for .dat files) and glob patterns into a sorted file list"""
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths.update(glob.glob(os.path.join(pattern, '**', '*.dat'), recursive=True))
+        else:
+            paths.update(path for path in glob.glob(pattern, recursive=True) if os.path.isfile(path))
+    return sorted(paths)
+
+
+def parse_chunks(file_path, chunksize):
+    """Yield a text export's intervals chunk by chunk with timestamps converted to naive UTC"""
+    reader = pd.read_csv(file_path, delimiter='\t', usecols=COLUMNS, dtype=DTYPES,
+                         na_values=['None'], chunksize=chunksize)
+    for chunk in reader:
+        for column in dat_cache.TIME_COLUMNS:
+            chunk[column] = pd.to_datetime(chunk[column], format=TIMESTAMP_FORMAT, utc=True).dt.tz_convert(None)
+        yield chunk
+
+
+def read_chunks(file_path, chunksize=CHUNK_SIZE, use_cache=True):
+    """Yield a file's intervals chunk by chunk, from its binary sidecar (see dat_cache) when it is up to date"""
+    if not use_cache:
+        yield from parse_chunks(file_path, chunksize)
+        return
+    columns = dat_cache.read_sidecar(file_path)
+    if columns is not None:
+        yield from dat_cache.sidecar_chunks(columns, chunksize)
+    else:
+        yield from dat_cache.cache_chunks(file_path, parse_chunks(file_path, chunksize))
+
+
+def summarize_file(file_path, chunksize=CHUNK_SIZE, use_cache=True):
+    """Stream one file into a new accumulator"""
+    totals = EnergyTotals()
+    for chunk in read_chunks(file_path, chunksize, use_cache):
+        totals.add(chunk)
+    return totals
+
+
+def summarize_files(paths, workers=None, chunksize=CHUNK_SIZE, use_cache=True):
+    """Stream every file on a process pool and merge the per-file totals"""
+    totals = EnergyTotals()
+    if len(paths) == 1 or workers == 1:
+        for path in paths:
+            totals.merge(summarize_file(path, chunksize, use_cache))
+        return totals
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for file_totals in executor.map(summarize_file, paths, [chunksize] * len(paths), [use_cache] * len(paths)):
+            totals.merge(file_totals)
+    return totals
+
+
+class ChartRenderer:
+    """Draw the consumption charts on one figure per chart that is reused across reports.
+
+    Redrawing only replaces the line's data, title and limits, so a batch
+    worker sets up each figure once instead of once per household.
+    """
+
+    def __init__(self):
+        self._charts = {}
+
+    def draw(self, chart, series, title=None):
+        """Plot a series on the chart's figure and return the figure"""
+        if chart['name'] not in self._charts:
+            fig, ax = plt.subplots(figsize=chart['figsize'])
+            ax.xaxis_date()
+            line, = ax.plot([], [], marker='o', linestyle='-', color=chart['color'])
+            ax.set_xlabel(chart['xlabel'])
+            ax.set_ylabel('Energy Consumption (kWh)')
+            ax.grid(True)
+            self._charts[chart['name']] = (fig, ax, line)
+        fig, ax, line = self._charts[chart['name']]
+        line.set_data(series.index.to_numpy(), series.to_numpy())
+        ax.set_title(title or chart['title'])
+        ax.relim()
+        ax.autoscale_view()
+        return fig
+
+
+_renderer = None
+
+
+def get_renderer():
+    """Return this process's chart renderer"""
+    global _renderer
+    if _renderer is None:
+        _renderer = ChartRenderer()
+    return _renderer
+
+
+def plan_reports(patterns):
+    """Return (name, files) per report: one per directory given, and one per other matching file.
+
+    Each file is read by one report only. Files under a directory given are
+    left to that directory's report, so they are not counted twice.
+    """
+    in_directories = set(os.path.abspath(path) for path in find_inputs([p for p in patterns if os.path.isdir(p)]))
+    claimed = set()
+    reports = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths = [path for path in find_inputs([pattern]) if os.path.abspath(path) not in claimed]
+            reports.append((os.path.basename(os.path.abspath(pattern)), paths))
+        else:
+            paths = [path for path in find_inputs([pattern])
+                     if os.path.abspath(path) not in in_directories and os.path.abspath(path) not in claimed]
+            reports.extend((os.path.splitext(os.path.basename(path))[0], [path]) for path in paths)
+        claimed.update(os.path.abspath(path) for path in paths)
+    names = {}
+    unique = []
+    for name, paths in reports:
+        if not paths:
+            continue
+        names[name] = names.get(name, 0) + 1
+        unique.append((name if names[name] == 1 else f'{name}-{names[name]}', paths))
+    return unique
+
+
+def render_report(name, paths, output_dir, formats=('png',), chunksize=CHUNK_SIZE, use_cache=True, solar=None):
+    """Summarize one household's files and write its charts; return its summary.
+
+    solar is None or a dict of a 'sizes' list and evaluate_solar options, whose results are added to the summary.
+    """
+    matplotlib.use('Agg')
+    totals = summarize_files(paths, workers=1, chunksize=chunksize, use_cache=use_cache)
+    report_dir = os.path.join(output_dir, name)
+    os.makedirs(report_dir, exist_ok=True)
+    charts = []
+    for chart in CHARTS:
+        fig = get_renderer().draw(chart, totals.resample(chart['freq']), f"{chart['title']} - {name}")
+        for fmt in formats:
+            path = os.path.join(report_dir, f"{chart['name']}.{fmt}")
+            fig.savefig(path, format=fmt)
+            charts.append(os.path.relpath(path, output_dir))
+    daily = totals.resample('D')
+    report = {
+        'name': name,
+        'files': paths,
+        'intervals': totals.rows,
+        'start': daily.index[0].strftime('%Y-%m-%d') if not daily.empty else None,
+        'end': daily.index[-1].strftime('%Y-%m-%d') if not daily.empty else None,
+        'total_energy_kWh': round(float(totals.total_energy), 3),
+        'total_cost': round(float(totals.total_cost), 2),
+        'charts': charts
+    }
+    if solar and not totals.hourly.empty:
+        options = dict(solar)
+        try:
+            report['solar'] = evaluate_solar(totals, options.pop('sizes'), **options).round(3).to_dict(orient='records')
+        except ValueError as e:
+            report['solar_error'] = str(e)
+    return report
+
+
+def write_reports(reports, output_dir, formats=('png',), workers=None, chunksize=CHUNK_SIZE, use_cache=True, solar=None):
+    """Render every report on a process pool and write summary.json; return the summary"""
+    os.makedirs(output_dir, exist_ok=True)
+    count = len(reports)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(
+            render_report, [name for name, _ in reports], [paths for _, paths in reports],
+            [output_dir] * count, [tuple(formats)] * count, [chunksize] * count, [use_cache] * count, [solar] * count
+        ))
+    summary = {'generated_at': datetime.now(timezone.utc).isoformat(), 'reports': results}
+    with open(os.path.join(output_dir, 'summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def solar_sizes(args):
+    """Return the system sizes in kW requested on the command line"""
+    sizes = list(args.solar_kw or [])
+    if args.solar_sweep:
+        low, high, count = args.solar_sweep
+        sizes.extend(np.linspace(low, high, int(count)))
+    return sizes
+
+
+def solar_options(args):
+    """Return the keyword arguments of evaluate_solar given on the command line"""
+    return {'generation_file': args.generation, 'generation_kw': args.generation_kw, 'export_rate': args.export_rate,
+            'latitude': args.latitude, 'longitude': args.longitude}
+
+
+def evaluate_solar(totals, sizes, generation_file=None, generation_kw=1.0, export_rate=None,
+                   latitude=net_metering.LATITUDE, longitude=net_metering.LONGITUDE):
+    """Net the hourly consumption and cost of a summary against solar systems of each size.
+
+    Only hours with data are netted, so gaps in the exports earn no export
+    credit. Raises ValueError for exports with intervals longer than an hour.
+    """
+    net_metering.check_interval(totals.longest_interval)
+    hourly = totals.hourly.sort_index()
+    if generation_file:
+        profile = net_metering.load_generation_profile(generation_file, generation_kw)
+        generation = net_metering.align_profile(profile, hourly.index)
+    else:
+        generation = net_metering.clear_sky_generation(hourly.index, latitude, longitude)
+    return net_metering.evaluate_systems(hourly['consumption'].to_numpy(), hourly['provided_cost'].to_numpy(),
+                                         generation, sizes, export_rate, interval=totals.longest_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize and plot hourly energy exports')
+    parser.add_argument('inputs', nargs='*', default=['energy1.dat'],
+                        help='.dat files, directories or glob patterns (default: energy1.dat)')
+    parser.add_argument('--workers', type=int, default=None, help='Processes used to read files (default: CPU count)')
+    parser.add_argument('--chunksize', type=int, default=CHUNK_SIZE, help='Rows parsed at a time per file')
+    parser.add_argument('--no-cache', action='store_true', help='Parse the text exports without reading or writing sidecars')
+    parser.add_argument('--report', metavar='DIR',
+                        help='Write charts for each file (or each directory given) to DIR without opening windows')
+    parser.add_argument('--formats', nargs='+', default=['png'], choices=['png', 'svg'], help='Chart formats in report mode')
+    parser.add_argument('--solar-kw', type=float, nargs='+',
+                        help=f'Solar system sizes in kW to net against the hourly consumption (default: {DEFAULT_SOLAR_KW})')
+    parser.add_argument('--solar-sweep', type=float, nargs=3, metavar=('MIN', 'MAX', 'COUNT'),
+                        help='Evaluate COUNT evenly spaced system sizes from MIN to MAX kW')
+    parser.add_argument('--generation', metavar='FILE',
+                        help='Hourly generation file with start_time and generation (kWh) columns instead of the clear-sky model')
+    parser.add_argument('--generation-kw', type=float, default=1.0, help='System size in kW the generation file was produced for')
+    parser.add_argument('--export-rate', type=float,
+                        help='Credit per exported kWh (default: the retail rate of the hour, as under net metering)')
+    parser.add_argument('--latitude', type=float, default=net_metering.LATITUDE, help='Latitude for the clear-sky model')
+    parser.add_argument('--longitude', type=float, default=net_metering.LONGITUDE, help='Longitude for the clear-sky model')
+    args = parser.parse_args()
+
+    if args.report:
+        matplotlib.use('Agg')
+        reports = plan_reports(args.inputs)
+        if not reports:
+            parser.error(f"No input files match {' '.join(args.inputs)}")
+        sizes = solar_sizes(args)
+        summary = write_reports(reports, args.report, formats=args.formats, workers=args.workers,
+                                chunksize=args.chunksize, use_cache=not args.no_cache,
+                                solar=dict(solar_options(args), sizes=sizes) if sizes else None)
+        print(f"Wrote {len(summary['reports'])} reports to {args.report}")
+        return
+
+    paths = find_inputs(args.inputs)
+    if not paths:
+        parser.error(f"No input files match {' '.join(args.inputs)}")
+    totals = summarize_files(paths, workers=args.workers, chunksize=args.chunksize, use_cache=not args.no_cache)
+    print(f"Read {totals.rows} intervals from {len(paths)} files")
+
+    # Calculate the total energy consumed and the total cost
+    total_energy_consumed = totals.total_energy
+    total_cost = totals.total_cost
+    print(f"Original Total Energy Consumed: {total_energy_consumed} kWh")
+    print(f"Original Total Cost: ${total_cost:.2f}")
+
+    # Net the hourly consumption against each solar system size
+    try:
+        solar = evaluate_solar(totals, solar_sizes(args) or [DEFAULT_SOLAR_KW], **solar_options(args))
+        print("Solar net metering by system size:")
+        print(solar.to_string(index=False, float_format=lambda value: f"{value:.2f}"))
+    except ValueError as e:
+        print(f"Skipping solar net metering: {e}")
+
+    # Plot the daily, weekly and monthly consumption and show the charts together
+    for chart in CHARTS:
+        get_renderer().draw(chart, totals.resample(chart['freq'])).savefig(f"{chart['name']}.png")
+    plt.show()
+
+
+if __name__ == '__main__':
+    main()
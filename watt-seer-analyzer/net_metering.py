@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+# Defaults for the parametric model: Portland, OR, where the exports come from
+LATITUDE = 45.52
+LONGITUDE = -122.68
+PERFORMANCE_RATIO = 0.8
+CLEARNESS = 0.75
+
+# Longest interval that can be netted hour by hour; daily totals say nothing about when the energy was used
+MAX_INTERVAL = pd.Timedelta(hours=1)
+
+# Scenarios evaluated per block, so a sweep over hundreds of sizes stays within a few arrays of this many rows
+BLOCK_SIZE = 64
+
+
+def clear_sky_generation(hours, latitude=LATITUDE, longitude=LONGITUDE,
+                         performance_ratio=PERFORMANCE_RATIO, clearness=CLEARNESS):
+    """Estimate the AC output in kWh of a 1 kW system for each UTC hour.
+
+    The sun position is taken at the middle of each hour. Irradiance
+    follows the Meinel clear-sky model on a horizontal panel. It is scaled by
+    clearness for average cloud cover and by performance_ratio for
+    inverter, wiring and temperature losses.
+    """
+    hours = pd.DatetimeIndex(hours)
+    day = hours.dayofyear.to_numpy(dtype=np.float64)
+    utc_hour = hours.hour.to_numpy(dtype=np.float64) + hours.minute.to_numpy(dtype=np.float64) / 60 + 0.5
+    b = 2 * np.pi * (day - 81) / 364
+    equation_of_time = 9.87 * np.sin(2 * b) - 7.53 * np.cos(b) - 1.5 * np.sin(b)
+    solar_hour = utc_hour + longitude / 15 + equation_of_time / 60
+    declination = np.radians(23.45) * np.sin(2 * np.pi * (284 + day) / 365)
+    hour_angle = np.radians(15 * (solar_hour - 12))
+    lat = np.radians(latitude)
+    cos_zenith = np.sin(lat) * np.sin(declination) + np.cos(lat) * np.cos(declination) * np.cos(hour_angle)
+    up = cos_zenith > 0.01
+    air_mass = np.where(up, 1 / np.where(up, cos_zenith, 1), np.inf)
+    irradiance = np.where(up, 1.1 * 1.353 * 0.7 ** (air_mass ** 0.678) * cos_zenith, 0.0)
+    return irradiance * clearness * performance_ratio
+
+
+def load_generation_profile(file_path, system_kw=1.0):
+    """Read an hourly generation file and return kWh per kW of capacity indexed by naive UTC hour.
+
+    The file is delimited text with start_time and generation (kWh)
+    columns. Timestamps with a UTC offset are converted to UTC, and those
+    without one are taken as UTC.
+    """
+    profile = pd.read_csv(file_path, sep=None, engine='python', usecols=['start_time', 'generation'],
+                          dtype={'start_time': str, 'generation': np.float64})
+    times = pd.to_datetime(profile['start_time'], utc=True, format='mixed').dt.tz_convert(None)
+    return profile['generation'].groupby(times.dt.floor('h').to_numpy()).sum() / system_kw
+
+
+def align_profile(profile, hours):
+    """Return a profile's values for the given hours.
+
+    Hours the profile covers are taken as is. The rest, such as a typical
+    year's profile applied to real dates, are matched by month, day and
+    hour. Leap days missing from the profile reuse February 28.
+    """
+    hours = pd.DatetimeIndex(hours)
+    values = profile.reindex(hours).to_numpy(dtype=np.float64, copy=True)
+    missing = np.isnan(values)
+    if missing.any():
+        index = pd.DatetimeIndex(profile.index)
+        slots = _hour_of_leap_year(index)
+        by_slot = np.full(366 * 24, np.nan)
+        sums = np.bincount(slots, weights=profile.to_numpy(dtype=np.float64), minlength=366 * 24)
+        counts = np.bincount(slots, minlength=366 * 24)
+        np.divide(sums, counts, out=by_slot, where=counts > 0)
+        by_slot = by_slot.reshape(366, 24)
+        leap_day = 31 + 28
+        if np.isnan(by_slot[leap_day]).all():
+            by_slot[leap_day] = by_slot[leap_day - 1]
+        values[missing] = by_slot.ravel()[_hour_of_leap_year(hours[missing])]
+    return np.nan_to_num(values)
+
+
+def _hour_of_leap_year(hours):
+    """Index hours into a 366-day year so a date maps to the same slot in every year"""
+    month_start = np.array([0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335])
+    day = month_start[hours.month.to_numpy() - 1] + hours.day.to_numpy() - 1
+    return day * 24 + hours.hour.to_numpy()
+
+
+def hourly_rates(consumption, cost):
+    """Return the retail price per kWh of each hour, using the average price for hours without consumption"""
+    consumption = np.asarray(consumption, dtype=np.float64)
+    cost = np.asarray(cost, dtype=np.float64)
+    average = np.nansum(cost) / np.nansum(consumption) if np.nansum(consumption) else 0.0
+    rates = np.full(consumption.shape, average)
+    np.divide(cost, consumption, out=rates, where=(consumption > 0) & ~np.isnan(cost))
+    return rates
+
+
+def net_meter(consumption, generation, import_rate, export_rate=None):
+    """Compute per-hour import, export and credit for a (scenarios x hours) generation array.
+
+    export_rate is the credit per exported kWh: None credits exports at
+    the hour's retail rate (1:1 net metering), a scalar or per-hour array
+    sets a net-billing rate. Returns a dict of arrays shaped like
+    generation.
+    """
+    net = np.asarray(consumption, dtype=np.float64) - generation
+    imported = np.maximum(net, 0.0)
+    exported = np.maximum(-net, 0.0)
+    credit = exported * (import_rate if export_rate is None else export_rate)
+    return {'import': imported, 'export': exported, 'import_cost': imported * import_rate, 'credit': credit}
+
+
+def check_interval(interval):
+    """Raise ValueError if intervals of the given length cannot be netted hour by hour"""
+    if interval is not None and pd.notna(interval) and pd.Timedelta(interval) > MAX_INTERVAL:
+        raise ValueError(f"Net metering needs hourly or shorter intervals, got intervals of {pd.Timedelta(interval)}")
+
+
+def evaluate_systems(consumption, cost, generation_per_kw, sizes_kw, export_rate=None, block_size=BLOCK_SIZE,
+                     interval=None):
+    """Evaluate solar systems of each size against aligned hourly consumption and cost.
+
+    Hours whose consumption is NaN have no data and are left out rather
+    than netted as zero use, which would credit their whole generation as
+    export. interval is the longest interval the hours were summed from;
+    longer than MAX_INTERVAL raises ValueError. Scenarios are evaluated in
+    blocks of block_size rows broadcast against every hour. Returns one
+    row per size with annual generation, import, export, self-consumed
+    energy, import cost, export credit, net cost and savings against the
+    original cost.
+    """
+    check_interval(interval)
+    consumption = np.asarray(consumption, dtype=np.float64)
+    measured = ~np.isnan(consumption)
+    consumption = consumption[measured]
+    cost = np.asarray(cost, dtype=np.float64)[measured]
+    generation_per_kw = np.asarray(generation_per_kw, dtype=np.float64)[measured]
+    if export_rate is not None and np.ndim(export_rate):
+        export_rate = np.asarray(export_rate, dtype=np.float64)[measured]
+    sizes_kw = np.atleast_1d(np.asarray(sizes_kw, dtype=np.float64))
+    import_rate = hourly_rates(consumption, cost)
+    rows = []
+    for start in range(0, len(sizes_kw), block_size):
+        sizes = sizes_kw[start:start + block_size]
+        generation = sizes[:, None] * generation_per_kw[None, :]
+        flows = net_meter(consumption, generation, import_rate, export_rate)
+        rows.append(np.column_stack([
+            sizes,
+            generation.sum(axis=1),
+            flows['import'].sum(axis=1),
+            flows['export'].sum(axis=1),
+            flows['import_cost'].sum(axis=1),
+            flows['credit'].sum(axis=1),
+        ]))
+    result = pd.DataFrame(np.vstack(rows), columns=[
+        'system_kw', 'generation_kWh', 'import_kWh', 'export_kWh', 'import_cost', 'export_credit'
+    ])
+    result['self_consumed_kWh'] = result['generation_kWh'] - result['export_kWh']
+    result['net_cost'] = result['import_cost'] - result['export_credit']
+    result['savings'] = float(np.nansum(cost)) - result['net_cost']
+    return result
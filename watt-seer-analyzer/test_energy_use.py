@@ -0,0 +1,84 @@
+import importlib.util
+import json
+import os
+import sys
+import pandas as pd
+
+spec = importlib.util.spec_from_file_location(
+    'energy_use', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'energy-use.py'))
+energy_use = importlib.util.module_from_spec(spec)
+# Registered so worker processes can unpickle the module's functions
+sys.modules['energy_use'] = energy_use
+spec.loader.exec_module(energy_use)
+
+
+def write_export(path, start, hours, consumption=1.0, cost=0.2):
+    """Write an hourly tab-delimited export like the opower ones"""
+    start_times = pd.date_range(start, periods=hours, freq='h', tz='US/Pacific')
+    pd.DataFrame({
+        'start_time': start_times.strftime('%Y-%m-%d %H:%M:%S%z'),
+        'end_time': (start_times + pd.Timedelta(hours=1)).strftime('%Y-%m-%d %H:%M:%S%z'),
+        'consumption': consumption,
+        'provided_cost': cost
+    }).to_csv(path, sep='\t', index=False)
+    return str(path)
+
+
+def test_reports_read_each_file_once(tmp_path, monkeypatch):
+    """Test that a directory given with its own files is one report named after the directory"""
+    household = tmp_path / 'household'
+    household.mkdir()
+    for name in ('a.dat', 'b.dat'):
+        (household / name).write_text('')
+    monkeypatch.chdir(household)
+    reports = energy_use.plan_reports(['.', 'a.dat', '*.dat', str(household)])
+    assert reports == [('household', ['./a.dat', './b.dat'])]
+
+
+def test_write_reports_renders_charts_and_summary(tmp_path):
+    """Test that every report gets its charts and an entry in summary.json"""
+    for household, hours in (('north', 48), ('south', 24 * 10)):
+        (tmp_path / household).mkdir()
+        write_export(tmp_path / household / 'energy.dat', '2024-06-01', hours)
+    output_dir = tmp_path / 'reports'
+    reports = energy_use.plan_reports([str(tmp_path / 'north'), str(tmp_path / 'south')])
+    summary = energy_use.write_reports(reports, str(output_dir), workers=1, solar={'sizes': [5.0]})
+
+    with open(output_dir / 'summary.json') as f:
+        assert json.load(f) == summary
+    assert [report['name'] for report in summary['reports']] == ['north', 'south']
+    south = summary['reports'][1]
+    assert south['intervals'] == 240
+    assert south['total_energy_kWh'] == 240.0
+    assert (south['start'], south['end']) == ('2024-06-01', '2024-06-11')
+    assert south['solar'][0]['system_kw'] == 5.0
+    for report in summary['reports']:
+        assert len(report['charts']) == len(energy_use.CHARTS)
+        for chart in report['charts']:
+            with open(output_dir / chart, 'rb') as f:
+                assert f.read(8) == b'\x89PNG\r\n\x1a\n'
+
+
+def test_files_are_streamed_in_chunks_and_merged(tmp_path):
+    """Test that files listed twice are read once and their chunked hourly sums merge into one summary"""
+    first = write_export(tmp_path / 'first.dat', '2024-01-01', 30, consumption=1.0)
+    second = write_export(tmp_path / 'second.dat', '2024-01-02', 30, consumption=2.0)
+    paths = energy_use.find_inputs([first, second, first, str(tmp_path / '*.dat')])
+    assert paths == [first, second]
+
+    totals = energy_use.summarize_files(paths, workers=2, chunksize=7)
+    assert totals.rows == 60
+    assert totals.total_energy == 90.0
+    assert totals.total_cost == 60 * 0.2
+    assert totals.longest_interval == pd.Timedelta(hours=1)
+    # The six hours both files cover are summed
+    hourly = totals.resample('h')
+    assert len(hourly) == 54
+    assert list(hourly.value_counts().sort_index().items()) == [(1.0, 24), (2.0, 24), (3.0, 6)]
+
+    merged = energy_use.EnergyTotals()
+    for path in paths:
+        merged.merge(energy_use.summarize_file(path, chunksize=7, use_cache=False))
+    assert merged.rows == totals.rows
+    pd.testing.assert_frame_equal(merged.hourly.sort_index(), totals.hourly.sort_index())
+    assert energy_use.summarize_files(paths, workers=1).resample('D').tolist() == totals.resample('D').tolist()
@@ -0,0 +1,49 @@
+import importlib.util
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import net_metering
+
+spec = importlib.util.spec_from_file_location(
+    'energy_use', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'energy-use.py'))
+energy_use = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(energy_use)
+
+
+def make_totals(start, periods, freq):
+    """Summarize intervals of one length with 1 kWh and $0.20 each"""
+    start_times = pd.date_range(start, periods=periods, freq=freq)
+    totals = energy_use.EnergyTotals()
+    totals.add(pd.DataFrame({
+        'start_time': start_times,
+        'end_time': start_times + pd.tseries.frequencies.to_offset(freq),
+        'consumption': 1.0,
+        'provided_cost': 0.2
+    }))
+    return totals
+
+
+def test_daily_exports_are_rejected():
+    """Test that daily intervals are not netted as if each day were used in its first hour"""
+    totals = make_totals('2024-06-01', 30, 'D')
+    assert totals.longest_interval == pd.Timedelta(days=1)
+    with pytest.raises(ValueError, match='hourly or shorter'):
+        energy_use.evaluate_solar(totals, [5.0])
+    with pytest.raises(ValueError):
+        net_metering.evaluate_systems(np.ones(30), np.ones(30), np.ones(30), [5.0], interval=pd.Timedelta(days=1))
+
+
+def test_gap_hours_earn_no_export_credit():
+    """Test that hours without data are left out instead of netted as zero consumption"""
+    totals = make_totals('2024-06-01', 24, 'h')
+    totals.merge(make_totals('2024-06-03', 24, 'h'))
+    result = energy_use.evaluate_solar(totals, [5.0])
+    generation = net_metering.clear_sky_generation(totals.hourly.index)
+    assert result['generation_kWh'].iloc[0] == pytest.approx(5.0 * generation.sum())
+    assert result['export_kWh'].iloc[0] == pytest.approx(np.maximum(5.0 * generation - 1.0, 0).sum())
+
+    consumption = np.array([1.0, np.nan, 1.0])
+    masked = net_metering.evaluate_systems(consumption, [0.2, np.nan, 0.2], [0.5, 3.0, 2.0], [1.0])
+    assert masked['export_kWh'].iloc[0] == pytest.approx(1.0)
+    assert masked['generation_kWh'].iloc[0] == pytest.approx(2.5)
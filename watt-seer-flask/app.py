@@ -1,8 +1,19 @@
 import dash
-from dash import html, dcc
+from dash import html, dcc, Patch, no_update
 import plotly.express as px
+import plotly.graph_objects as go
+import plotly.utils
 import data_fetcher
-from flask import Flask, jsonify, request, render_template, redirect, url_for, session
+import views
+import exports
+import fetch_jobs
+import prefetch
+import user_sessions
+import portfolio
+import response_cache
+import downsampling
+import tariffs
+from flask import Flask, Response, jsonify, request, render_template, redirect, url_for, session
 from datetime import datetime, date, timedelta
 import pytz
 import pandas as pd
@@ -12,6 +23,12 @@ import logging
 import argparse
 from functools import wraps
 import os
+import json
+import hashlib
+import hmac
+
+# Warm active sessions' data in the background instead of on dashboard refresh
+PREFETCH_ENABLED = os.environ.get('WATT_SEER_PREFETCH', '1') != '0'
 
 # Define supported utilities
 SUPPORTED_UTILITIES = {
@@ -40,6 +57,11 @@ def login_required(f):
         if 'user' not in session:
             logger.debug('User not in session, redirecting to login')
             return redirect(url_for('login'))
+        if current_credentials() is None:
+            # The server-side session expired or lives in another process
+            logger.debug('Session credentials not found, redirecting to login')
+            end_session()
+            return redirect(url_for('login'))
         logger.debug('User in session, proceeding to dashboard')
         return f(*args, **kwargs)
     return decorated_function
@@ -62,13 +84,17 @@ def login():
                 'password': password,
                 'utility': utility
             }
-            # Try to fetch current month data to validate credentials
-            data_fetcher.get_current_month_data(test_credentials)
+            # Log in to the utility to validate the credentials; the dashboard's
+            # data is loaded while the browser follows the redirect
+            data_fetcher.validate_credentials(test_credentials)
             
-            # If successful, update the CREDENTIALS
-            CREDENTIALS.update(test_credentials)
+            # If successful, keep the credentials server-side for this session only
+            if PREFETCH_ENABLED:
+                prefetch.get_prefetch_scheduler().register(test_credentials)
             
             # Store user info in session
+            user_sessions.SESSIONS.delete(session.get('sid'))
+            session['sid'] = user_sessions.SESSIONS.create(test_credentials)
             session['user'] = username
             session['utility'] = utility
             logger.debug('Login successful, redirecting to dashboard')
@@ -85,9 +111,25 @@ def login():
 @server.route('/logout')
 def logout():
     logger.debug('Logout route accessed')
+    credentials = current_credentials()
+    household = {'utility': session.get('utility'), 'username': session.get('user')}
+    end_session()
+    # Other sessions of the same household keep their prefetching and utility login
+    if household['username'] is not None and not user_sessions.SESSIONS.holds(household):
+        if PREFETCH_ENABLED:
+            prefetch.get_prefetch_scheduler().unregister(household)
+        if credentials is not None:
+            try:
+                data_fetcher.forget_login(credentials)
+            except Exception as e:
+                logger.error(f"Error closing the utility session: {str(e)}")
+    return redirect(url_for('login'))
+
+def end_session():
+    """Forget the current session's credentials and clear its cookie"""
+    user_sessions.SESSIONS.delete(session.pop('sid', None))
     session.pop('user', None)
     session.pop('utility', None)
-    return redirect(url_for('login'))
 
 # Root route redirects to login
 @server.route('/')
@@ -111,22 +153,14 @@ def protect_dash_routes():
         if 'user' not in session:
             logger.debug('Unauthorized access to Dash route, redirecting to login')
             return redirect(url_for('login'))
+        if current_credentials() is None:
+            logger.debug('Session credentials not found for Dash route, redirecting to login')
+            end_session()
+            return redirect(url_for('login'))
 
-# Credentials configuration
-USE_DEV_CREDENTIALS = False  # Set to False before committing to GitHub
-
-# GitHub credentials (safe to commit)
-GITHUB_CREDENTIALS = {
-    'username': 'example@email.com',
-    'password': 'ExamplePass',
-    'utility': 'portlandgeneral'
-}
-
-# Development credentials (DO NOT COMMIT)
-DEV_CREDENTIALS = GITHUB_CREDENTIALS
-
-# Set active credentials
-CREDENTIALS = DEV_CREDENTIALS if USE_DEV_CREDENTIALS else GITHUB_CREDENTIALS
+def current_credentials():
+    """Return the credentials of the logged-in user of the current request, or None"""
+    return user_sessions.SESSIONS.get(session.get('sid'))
 
 # Initialize empty figures
 current_month_figure = px.line(title='Current Month Energy Consumption')
@@ -206,6 +240,32 @@ app.layout = html.Div([
         ]),
     ]),
     
+    # Hourly view over the selected year, downsampled on the server
+    html.Div([
+        html.Div([
+            html.H3("Hourly Energy Consumption (Selected Year)", style={'textAlign': 'center'}),
+            dcc.Graph(id='hourly-figure', figure=px.line(title='Hourly Energy Consumption')),
+        ], style={'padding': '20px'}),
+        
+        html.Div([
+            html.H3("Energy Consumption by Hour of Day (Selected Year)", style={'textAlign': 'center'}),
+            dcc.Graph(id='heatmap-figure', figure=px.imshow([[0]], title='Energy Consumption by Hour of Day')),
+        ], style={'padding': '20px'}),
+    ]),
+    
+    # Fleet view, only in portfolio mode
+    html.Div([
+        html.H3("Fleet Energy Consumption by Utility", style={'textAlign': 'center'}),
+        dcc.Graph(id='fleet-figure', figure=px.bar(title='Fleet Energy Consumption by Utility')),
+    ], style={'padding': '20px'}) if portfolio.is_enabled() else html.Div(),
+    
+    # Rollup version of the last sync and the traces drawn in each figure
+    dcc.Store(id='data-version'),
+    dcc.Store(id='current-month-meta'),
+    dcc.Store(id='yearly-meta'),
+    dcc.Store(id='quarterly-meta'),
+    dcc.Store(id='yearly-total-meta'),
+    
     # Auto-update interval
     dcc.Interval(
         id='interval-component',
@@ -214,236 +274,514 @@ app.layout = html.Div([
     )
 ])
 
+@app.callback(
+    dash.Output('data-version', 'data'),
+    [dash.Input('interval-component', 'n_intervals')],
+    [dash.State('data-version', 'data')]
+)
+def sync_data(n, current_version):
+    credentials = current_credentials()
+    if credentials is None:
+        # The session expired or the server restarted; the user has to log in again
+        raise PreventUpdate
+    
+    try:
+        # Sync year-to-date data once per tick; every figure is read from the rollups.
+        # With prefetching on, the scheduler keeps this range warm.
+        logger.info("Fetching year-to-date data")
+        if PREFETCH_ENABLED:
+            prefetch.get_prefetch_scheduler().register(credentials)
+        yearly_data = data_fetcher.get_current_year_data(credentials, revalidate=not PREFETCH_ENABLED)
+        version = {
+            'user': credentials['username'],
+            'version': data_fetcher.get_rollup(credentials).version,
+            'empty': bool(yearly_data.empty)
+        }
+    except Exception as e:
+        logger.error(f"Error syncing data: {str(e)}")
+        version = {'user': credentials['username'], 'error': str(e)}
+    
+    # Figures only update when a sync changed the rollups
+    if version == current_version:
+        return no_update
+    return version
+
+def resolve_view(data_version, selected_year):
+    """Return the credentials and rollup cube a figure callback reads, or a placeholder title"""
+    credentials = current_credentials()
+    if credentials is None or data_version is None:
+        raise PreventUpdate
+    if 'error' in data_version:
+        return credentials, None, f"Error loading data: {data_version['error']}"
+    if data_version['empty']:
+        return credentials, None, 'No data available'
+    if int(selected_year) != datetime.now(pytz.UTC).year:
+        # Past years are not part of the regular sync; load them on demand
+        start_date, end_date = get_year_dates(int(selected_year))
+        data_fetcher.get_data_by_date_range(start_date, end_date, credentials)
+    return credentials, data_fetcher.get_rollup(credentials), None
+
+# Figures and their traces keyed by figure, view parameters and rollup version
+FIGURE_CACHE = response_cache.ResponseCache(
+    ttl=86400,
+    max_stale=86400,
+    max_entries=int(os.environ.get('WATT_SEER_FIGURE_CACHE_ENTRIES', 512)),
+    max_bytes=int(os.environ.get('WATT_SEER_FIGURE_CACHE_MB', 32)) * 1024 * 1024
+)
+
+def figure_traces(frame, x, y, color='account_name'):
+    """Split a view into [name, x values, y values] per trace in the order plotly express draws them"""
+    if color is None:
+        return [['', [str(value) for value in frame[x]], frame[y].tolist()]]
+    traces = []
+    for name in pd.unique(frame[color]):
+        rows = frame[frame[color] == name]
+        traces.append([str(name), [str(value) for value in rows[x]], rows[y].tolist()])
+    return traces
+
+def trace_digests(traces):
+    """Summarize traces as [name, points, digest of the values] for the browser to send back"""
+    return [
+        [name, len(x), hashlib.sha256(json.dumps([x, y]).encode('utf-8')).hexdigest()[:16]]
+        for name, x, y in traces
+    ]
+
+def plain_figure_json(figure, traces):
+    """Serialize a figure with the plain lists in traces as its trace values.
+
+    plotly>=6 serializes numpy arrays as typed arrays ({'dtype', 'bdata'}),
+    which the Patch operations of update_figure cannot index or extend.
+    """
+    figure = figure.to_plotly_json()
+    for trace, (_, x, y) in zip(figure['data'], traces):
+        trace['x'], trace['y'] = x, y
+    return json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder)
+
+def cached_figure(name, build, view, x, y, key, version, color='account_name'):
+    """Return the cached {'figure', 'traces', 'digests'} of a view at a rollup version, building it on a miss"""
+    cache_key = (name, json.dumps(key), version)
+    entry = FIGURE_CACHE.get(cache_key)
+    if entry is None:
+        frame = view()
+        traces = figure_traces(frame, x, y, color)
+        figure_json = plain_figure_json(build(frame), traces)
+        entry = {'figure': json.loads(figure_json), 'traces': traces, 'digests': trace_digests(traces)}
+        FIGURE_CACHE.put(cache_key, entry, size=len(figure_json))
+    return entry
+
+def figure_patch(old_traces, traces):
+    """Return a Patch turning old_traces into traces, or None if they do not line up"""
+    if [trace[0] for trace in old_traces] != [trace[0] for trace in traces]:
+        return None
+    if not all(new[1][:len(old[1])] == old[1] for old, new in zip(old_traces, traces)):
+        return None
+    patch = Patch()
+    for index, ((_, old_x, old_y), (_, new_x, new_y)) in enumerate(zip(old_traces, traces)):
+        for point, value in enumerate(new_y[:len(old_y)]):
+            if value != old_y[point]:
+                patch['data'][index]['y'][point] = value
+        if len(new_x) > len(old_x):
+            patch['data'][index]['x'].extend(new_x[len(old_x):])
+            patch['data'][index]['y'].extend(new_y[len(old_x):])
+    return patch
+
+def update_figure(name, build, view, x, y, meta, key, version, color='account_name'):
+    """Return a figure and its trace metadata, as a Patch when only values changed or points were appended.
+
+    view() returns the frame drawn; it is only called when FIGURE_CACHE
+    has no figure for (name, key, version). The browser keeps just the
+    rollup version and each trace's name, length and digest. A Patch is
+    computed against the cached traces of the version it last drew, and a
+    full figure is sent when those are no longer cached, the view
+    parameters in key changed or the traces do not line up.
+    """
+    if meta and meta.get('key') == key and meta.get('version') == version:
+        return no_update, no_update
+    entry = cached_figure(name, build, view, x, y, key, version, color)
+    new_meta = {'key': key, 'version': version, 'traces': entry['digests']}
+    if meta and meta.get('key') == key:
+        if meta.get('traces') == entry['digests']:
+            return no_update, new_meta
+        previous = FIGURE_CACHE.get((name, json.dumps(key), meta.get('version')))
+        if previous is not None and previous['digests'] == meta.get('traces'):
+            patch = figure_patch(previous['traces'], entry['traces'])
+            if patch is not None:
+                return patch, new_meta
+    return entry['figure'], new_meta
+
+def daily_figure(daily_totals, username, month_name):
+    """Line chart of daily consumption per account for one month"""
+    current_fig = px.line(
+        daily_totals,
+        x='date',
+        y='consumption',
+        color='account_name',
+        title=f"Daily Energy Consumption for {username} ({month_name})",
+        labels={
+            'date': 'Date',
+            'consumption': 'Energy Consumption (kWh)',
+            'account_name': 'Account'
+        }
+    )
+    
+    current_fig.update_traces(
+        mode='lines+markers',
+        line=dict(width=2),
+        marker=dict(size=6)
+    )
+    
+    # Set custom colors and styles
+    for trace in current_fig.data:
+        if trace.name == 'Total':
+            trace.line.dash = 'dash'
+            trace.line.color = 'green'
+            trace.marker.color = 'green'
+        elif '7277230355' in trace.name:
+            trace.line.color = 'blue'
+            trace.marker.color = 'blue'
+        elif '0858033726' in trace.name:
+            trace.line.color = 'red'
+            trace.marker.color = 'red'
+    
+    current_fig.update_layout(
+        xaxis_title="Date",
+        yaxis_title="Energy Consumption (kWh)",
+        hovermode='x unified',
+        showlegend=True,
+        legend_title="Account",
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="right",
+            x=1
+        )
+    )
+    return current_fig
+
+def quarterly_figure(quarterly_totals, username, year):
+    """Grouped bar chart of quarterly consumption per account"""
+    quarterly_fig = px.bar(
+        quarterly_totals,
+        x='quarter',
+        y='consumption',
+        color='account_name',
+        title=f'Quarterly Energy Consumption for {username} ({year})',
+        labels={
+            'quarter': 'Quarter',
+            'consumption': 'Total Energy Consumption (kWh)',
+            'account_name': 'Account'
+        },
+        barmode='group'
+    )
+    
+    quarterly_fig.update_layout(
+        xaxis_title="Quarter",
+        yaxis_title="Total Energy Consumption (kWh)",
+        hovermode='x unified',
+        showlegend=True,
+        legend_title="Account"
+    )
+    return quarterly_fig
+
+def monthly_figure(monthly_totals, username, year):
+    """Grouped bar chart of monthly consumption per account"""
+    yearly_fig = px.bar(
+        monthly_totals,
+        x='month',
+        y='consumption',
+        color='account_name',
+        title=f'Monthly Energy Consumption for {username} ({year})',
+        labels={
+            'month': 'Month',
+            'consumption': 'Total Energy Consumption (kWh)',
+            'account_name': 'Account'
+        },
+        barmode='group'
+    )
+    
+    yearly_fig.update_layout(
+        xaxis_title="Month",
+        yaxis_title="Total Energy Consumption (kWh)",
+        hovermode='x unified',
+        showlegend=True,
+        legend_title="Account"
+    )
+    return yearly_fig
+
+def account_figure(total_by_account, username, year):
+    """Bar chart of the year's total consumption per account"""
+    total_fig = px.bar(
+        total_by_account,
+        x='account_name',
+        y='consumption',
+        title=f'Total Energy Consumption by Account for {username} ({year})',
+        labels={
+            'account_name': 'Account',
+            'consumption': 'Total Energy Consumption (kWh)'
+        }
+    )
+    
+    total_fig.update_layout(
+        xaxis_title="Account",
+        yaxis_title="Total Energy Consumption (kWh)",
+        hovermode='x unified',
+        showlegend=False
+    )
+    return total_fig
+
 @app.callback(
     [dash.Output('current-month-figure', 'figure'),
-     dash.Output('yearly-figure', 'figure'),
-     dash.Output('quarterly-figure', 'figure'),
-     dash.Output('yearly-total-figure', 'figure'),
+     dash.Output('current-month-meta', 'data'),
      dash.Output('daily-view-title', 'children')],
-    [dash.Input('interval-component', 'n_intervals'),
+    [dash.Input('data-version', 'data'),
      dash.Input('year-selector', 'value'),
-     dash.Input('month-selector', 'value')]
+     dash.Input('month-selector', 'value')],
+    [dash.State('current-month-meta', 'data')]
 )
-def update_graphs(n, selected_year, selected_month):
+def update_daily_figure(data_version, selected_year, selected_month, meta):
     try:
-        figures = []
-        selected_year = int(selected_year)
-        
-        # 1. Get current month data
-        logger.info("Fetching current month data")
-        current_month_data = data_fetcher.get_current_month_data(CREDENTIALS)
-        
-        if current_month_data.empty:
-            empty_figures = [
-                px.line(title='No data available'),
-                px.bar(title='No data available'),
-                px.bar(title='No data available'),
-                px.bar(title='No data available'),
-                "No data available"
-            ]
-            return empty_figures
-            
-        # Log the data structure for debugging
-        logger.debug(f"Data types of columns: {current_month_data.dtypes}")
-        logger.debug(f"First few rows of start_time: {current_month_data['start_time'].head()}")
-        
-        # Parse datetime with explicit timezone handling
-        current_month_data['start_time'] = pd.to_datetime(current_month_data['start_time'], utc=True)
-        
-        # Add common fields used across different views
-        # Convert to UTC for consistent date handling
-        current_month_data['date'] = current_month_data['start_time'].dt.date
-        current_month_data['month'] = current_month_data['start_time'].dt.strftime('%B %Y')
-        current_month_data['quarter'] = current_month_data['start_time'].dt.quarter.map(lambda x: f'Q{x}')
-        
-        # 1. Daily view for current month
-        daily_totals = current_month_data.groupby(['date', 'account_name'])['consumption'].sum().reset_index()
-        
-        # Calculate daily totals
-        daily_combined = daily_totals.groupby('date')['consumption'].sum().reset_index()
-        daily_combined['account_name'] = 'Total'
-        
-        # Combine individual accounts with total
-        daily_totals = pd.concat([daily_totals, daily_combined], ignore_index=True)
-        daily_totals = daily_totals.sort_values(['date', 'account_name'])
-        
-        current_month_name = datetime.now().strftime('%B %Y')
-        current_fig = px.line(
-            daily_totals,
-            x='date',
-            y='consumption',
-            color='account_name',
-            title=f"Daily Energy Consumption for {CREDENTIALS['username']} ({current_month_name})",
-            labels={
-                'date': 'Date',
-                'consumption': 'Energy Consumption (kWh)',
-                'account_name': 'Account'
-            }
-        )
+        credentials, cube, placeholder = resolve_view(data_version, selected_year)
+        if placeholder:
+            return px.line(title=placeholder), None, placeholder
         
-        current_fig.update_traces(
-            mode='lines+markers',
-            line=dict(width=2),
-            marker=dict(size=6)
-        )
-        
-        # Set custom colors and styles
-        for trace in current_fig.data:
-            if trace.name == 'Total':
-                trace.line.dash = 'dash'
-                trace.line.color = 'green'
-                trace.marker.color = 'green'
-            elif '7277230355' in trace.name:
-                trace.line.color = 'blue'
-                trace.marker.color = 'blue'
-            elif '0858033726' in trace.name:
-                trace.line.color = 'red'
-                trace.marker.color = 'red'
+        month_start = pd.Timestamp(f'{selected_month} 1 {int(selected_year)}')
+        month_name = month_start.strftime('%B %Y')
+        key = [credentials['username'], month_name]
+        figure, meta = update_figure(
+            'daily', lambda frame: daily_figure(frame, credentials['username'], month_name),
+            lambda: views.daily_totals(cube, month_start), 'date', 'consumption', meta, key, cube.version)
+        return figure, meta, f"Daily Energy Consumption for {credentials['username']} ({month_name})"
+    except PreventUpdate:
+        raise
+    except Exception as e:
+        logger.error(f"Error updating daily figure: {str(e)}")
+        return px.line(title=f'Error loading data: {str(e)}'), None, "Error loading data"
+
+@app.callback(
+    [dash.Output('yearly-figure', 'figure'),
+     dash.Output('yearly-meta', 'data')],
+    [dash.Input('data-version', 'data'),
+     dash.Input('year-selector', 'value')],
+    [dash.State('yearly-meta', 'data')]
+)
+def update_quarterly_figure(data_version, selected_year, meta):
+    return update_year_figure(data_version, selected_year, meta, views.quarterly_totals, quarterly_figure, 'quarter')
+
+@app.callback(
+    [dash.Output('quarterly-figure', 'figure'),
+     dash.Output('quarterly-meta', 'data')],
+    [dash.Input('data-version', 'data'),
+     dash.Input('year-selector', 'value')],
+    [dash.State('quarterly-meta', 'data')]
+)
+def update_monthly_figure(data_version, selected_year, meta):
+    return update_year_figure(data_version, selected_year, meta, views.monthly_totals, monthly_figure, 'month')
+
+@app.callback(
+    [dash.Output('yearly-total-figure', 'figure'),
+     dash.Output('yearly-total-meta', 'data')],
+    [dash.Input('data-version', 'data'),
+     dash.Input('year-selector', 'value')],
+    [dash.State('yearly-total-meta', 'data')]
+)
+def update_account_figure(data_version, selected_year, meta):
+    return update_year_figure(data_version, selected_year, meta, views.account_totals, account_figure, 'account_name', color=None)
+
+def update_year_figure(data_version, selected_year, meta, view, build, x, color='account_name'):
+    """Build or patch one of the bar charts of a year"""
+    try:
+        credentials, cube, placeholder = resolve_view(data_version, selected_year)
+        if placeholder:
+            return px.bar(title=placeholder), None
         
-        current_fig.update_layout(
-            xaxis_title="Date",
-            yaxis_title="Energy Consumption (kWh)",
-            hovermode='x unified',
-            showlegend=True,
-            legend_title="Account",
-            legend=dict(
-                orientation="h",
-                yanchor="bottom",
-                y=1.02,
-                xanchor="right",
-                x=1
-            )
+        year = int(selected_year)
+        return update_figure(
+            build.__name__, lambda frame: build(frame, credentials['username'], year),
+            lambda: view(cube, pd.Timestamp(year, 1, 1)), x, 'consumption', meta,
+            [credentials['username'], year], cube.version, color=color)
+    except PreventUpdate:
+        raise
+    except Exception as e:
+        logger.error(f"Error updating {build.__name__}: {str(e)}")
+        return px.bar(title=f'Error loading data: {str(e)}'), None
+
+# Points per trace sent for the hourly view, and how they are picked
+HOURLY_POINTS = int(os.environ.get('WATT_SEER_HOURLY_POINTS', 2000))
+HOURLY_DOWNSAMPLING = os.environ.get('WATT_SEER_HOURLY_DOWNSAMPLING', 'lttb')
+
+def zoom_range(relayout, year):
+    """Return the (start, end) x-axis range of a relayout event inside a year, or None for the whole year"""
+    if not relayout or relayout.get('xaxis.autorange'):
+        return None
+    if 'xaxis.range[0]' in relayout:
+        bounds = relayout['xaxis.range[0]'], relayout['xaxis.range[1]']
+    elif 'xaxis.range' in relayout:
+        bounds = relayout['xaxis.range']
+    else:
+        return None
+    start, end = (pd.Timestamp(bound) for bound in bounds)
+    year_start, year_end = pd.Timestamp(year, 1, 1), pd.Timestamp(year + 1, 1, 1)
+    if end <= year_start or start >= year_end:
+        return None
+    return max(start, year_start), min(end, year_end)
+
+def hourly_traces(cube, year, x_range=None):
+    """Return [name, x, y] per account of the year for the hourly view, downsampled to HOURLY_POINTS.
+
+    Every account with data in the year gets a trace, empty if it has no
+    hours in x_range, so a zoom lines up with the traces already drawn.
+    """
+    year_start, year_end = pd.Timestamp(year, 1, 1), pd.Timestamp(year + 1, 1, 1)
+    start, end = x_range or (year_start, year_end)
+    names = sorted(set(cube.frame('year', start=year_start, end=year_end)['account_name']))
+    hourly = views.hourly_series(cube, start, end)
+    rows_by_name = dict(tuple(hourly.groupby('account_name', sort=True)))
+    traces = []
+    for name in names:
+        rows = rows_by_name.get(name)
+        if rows is None:
+            traces.append([name, [], []])
+            continue
+        x, y = downsampling.downsample(
+            rows['period'].to_numpy(), rows['consumption'].to_numpy(), HOURLY_POINTS, HOURLY_DOWNSAMPLING)
+        traces.append([name, x, y])
+    return traces
+
+def hourly_figure(traces, username, year):
+    """WebGL line chart of hourly consumption per account"""
+    fig = go.Figure([
+        go.Scattergl(x=x, y=y, name=name, mode='lines',
+                     line=dict(dash='dash', color='green') if name == views.TOTAL_ACCOUNT else None)
+        for name, x, y in traces
+    ])
+    fig.update_layout(
+        title=f'Hourly Energy Consumption for {username} ({year})',
+        xaxis_title="Time (UTC)",
+        yaxis_title="Energy Consumption (kWh)",
+        hovermode='x unified',
+        legend_title="Account",
+        # Keep the user's zoom when the data is refreshed
+        uirevision=f'{username}-{year}'
+    )
+    return fig
+
+@app.callback(
+    dash.Output('hourly-figure', 'figure'),
+    [dash.Input('data-version', 'data'),
+     dash.Input('year-selector', 'value')],
+    [dash.State('hourly-figure', 'relayoutData')]
+)
+def update_hourly_figure(data_version, selected_year, relayout):
+    try:
+        credentials, cube, placeholder = resolve_view(data_version, selected_year)
+        if placeholder:
+            return px.line(title=placeholder)
+        year = int(selected_year)
+        traces = hourly_traces(cube, year, zoom_range(relayout, year))
+        return hourly_figure(traces, credentials['username'], year)
+    except PreventUpdate:
+        raise
+    except Exception as e:
+        logger.error(f"Error updating hourly figure: {str(e)}")
+        return px.line(title=f'Error loading data: {str(e)}')
+
+@app.callback(
+    dash.Output('hourly-figure', 'figure', allow_duplicate=True),
+    [dash.Input('hourly-figure', 'relayoutData')],
+    [dash.State('data-version', 'data'),
+     dash.State('year-selector', 'value')],
+    prevent_initial_call=True
+)
+def zoom_hourly_figure(relayout, data_version, selected_year):
+    """Re-sample the visible range at full resolution when the user zooms or pans"""
+    if not relayout or not any(key.startswith('xaxis.') for key in relayout):
+        raise PreventUpdate
+    credentials, cube, placeholder = resolve_view(data_version, selected_year)
+    if placeholder:
+        raise PreventUpdate
+    year = int(selected_year)
+    patch = Patch()
+    for index, (_, x, y) in enumerate(hourly_traces(cube, year, zoom_range(relayout, year))):
+        patch['data'][index]['x'] = x
+        patch['data'][index]['y'] = y
+    return patch
+
+@app.callback(
+    dash.Output('heatmap-figure', 'figure'),
+    [dash.Input('data-version', 'data'),
+     dash.Input('year-selector', 'value')]
+)
+def update_heatmap_figure(data_version, selected_year):
+    try:
+        credentials, cube, placeholder = resolve_view(data_version, selected_year)
+        if placeholder:
+            return px.imshow([[0]], title=placeholder)
+        year = int(selected_year)
+        matrix, days = views.hour_day_matrix(cube, pd.Timestamp(year, 1, 1))
+        fig = go.Figure(go.Heatmap(
+            z=matrix,
+            x=days,
+            y=list(range(24)),
+            colorscale='Viridis',
+            colorbar=dict(title='kWh'),
+            hovertemplate='%{x|%b %d}, %{y}:00 UTC<br>%{z:.2f} kWh<extra></extra>'
+        ))
+        fig.update_layout(
+            title=f'Energy Consumption by Hour of Day for {credentials["username"]} ({year})',
+            xaxis_title="Day",
+            yaxis_title="Hour of Day (UTC)"
         )
-        
-        figures.append(current_fig)
-        
-        # 2. Get quarterly data
-        logger.info("Fetching quarterly data")
-        quarterly_data = data_fetcher.get_quarterly_data(CREDENTIALS)
-        
-        if not quarterly_data.empty:
-            # Parse datetime with explicit timezone handling
-            quarterly_data['start_time'] = pd.to_datetime(quarterly_data['start_time'], utc=True)
-            quarterly_totals = quarterly_data.groupby(['quarter', 'account_name'])['consumption'].sum().reset_index()
-            quarterly_combined = quarterly_totals.groupby('quarter')['consumption'].sum().reset_index()
-            quarterly_combined['account_name'] = 'Total'
-            quarterly_totals = pd.concat([quarterly_totals, quarterly_combined], ignore_index=True)
-            
-            quarterly_fig = px.bar(
-                quarterly_totals,
-                x='quarter',
-                y='consumption',
-                color='account_name',
-                title=f'Quarterly Energy Consumption for {CREDENTIALS["username"]} ({datetime.now().year})',
-                labels={
-                    'quarter': 'Quarter',
-                    'consumption': 'Total Energy Consumption (kWh)',
-                    'account_name': 'Account'
-                },
-                barmode='group'
-            )
-            
-            quarterly_fig.update_layout(
-                xaxis_title="Quarter",
-                yaxis_title="Total Energy Consumption (kWh)",
-                hovermode='x unified',
-                showlegend=True,
-                legend_title="Account"
-            )
-        else:
-            quarterly_fig = px.bar(title='No quarterly data available')
-        
-        figures.append(quarterly_fig)
-        
-        # 3. Get yearly data
-        logger.info("Fetching yearly data")
-        yearly_data = data_fetcher.get_current_year_data(CREDENTIALS)
-        
-        if not yearly_data.empty:
-            # Parse datetime with explicit timezone handling
-            yearly_data['start_time'] = pd.to_datetime(yearly_data['start_time'], utc=True)
-            yearly_data['month'] = yearly_data['start_time'].dt.strftime('%B %Y')
-            yearly_totals = yearly_data.groupby(['month', 'account_name'])['consumption'].sum().reset_index()
-            yearly_combined = yearly_totals.groupby('month')['consumption'].sum().reset_index()
-            yearly_combined['account_name'] = 'Total'
-            yearly_totals = pd.concat([yearly_totals, yearly_combined], ignore_index=True)
-            
-            # Sort months chronologically
-            yearly_totals['sort_date'] = pd.to_datetime(yearly_totals['month'], format='%B %Y')
-            yearly_totals = yearly_totals.sort_values(['sort_date', 'account_name'])
-            
-            yearly_fig = px.bar(
-                yearly_totals,
-                x='month',
-                y='consumption',
-                color='account_name',
-                title=f'Monthly Energy Consumption for {CREDENTIALS["username"]} ({datetime.now().year})',
-                labels={
-                    'month': 'Month',
-                    'consumption': 'Total Energy Consumption (kWh)',
-                    'account_name': 'Account'
-                },
-                barmode='group'
-            )
-            
-            yearly_fig.update_layout(
-                xaxis_title="Month",
-                yaxis_title="Total Energy Consumption (kWh)",
-                hovermode='x unified',
-                showlegend=True,
-                legend_title="Account"
-            )
-        else:
-            yearly_fig = px.bar(title='No yearly data available')
-        
-        figures.append(yearly_fig)
-        
-        # 4. Total consumption by account
-        if not yearly_data.empty:
-            total_by_account = yearly_data.groupby('account_name')['consumption'].sum().reset_index()
-            total_combined = pd.DataFrame([{
-                'account_name': 'Total',
-                'consumption': total_by_account['consumption'].sum()
-            }])
-            total_by_account = pd.concat([total_by_account, total_combined], ignore_index=True)
-            
-            total_fig = px.bar(
-                total_by_account,
-                x='account_name',
-                y='consumption',
-                title=f'Total Energy Consumption by Account for {CREDENTIALS["username"]} ({datetime.now().year})',
-                labels={
-                    'account_name': 'Account',
-                    'consumption': 'Total Energy Consumption (kWh)'
-                }
-            )
-            
-            total_fig.update_layout(
-                xaxis_title="Account",
-                yaxis_title="Total Energy Consumption (kWh)",
-                hovermode='x unified',
-                showlegend=False
-            )
-        else:
-            total_fig = px.bar(title='No total consumption data available')
-        
-        figures.append(total_fig)
-        
-        daily_view_title = f"Daily Energy Consumption for {CREDENTIALS['username']} ({current_month_name})"
-        return figures + [daily_view_title]
-            
+        return fig
+    except PreventUpdate:
+        raise
     except Exception as e:
-        logger.error(f"Error updating graphs: {str(e)}")
-        logger.error(f"Error type: {type(e)}")
-        import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
-        return [
-            px.line(title=f'Error loading data: {str(e)}'),
-            px.bar(title=f'Error loading data: {str(e)}'),
-            px.bar(title=f'Error loading data: {str(e)}'),
-            px.bar(title=f'Error loading data: {str(e)}'),
-            "Error loading data"
-        ]
+        logger.error(f"Error updating heatmap: {str(e)}")
+        return px.imshow([[0]], title=f'Error loading data: {str(e)}')
+
+def update_fleet_figure(n):
+    credentials = current_credentials()
+    admins = [name.strip() for name in os.environ.get('WATT_SEER_PORTFOLIO_ADMINS', '').split(',') if name.strip()]
+    if credentials is None or credentials['username'] not in admins:
+        return px.bar(title='The fleet view is only available to portfolio administrators')
+    
+    registry, fetcher = portfolio.get_portfolio()
+    summary = portfolio.portfolio_rollup(fetcher.frame(), by='utility', resolution='month')
+    if summary.empty:
+        return px.bar(title='No fleet data available yet')
+    
+    summary['month'] = pd.to_datetime(summary['period']).dt.strftime('%B %Y')
+    fig = px.bar(
+        summary,
+        x='month',
+        y='total',
+        color='utility',
+        barmode='group',
+        hover_data=['accounts', 'p10', 'p50', 'p90'],
+        title=f'Fleet Energy Consumption for {len(registry)} Households',
+        labels={'total': 'Total Energy Consumption (kWh)', 'month': 'Month'}
+    )
+    return fig
+
+if portfolio.is_enabled():
+    app.callback(
+        dash.Output('fleet-figure', 'figure'),
+        [dash.Input('interval-component', 'n_intervals')]
+    )(update_fleet_figure)
+
+def aggregate_frame(df, aggregation, credentials=None):
+    """Aggregate interval rows, reading summed periods from the credential's rollup cube where it can"""
+    if credentials is not None:
+        result = views.rollup_intervals(data_fetcher.get_rollup(credentials), df, **aggregation)
+        if result is not None:
+            return result
+    return views.aggregate_intervals(df, **aggregation)
+
+def energy_response(df, aggregation, credentials=None):
+    """Return interval rows as JSON, aggregated on the server when the request asked for it"""
+    if aggregation is not None:
+        df = aggregate_frame(df, aggregation, credentials)
+    return jsonify(df.to_dict(orient='records'))
 
 @server.route('/energy/daily', methods=['POST'])
 def get_daily_energy():
@@ -451,9 +789,14 @@ def get_daily_energy():
     if not data or 'credentials' not in data:
         return jsonify({'error': 'No credentials provided'}), 400
     
+    try:
+        aggregation = views.parse_aggregation(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     try:
         df = data_fetcher.get_current_month_data(data['credentials'])
-        return jsonify(df.to_dict(orient='records'))
+        return energy_response(df, aggregation, data['credentials'])
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -463,9 +806,14 @@ def get_weekly_energy():
     if not data or 'credentials' not in data:
         return jsonify({'error': 'No credentials provided'}), 400
     
+    try:
+        aggregation = views.parse_aggregation(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     try:
         df = data_fetcher.get_weekly_data(data['credentials'])
-        return jsonify(df.to_dict(orient='records'))
+        return energy_response(df, aggregation, data['credentials'])
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -475,9 +823,14 @@ def get_quarterly_energy():
     if not data or 'credentials' not in data:
         return jsonify({'error': 'No credentials provided'}), 400
     
+    try:
+        aggregation = views.parse_aggregation(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     try:
         df = data_fetcher.get_quarterly_data(data['credentials'])
-        return jsonify(df.to_dict(orient='records'))
+        return energy_response(df, aggregation, data['credentials'])
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -487,26 +840,180 @@ def get_yearly_energy():
     if not data or 'credentials' not in data:
         return jsonify({'error': 'No credentials provided'}), 400
     
+    try:
+        aggregation = views.parse_aggregation(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     try:
         df = data_fetcher.get_current_year_data(data['credentials'])
-        return jsonify(df.to_dict(orient='records'))
+        return energy_response(df, aggregation, data['credentials'])
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def export_response(df, aggregation, export_format, credentials=None):
+    """Return interval rows in the negotiated export format"""
+    if export_format == 'json':
+        return energy_response(df, aggregation, credentials)
+    
+    if aggregation is not None:
+        df = aggregate_frame(df, aggregation, credentials)
+    mimetype = exports.EXPORT_FORMATS[export_format]
+    if export_format == 'arrow':
+        return Response(exports.arrow_ipc_bytes(df), mimetype=mimetype)
+    if export_format == 'parquet':
+        return Response(exports.parquet_bytes(df), mimetype=mimetype)
+    if export_format == 'ndjson':
+        return Response(exports.iter_ndjson(df), mimetype=mimetype)
+    return Response(exports.iter_csv(df), mimetype=mimetype)
+
 @server.route('/energy/range', methods=['POST'])
 def get_energy_by_range():
     data = request.get_json()
     if not data or 'credentials' not in data or 'start_date' not in data or 'end_date' not in data:
         return jsonify({'error': 'Missing required parameters'}), 400
     
+    try:
+        aggregation = views.parse_aggregation(data)
+        export_format = exports.negotiate_format(request.accept_mimetypes, data.get('format'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if export_format in exports.ARROW_FORMATS and not exports.arrow_available():
+        return jsonify({'error': f'{export_format} export requires pyarrow'}), 406
+    
     try:
         start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').replace(tzinfo=pytz.UTC)
         end_date = datetime.strptime(data['end_date'], '%Y-%m-%d').replace(tzinfo=pytz.UTC)
         df = data_fetcher.get_data_by_date_range(start_date, end_date, data['credentials'])
-        return jsonify(df.to_dict(orient='records'))
+        return export_response(df, aggregation, export_format, data['credentials'])
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@server.route('/energy/jobs', methods=['POST'])
+def create_energy_job():
+    data = request.get_json()
+    if not data or 'credentials' not in data or 'start_date' not in data or 'end_date' not in data:
+        return jsonify({'error': 'Missing required parameters'}), 400
+    
+    try:
+        start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').replace(tzinfo=pytz.UTC)
+        end_date = datetime.strptime(data['end_date'], '%Y-%m-%d').replace(tzinfo=pytz.UTC)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    job_id = fetch_jobs.get_job_queue().submit(data['credentials'], start_date, end_date)
+    status_url = url_for('get_energy_job', job_id=job_id)
+    return jsonify({'job_id': job_id, 'status': fetch_jobs.QUEUED, 'status_url': status_url}), 202, {'Location': status_url}
+
+@server.route('/energy/jobs/<job_id>', methods=['GET'])
+def get_energy_job(job_id):
+    status = fetch_jobs.get_job_queue().status(job_id)
+    if status is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    if status['status'] == fetch_jobs.DONE:
+        status['result_url'] = url_for('get_energy_job_result', job_id=job_id)
+    return jsonify(status)
+
+@server.route('/energy/jobs/<job_id>/result', methods=['GET'])
+def get_energy_job_result(job_id):
+    queue = fetch_jobs.get_job_queue()
+    status = queue.status(job_id)
+    if status is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    if status['status'] != fetch_jobs.DONE:
+        return jsonify({'error': f"Job is {status['status']}", 'status': status['status']}), 409
+    
+    try:
+        aggregation = views.parse_aggregation(request.args)
+        export_format = exports.negotiate_format(request.accept_mimetypes, request.args.get('format'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if export_format in exports.ARROW_FORMATS and not exports.arrow_available():
+        return jsonify({'error': f'{export_format} export requires pyarrow'}), 406
+    
+    df = queue.result(job_id)
+    if df is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return export_response(df, aggregation, export_format)
+
+@server.route('/energy/tariff-compare', methods=['POST'])
+def compare_tariffs():
+    data = request.get_json()
+    if not data or 'credentials' not in data or 'plans' not in data:
+        return jsonify({'error': 'Missing required parameters'}), 400
+    
+    try:
+        plans = tariffs.parse_plans(data['plans'])
+        if 'start_date' in data or 'end_date' in data:
+            if 'start_date' not in data or 'end_date' not in data:
+                raise ValueError('Both start_date and end_date are required')
+            start_date = datetime.strptime(data['start_date'], '%Y-%m-%d').replace(tzinfo=pytz.UTC)
+            end_date = datetime.strptime(data['end_date'], '%Y-%m-%d').replace(tzinfo=pytz.UTC)
+        else:
+            start_date, end_date = data_fetcher.year_to_date_range()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        df = data_fetcher.get_data_by_date_range(start_date, end_date, data['credentials'])
+        result = tariffs.compare_plans(df, plans)
+        best = result.loc[result.groupby('account_name')['total'].idxmin()] if not result.empty else result
+        return jsonify({
+            'start_date': start_date.strftime('%Y-%m-%d'),
+            'end_date': end_date.strftime('%Y-%m-%d'),
+            'plans': [plan['name'] for plan in plans],
+            'best_plan': dict(zip(best['account_name'], best['plan'])),
+            'rows': result.to_dict(orient='records')
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def portfolio_authorized():
+    """Check the bearer token guarding the fleet-wide portfolio endpoints"""
+    token = os.environ.get('WATT_SEER_PORTFOLIO_TOKEN')
+    # Compared in constant time; bytes so a non-ASCII header is rejected rather than raising
+    return bool(token) and hmac.compare_digest(
+        request.headers.get('Authorization', '').encode('utf-8'), f'Bearer {token}'.encode('utf-8'))
+
+@server.route('/portfolio/summary', methods=['GET'])
+def get_portfolio_summary():
+    if not portfolio.is_enabled():
+        return jsonify({'error': 'Portfolio mode is not configured'}), 404
+    if not portfolio_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    by = request.args.get('by', 'utility')
+    resolution = request.args.get('resolution', 'month')
+    field = request.args.get('field', 'consumption')
+    if resolution not in views.RESOLUTIONS:
+        return jsonify({'error': f"resolution must be one of {', '.join(views.RESOLUTIONS)}"}), 400
+    if field not in views.FIELDS:
+        return jsonify({'error': f"field must be one of {', '.join(views.FIELDS)}"}), 400
+    
+    registry, fetcher = portfolio.get_portfolio()
+    try:
+        summary = portfolio.portfolio_rollup(fetcher.frame(), by=by, resolution=resolution, field=field)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({
+        'households': len(registry),
+        'refreshed_at': fetcher.refreshed_at.isoformat() if fetcher.refreshed_at is not None else None,
+        'rows': summary.to_dict(orient='records')
+    })
+
+@server.route('/portfolio/refresh', methods=['POST'])
+def refresh_portfolio():
+    if not portfolio.is_enabled():
+        return jsonify({'error': 'Portfolio mode is not configured'}), 404
+    if not portfolio_authorized():
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    _, fetcher = portfolio.get_portfolio()
+    fetcher.refresh_soon()
+    return jsonify({'status': 'refreshing'}), 202
+
 def get_quarter_dates(year):
     """Get start and end dates for each quarter of a given year"""
     quarters = []
@@ -529,22 +1036,7 @@ def get_year_dates(year):
 
 def get_quarterly_data(credentials):
     """Fetch quarterly data for the current year"""
-    current_year = datetime.now(pytz.UTC).year
-    all_quarterly_data = []
-    
-    for start_date, end_date in get_quarter_dates(current_year):
-        try:
-            quarter_data = data_fetcher.get_data_by_date_range(start_date, end_date, credentials)
-            if not quarter_data.empty:
-                # Add quarter label
-                quarter_data['quarter'] = f"Q{(start_date.month-1)//3 + 1}"
-                all_quarterly_data.append(quarter_data)
-        except Exception as e:
-            print(f"Error fetching data for quarter {start_date.month//3 + 1}: {e}")
-    
-    if all_quarterly_data:
-        return pd.concat(all_quarterly_data, ignore_index=True)
-    return pd.DataFrame()
+    return data_fetcher.get_quarterly_data(credentials)
 
 def get_yearly_data(credentials):
     """Fetch yearly data for the current year"""
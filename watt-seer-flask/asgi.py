@@ -0,0 +1,147 @@
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import SyncToAsync
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+import pytz
+import json
+import os
+import logging
+import data_fetcher
+import exports
+import views
+from app import server
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Threads serving Flask and Dash requests; asgiref would otherwise run every request on one shared thread
+WSGI_THREADS = int(os.environ.get('WATT_SEER_WSGI_THREADS', 32))
+WSGI_EXECUTOR = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix='wsgi')
+
+
+def validate_request(data):
+    """Raise ValueError for a request the Flask view rejects, so nothing is fetched for it"""
+    if not isinstance(data, dict) or 'credentials' not in data:
+        raise ValueError('No credentials provided')
+    views.parse_aggregation(data)
+
+
+def prefetch_range(data, headers):
+    """Validate an /energy/range request like get_energy_by_range and return its fetch"""
+    validate_request(data)
+    accept = parse_accept_header(headers.get(b'accept', b'').decode('latin-1'), MIMEAccept)
+    export_format = exports.negotiate_format(accept, data.get('format'))
+    if export_format in exports.ARROW_FORMATS and not exports.arrow_available():
+        raise ValueError(f'{export_format} export requires pyarrow')
+    return data_fetcher.async_get_data_by_date_range(
+        datetime.strptime(data['start_date'], '%Y-%m-%d').replace(tzinfo=pytz.UTC),
+        datetime.strptime(data['end_date'], '%Y-%m-%d').replace(tzinfo=pytz.UTC),
+        data['credentials'])
+
+
+def prefetch(fetch):
+    """Return a prefetcher that validates a request and then calls fetch(credentials)"""
+    def prefetcher(data, headers):
+        validate_request(data)
+        return fetch(data['credentials'])
+    return prefetcher
+
+
+# Energy endpoint -> prefetcher(data, headers) that validates the request and returns
+# an awaitable fetch filling the response cache for it
+PREFETCHERS = {
+    '/energy/daily': prefetch(data_fetcher.async_get_current_month_data),
+    '/energy/weekly': prefetch(data_fetcher.async_get_weekly_data),
+    '/energy/quarterly': prefetch(data_fetcher.async_get_current_year_data),
+    '/energy/yearly': prefetch(data_fetcher.async_get_current_year_data),
+    '/energy/range': prefetch_range
+}
+
+
+class ThreadPoolWsgiInstance(WsgiToAsgiInstance):
+    """Runs the WSGI app of one request on WSGI_EXECUTOR"""
+
+    # asgiref wraps run_wsgi_app in a thread-sensitive SyncToAsync; re-wrap the plain function.
+    # This relies on asgiref internals, which is why requirements.txt caps its version.
+    run_wsgi_app = SyncToAsync(
+        WsgiToAsgiInstance.__dict__['run_wsgi_app'].func, thread_sensitive=False, executor=WSGI_EXECUTOR)
+
+
+class ThreadPoolWsgiToAsgi(WsgiToAsgi):
+    """WsgiToAsgi serving concurrent requests from a thread pool"""
+
+    async def __call__(self, scope, receive, send):
+        await ThreadPoolWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+wsgi_application = ThreadPoolWsgiToAsgi(server)
+
+
+async def application(scope, receive, send):
+    """ASGI entry point serving the Flask app and the Dash dashboard.
+
+    For the /energy/* endpoints the utility is queried on the event loop
+    first, so a slow opower call only holds a coroutine. The Flask view
+    then answers from the response cache. Everything else goes straight
+    to the WSGI app.
+    """
+    if scope['type'] != 'http' or scope['method'] != 'POST' or scope['path'] not in PREFETCHERS:
+        await wsgi_application(scope, receive, send)
+        return
+
+    body = await read_body(receive)
+    try:
+        data = json.loads(body or b'null')
+        fetch = PREFETCHERS[scope['path']](data, dict(scope.get('headers', [])))
+    except (ValueError, TypeError, KeyError):
+        # Let the Flask view report the malformed request
+        fetch = None
+
+    if fetch is not None:
+        try:
+            await fetch
+        except Exception as e:
+            logger.error(f"Error fetching data for {scope['path']}: {str(e)}")
+            await send_json(send, 500, {'error': str(e)})
+            return
+
+    await wsgi_application(scope, replay_body(body, receive), send)
+
+
+async def read_body(receive):
+    """Read the whole request body"""
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            break
+    return b''.join(chunks)
+
+
+def replay_body(body, receive):
+    """Return a receive callable that hands the already read body to the WSGI app"""
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        return await receive()
+    return replay
+
+
+async def send_json(send, status, payload):
+    """Send a complete JSON response"""
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    })
+    await send({'type': 'http.response.body', 'body': body})
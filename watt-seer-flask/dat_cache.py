@@ -0,0 +1,190 @@
+import pandas as pd
+import numpy as np
+import hashlib
+import json
+import os
+import tempfile
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Set to 0 to always parse the text export
+ENABLED = os.environ.get('WATT_SEER_DAT_CACHE', '1') != '0'
+
+# Bump when the sidecar layout changes so older sidecars are rebuilt
+FORMAT_VERSION = 1
+
+# Column dtypes of a sidecar; timestamps are UTC epoch nanoseconds
+SIDECAR_COLUMNS = {
+    'start_time': '<i8',
+    'end_time': '<i8',
+    'consumption': '<f8',
+    'provided_cost': '<f8'
+}
+TIME_COLUMNS = ['start_time', 'end_time']
+
+
+def sidecar_path(file_path):
+    """Return the directory holding the binary sidecar of an export, next to the export"""
+    directory, name = os.path.split(os.path.abspath(file_path))
+    return os.path.join(directory, f'.{name}.cache')
+
+
+def file_digest(file_path):
+    """Return the SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_meta(file_path):
+    """Return the metadata of a sidecar that still matches its export, or None.
+
+    A sidecar matches if the export's size and mtime are unchanged. When
+    only the mtime changed (the file was touched or copied), the content
+    hash decides and the recorded mtime is refreshed on a match.
+    """
+    try:
+        with open(os.path.join(sidecar_path(file_path), 'meta.json')) as f:
+            meta = json.load(f)
+        stat = os.stat(file_path)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != FORMAT_VERSION or meta.get('size') != stat.st_size:
+        return None
+    if meta.get('mtime_ns') != stat.st_mtime_ns:
+        if meta.get('sha256') != file_digest(file_path):
+            return None
+        meta['mtime_ns'] = stat.st_mtime_ns
+        _write_meta(file_path, meta)
+    return meta
+
+
+def read_sidecar(file_path):
+    """Return a fresh sidecar's columns as read-only memory-mapped arrays, or None"""
+    meta = read_meta(file_path)
+    if meta is None:
+        return None
+    directory = sidecar_path(file_path)
+    if meta['rows'] == 0:
+        return {column: np.empty(0, dtype=dtype) for column, dtype in meta['columns'].items()}
+    return {
+        column: np.memmap(os.path.join(directory, f'{column}.bin'), dtype=dtype, mode='r', shape=(meta['rows'],))
+        for column, dtype in meta['columns'].items()
+    }
+
+
+def cache_chunks(file_path, chunks):
+    """Yield parsed chunks of an export while appending them to a new sidecar.
+
+    Chunks are frames with naive UTC timestamps. The sidecar is published
+    once every chunk was read; if its directory cannot be written (a
+    read-only archive) the chunks are passed through without caching.
+    """
+    stat = os.stat(file_path)
+    directory = sidecar_path(file_path)
+    outputs = {}
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # Readers check meta.json first, so drop it before replacing the columns
+        try:
+            os.remove(os.path.join(directory, 'meta.json'))
+        except FileNotFoundError:
+            pass
+        for column in SIDECAR_COLUMNS:
+            outputs[column] = _temporary_file(directory, f'{column}.bin', 'wb')
+    except OSError as e:
+        _discard(outputs.values())
+        logger.warning(f"Could not write sidecar for {file_path}: {str(e)}")
+        yield from chunks
+        return
+    rows = 0
+    complete = False
+    try:
+        for chunk in chunks:
+            for column, dtype in SIDECAR_COLUMNS.items():
+                values = chunk[column]
+                if column in TIME_COLUMNS:
+                    values = values.to_numpy(dtype='datetime64[ns]').view(np.int64)
+                np.ascontiguousarray(values, dtype=dtype).tofile(outputs[column])
+            rows += len(chunk)
+            yield chunk
+        complete = True
+    finally:
+        for output in outputs.values():
+            output.close()
+        if not complete:
+            _discard(outputs.values())
+    for column, output in outputs.items():
+        os.replace(output.name, os.path.join(directory, f'{column}.bin'))
+    _write_meta(file_path, {
+        'version': FORMAT_VERSION,
+        'rows': rows,
+        'columns': SIDECAR_COLUMNS,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha256': file_digest(file_path)
+    })
+    logger.debug(f"Wrote sidecar for {file_path} ({rows} rows)")
+
+
+def write_sidecar(file_path, energy_data):
+    """Write the sidecar of an export from its parsed frame with naive UTC timestamps"""
+    for _ in cache_chunks(file_path, [energy_data]):
+        pass
+
+
+def sidecar_frame(columns):
+    """Build a frame with naive UTC timestamps from sidecar arrays"""
+    return pd.DataFrame({
+        column: values.astype(np.int64).view('datetime64[ns]') if column in TIME_COLUMNS else np.asarray(values)
+        for column, values in columns.items()
+    })
+
+
+def sidecar_chunks(columns, chunksize):
+    """Yield frames of chunksize rows sliced from sidecar arrays"""
+    rows = len(next(iter(columns.values()))) if columns else 0
+    for start in range(0, rows, chunksize):
+        yield sidecar_frame({column: values[start:start + chunksize] for column, values in columns.items()})
+
+
+def load(file_path, parse):
+    """Load an export from its sidecar, or parse it with parse(file_path) and write the sidecar"""
+    if ENABLED:
+        columns = read_sidecar(file_path)
+        if columns is not None:
+            logger.debug(f"Loaded {file_path} from its sidecar")
+            return sidecar_frame(columns)
+    energy_data = parse(file_path)
+    if ENABLED:
+        try:
+            write_sidecar(file_path, energy_data)
+        except OSError as e:
+            logger.warning(f"Could not write sidecar for {file_path}: {str(e)}")
+    return energy_data
+
+
+def _write_meta(file_path, meta):
+    directory = sidecar_path(file_path)
+    with _temporary_file(directory, 'meta.json', 'w') as f:
+        json.dump(meta, f)
+    os.replace(f.name, os.path.join(directory, 'meta.json'))
+
+
+def _temporary_file(directory, name, mode):
+    """Open a uniquely named file next to name, so concurrent writers never share one before os.replace"""
+    return tempfile.NamedTemporaryFile(mode, dir=directory, prefix=f'{name}.', suffix='.tmp', delete=False)
+
+
+def _discard(outputs):
+    """Close and remove temporary files of an abandoned write"""
+    for output in outputs:
+        output.close()
+        try:
+            os.remove(output.name)
+        except OSError:
+            pass
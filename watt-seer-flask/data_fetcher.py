@@ -1,100 +1,321 @@
 import pandas as pd
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import pytz
 import subprocess
+import asyncio
 import tempfile
 import os
 import logging
 import json
-from io import StringIO
+from array import array
+from collections import OrderedDict
+import time
+import numpy as np
+import interval_store
+import opower_client
+import response_cache
+import single_flight
+import rollups
+import fetch_scheduler
+import dat_cache
+import threading
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+# Serve past intervals from the local store and only fetch newer hours
+USE_INTERVAL_STORE = os.environ.get('WATT_SEER_USE_STORE', '1') != '0'
+
+# 'library' keeps a logged-in opower session in-process, 'subprocess' runs python -m opower
+FETCH_BACKEND = os.environ.get('WATT_SEER_FETCH_BACKEND', 'library')
+
+# In-memory cache of fetched ranges, sized for the 5 minute dashboard refresh
+RESPONSE_CACHE = response_cache.ResponseCache(
+    ttl=int(os.environ.get('WATT_SEER_CACHE_TTL', 300)),
+    max_stale=int(os.environ.get('WATT_SEER_CACHE_MAX_STALE', 86400)),
+    max_entries=int(os.environ.get('WATT_SEER_CACHE_MAX_ENTRIES', 128)),
+    max_bytes=int(os.environ.get('WATT_SEER_CACHE_MAX_MB', 256)) * 1024 * 1024,
+    # Each household (utility, username) gets its own quota within the cache
+    partition=lambda key: key[:2],
+    max_partition_bytes=int(os.environ.get('WATT_SEER_CACHE_TENANT_MB', 64)) * 1024 * 1024
+)
+
+# Concurrent fetches for a range already being fetched wait and share the result
+IN_FLIGHT_FETCHES = single_flight.SingleFlight()
+
+# Credentials the utility accepted recently; stored intervals are only served to these
+VERIFIED_LOGIN_TTL = float(os.environ.get('WATT_SEER_LOGIN_TTL', 3600))
+MAX_VERIFIED_LOGINS = int(os.environ.get('WATT_SEER_MAX_VERIFIED_LOGINS', 4096))
+_verified_logins = OrderedDict()
+_verified_lock = threading.Lock()
+
+# Loads the dashboard's ranges right after a login
+_warmup_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='login-warmup')
+
+# Ranges are split into chunks fetched concurrently, at most a few per utility at a time
+FETCH_CHUNK = os.environ.get('WATT_SEER_FETCH_CHUNK', 'quarter')
+FETCH_SCHEDULER = fetch_scheduler.FetchScheduler(
+    max_workers=int(os.environ.get('WATT_SEER_FETCH_WORKERS', 8)),
+    per_utility_limit=int(os.environ.get('WATT_SEER_FETCH_PER_UTILITY', 4)),
+    retries=int(os.environ.get('WATT_SEER_FETCH_RETRIES', 2)),
+    no_retry=opower_client.NON_RETRYABLE_ERRORS
+)
+
+# Rollup cubes per credential, fed by every sync. The least recently used
+# cubes are dropped beyond MAX_ROLLUPS and reseeded from the store on next use.
+MAX_ROLLUPS = int(os.environ.get('WATT_SEER_MAX_ROLLUPS', 1024))
+ROLLUPS = OrderedDict()
+_rollups_lock = threading.Lock()
+_seed_locks = {}
+
+# Timestamps are printed by opower as str(datetime) with a UTC offset
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S%z'
+
+# dtype of consumption/provided_cost; float32 halves their size
+VALUE_DTYPE = np.dtype(os.environ.get('WATT_SEER_VALUE_DTYPE', 'float64'))
+
+# Per-account columns stored as categoricals
+ACCOUNT_COLUMNS = ['account_id', 'customer_uuid', 'account_uuid', 'account_name']
+
+def as_interval_frame(df):
+    """Give an interval frame categorical account columns and typed value columns"""
+    if df.empty:
+        return df
+    for column in ACCOUNT_COLUMNS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    for column in ('consumption', 'provided_cost'):
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype(VALUE_DTYPE)
+    return df
+
+def fetch_intervals(credentials, start_date, end_date):
+    """Fetch intervals from the utility with the configured backend"""
+    if FETCH_BACKEND == 'library' and opower_client.is_available():
+        logger.debug(f"Fetching {start_date} to {end_date} with the in-process opower client")
+        return as_interval_frame(opower_client.get_client().fetch(credentials, start_date, end_date))
+    return run_opower_command(credentials, start_date, end_date)
+
+async def async_fetch_intervals(credentials, start_date, end_date):
+    """Awaitable fetch_intervals for use from an event loop"""
+    if FETCH_BACKEND == 'library' and opower_client.is_available():
+        client = opower_client.get_client()
+        future = asyncio.run_coroutine_threadsafe(
+            client.async_fetch(credentials, start_date, end_date), client.loop)
+        return as_interval_frame(await asyncio.wrap_future(future))
+    return await async_run_opower_command(credentials, start_date, end_date)
+
+def fetch_range_chunks(credentials, start_date, end_date, on_progress=None):
+    """Fetch a range as concurrent chunks and reassemble them in order without duplicates"""
+    chunks = fetch_scheduler.split_range(start_date, end_date, FETCH_CHUNK)
+    logger.debug(f"Fetching {start_date} to {end_date} in {len(chunks)} chunks")
+    return FETCH_SCHEDULER.fetch_chunks(credentials, chunks, fetch_intervals, on_progress=on_progress)
+
+def build_opower_command(credentials, start_date=None, end_date=None):
+    """Build the opower command line for a credential and optional date range"""
+    cmd = [
+        'python', '-m', 'opower',
+        '--utility', credentials['utility'],
+        '--username', credentials['username'],
+        '--password', credentials['password'],
+        '--aggregate_type', 'hour'
+    ]
+    
+    # Add date range if provided
+    if start_date:
+        cmd.extend(['--start_date', start_date.strftime('%Y%m%d')])
+    if end_date:
+        cmd.extend(['--end_date', end_date.strftime('%Y%m%d')])
+    return cmd
+
+async def async_fetch_range_chunks(credentials, start_date, end_date):
+    """Awaitable fetch_range_chunks"""
+    chunks = fetch_scheduler.split_range(start_date, end_date, FETCH_CHUNK)
+    logger.debug(f"Fetching {start_date} to {end_date} in {len(chunks)} chunks")
+    return await FETCH_SCHEDULER.async_fetch_chunks(credentials, chunks, async_fetch_intervals)
+
 def run_opower_command(credentials, start_date=None, end_date=None):
     """Run the opower command line tool and return the data as a DataFrame"""
     try:
-        # Construct the command
-        cmd = [
-            'python', '-m', 'opower',
-            '--utility', credentials['utility'],
-            '--username', credentials['username'],
-            '--password', credentials['password']
-        ]
-        
-        # Add date range if provided
-        if start_date:
-            cmd.extend(['--start_date', start_date.strftime('%Y%m%d')])
-        if end_date:
-            cmd.extend(['--end_date', end_date.strftime('%Y%m%d')])
-        
+        cmd = build_opower_command(credentials, start_date, end_date)
         logger.debug(f"Running command: {' '.join(cmd)}")
         
-        # Run the command and capture output
-        result = subprocess.run(cmd, capture_output=True, text=True)
+        # Stream stdout through the parser; stderr goes to a temporary file so
+        # a chatty child cannot block on a full pipe
+        parser = OpowerOutputParser()
+        with tempfile.TemporaryFile(mode='w+') as stderr_file:
+            with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=stderr_file, text=True) as process:
+                for line in process.stdout:
+                    parser.feed(line)
+                returncode = process.wait()
+            stderr_file.seek(0)
+            stderr = stderr_file.read()
         
-        if result.stderr:
-            logger.error(f"Command stderr: {result.stderr}")
+        if stderr:
+            logger.error(f"Command stderr: {stderr}")
         
-        if result.returncode != 0:
-            logger.error(f"Command failed with return code {result.returncode}")
-            raise Exception(f"Command failed: {result.stderr}")
+        if returncode != 0:
+            logger.error(f"Command failed with return code {returncode}")
+            raise Exception(f"Command failed: {stderr}")
         
-        # Parse the output
-        if result.stdout:
-            lines = result.stdout.strip().split('\n')
-            current_account = None
-            all_data = []
-            header = None
-            data_lines = []
-            
-            for line in lines:
-                line = line.strip()
-                if line.startswith('Getting historical data: account='):
-                    # If we have data from previous account, process it
-                    if header and data_lines:
-                        df = process_data_lines(header, data_lines, current_account)
-                        if not df.empty:
-                            all_data.append(df)
-                    
-                    # Extract account info
-                    current_account = extract_account_info(line)
-                    header = None
-                    data_lines = []
-                elif line.startswith('start_time'):
-                    header = line
-                elif '\t' in line and not line.startswith('Getting') and not line.startswith('Current'):
-                    data_lines.append(line)
-            
-            # Process the last account's data
-            if header and data_lines:
-                df = process_data_lines(header, data_lines, current_account)
-                if not df.empty:
-                    all_data.append(df)
-            
-            # Combine all data
-            if all_data:
-                return pd.concat(all_data, ignore_index=True)
-            return pd.DataFrame()
-            
-        else:
+        if parser.line_count == 0:
             logger.error("No data received from command")
             raise Exception("No data received from command")
+        
+        return parser.to_frame()
             
     except Exception as e:
         logger.error(f"Error in run_opower_command: {str(e)}")
         raise
 
+async def async_run_opower_command(credentials, start_date=None, end_date=None):
+    """Awaitable run_opower_command that streams the child's output without blocking the event loop"""
+    try:
+        cmd = build_opower_command(credentials, start_date, end_date)
+        logger.debug(f"Running command asynchronously: {' '.join(cmd)}")
+        
+        parser = OpowerOutputParser()
+        process = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        stderr_task = asyncio.ensure_future(process.stderr.read())
+        async for line in process.stdout:
+            parser.feed(line.decode('utf-8', errors='replace'))
+        stderr = (await stderr_task).decode('utf-8', errors='replace')
+        returncode = await process.wait()
+        
+        if stderr:
+            logger.error(f"Command stderr: {stderr}")
+        
+        if returncode != 0:
+            logger.error(f"Command failed with return code {returncode}")
+            raise Exception(f"Command failed: {stderr}")
+        
+        if parser.line_count == 0:
+            logger.error("No data received from command")
+            raise Exception("No data received from command")
+        
+        return parser.to_frame()
+            
+    except Exception as e:
+        logger.error(f"Error in async_run_opower_command: {str(e)}")
+        raise
+
+class OpowerOutputParser:
+    """Incrementally parse `python -m opower` output into typed column buffers.
+
+    Account sections start at 'Getting historical data: account=' lines.
+    Each data row is appended to per-column buffers as it arrives, and
+    to_frame() builds one DataFrame for all accounts in a single pass.
+    """
+
+    def __init__(self):
+        self.line_count = 0
+        self.accounts = []
+        self._account_index = None
+        self._columns = None
+        self._start_times = []
+        self._end_times = []
+        self._consumption = array('d')
+        self._provided_cost = array('d')
+        self._account_codes = array('i')
+
+    def feed(self, line):
+        """Consume one line of command output"""
+        self.line_count += 1
+        line = line.strip()
+        if line.startswith('Getting historical data: account='):
+            account_info = extract_account_info(line)
+            if account_info and 'utility_account_id' in account_info:
+                self.accounts.append(account_info)
+                self._account_index = len(self.accounts) - 1
+            else:
+                self._account_index = None
+            self._columns = None
+        elif line.startswith('start_time'):
+            header = line.split('\t')
+            self._columns = (
+                header.index('start_time'),
+                header.index('end_time'),
+                header.index('consumption'),
+                header.index('provided_cost') if 'provided_cost' in header else None
+            )
+        elif '\t' in line and self._columns is not None and self._account_index is not None:
+            fields = line.split('\t')
+            start_col, end_col, consumption_col, cost_col = self._columns
+            self._start_times.append(fields[start_col])
+            self._end_times.append(fields[end_col])
+            self._consumption.append(_to_float(fields[consumption_col]))
+            self._provided_cost.append(_to_float(fields[cost_col]) if cost_col is not None else float('nan'))
+            self._account_codes.append(self._account_index)
+
+    def to_frame(self):
+        """Build the DataFrame for every parsed row"""
+        if not self._start_times:
+            return pd.DataFrame()
+        codes = np.frombuffer(self._account_codes, dtype=np.int32)
+        account_ids = [account['utility_account_id'] for account in self.accounts]
+        return pd.DataFrame({
+            'start_time': pd.to_datetime(self._start_times, format=TIMESTAMP_FORMAT, utc=True),
+            'end_time': pd.to_datetime(self._end_times, format=TIMESTAMP_FORMAT, utc=True),
+            'consumption': np.frombuffer(self._consumption, dtype=np.float64).astype(VALUE_DTYPE),
+            'provided_cost': np.frombuffer(self._provided_cost, dtype=np.float64).astype(VALUE_DTYPE),
+            'account_id': _account_categorical(account_ids, codes),
+            'customer_uuid': _account_categorical([account.get('customer_uuid') for account in self.accounts], codes),
+            'account_uuid': _account_categorical([account.get('account_uuid') for account in self.accounts], codes),
+            'account_name': _account_categorical([f"Account {account_id}" for account_id in account_ids], codes)
+        })
+
+def _account_categorical(values, codes):
+    """Expand one value per account into a categorical column using the per-row account codes"""
+    categories = pd.unique(pd.Series(values, dtype=object))
+    positions = pd.Index(categories).get_indexer(values)
+    return pd.Categorical.from_codes(positions[codes], categories=categories)
+
+def _to_float(value):
+    """Parse a numeric field, treating 'None' and blanks as missing"""
+    try:
+        return float(value)
+    except ValueError:
+        return float('nan')
+
+def current_month_range():
+    """Return the range from the 1st of the current month until now"""
+    # Get today's date
+    end_date = datetime.now(pytz.UTC)
+    # Get first day of the current month
+    start_date = end_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return start_date, end_date
+
+def last_week_range():
+    """Return the range covering the last seven days"""
+    end_date = datetime.now(pytz.UTC)
+    return end_date - timedelta(days=7), end_date
+
+def year_to_date_range():
+    """Return the range from January 1st of the current year until now"""
+    end_date = datetime.now(pytz.UTC)
+    return datetime(end_date.year, 1, 1, tzinfo=pytz.UTC), end_date
+
+async def async_get_current_month_data(credentials):
+    """Awaitable get_current_month_data"""
+    return await async_get_data_by_date_range(*current_month_range(), credentials)
+
+async def async_get_weekly_data(credentials):
+    """Awaitable get_weekly_data"""
+    return await async_get_data_by_date_range(*last_week_range(), credentials)
+
+async def async_get_current_year_data(credentials):
+    """Awaitable get_current_year_data"""
+    return await async_get_data_by_date_range(*year_to_date_range(), credentials)
+
 def get_current_month_data(credentials):
     """Get energy consumption data from the 1st of current month until today"""
     try:
-        # Get today's date
-        end_date = datetime.now(pytz.UTC)
-        # Get first day of the current month
-        start_date = end_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        start_date, end_date = current_month_range()
         logger.debug(f"Fetching current month data from {start_date} to {end_date}")
-        return run_opower_command(credentials, start_date, end_date)
+        return get_data_by_date_range(start_date, end_date, credentials)
     except Exception as e:
         logger.error(f"Error in get_current_month_data: {str(e)}")
         raise
@@ -102,84 +323,264 @@ def get_current_month_data(credentials):
 def get_weekly_data(credentials):
     """Get energy consumption data for the last week"""
     try:
-        end_date = datetime.now(pytz.UTC)
-        start_date = end_date - timedelta(days=7)
+        start_date, end_date = last_week_range()
         logger.debug(f"Fetching weekly data from {start_date} to {end_date}")
-        return run_opower_command(credentials, start_date, end_date)
+        return get_data_by_date_range(start_date, end_date, credentials)
     except Exception as e:
         logger.error(f"Error in get_weekly_data: {str(e)}")
         raise
 
-def get_data_by_date_range(start_date, end_date, credentials):
-    """Get energy consumption data for a specific date range"""
+def get_data_by_date_range(start_date, end_date, credentials, revalidate=True):
+    """Get energy consumption data for a specific date range.
+
+    With revalidate=False a cached range is returned as is, however old,
+    because a prefetch scheduler keeps it fresh.
+    """
     try:
         logger.debug(f"Fetching data from {start_date} to {end_date}")
-        
-        # Run command without account specification
-        cmd = [
-            'python', '-m', 'opower',
-            '--utility', credentials['utility'],
-            '--username', credentials['username'],
-            '--password', credentials['password'],
-            '--start_date', start_date.strftime('%Y%m%d'),
-            '--end_date', end_date.strftime('%Y%m%d')
-        ]
-        
-        logger.debug(f"Running command: {' '.join(cmd)}")
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        if result.stderr:
-            logger.error(f"Command stderr: {result.stderr}")
-        
-        if result.returncode != 0:
-            logger.error(f"Command failed with return code {result.returncode}")
-            raise Exception(f"Command failed: {result.stderr}")
-        
-        # Process the output
-        if result.stdout:
-            lines = result.stdout.strip().split('\n')
-            current_account = None
-            all_data = []
-            header = None
-            data_lines = []
-            
-            for line in lines:
-                line = line.strip()
-                if line.startswith('Getting historical data: account='):
-                    # If we have data from previous account, process it
-                    if header and data_lines:
-                        df = process_data_lines(header, data_lines, current_account)
-                        if not df.empty:
-                            all_data.append(df)
-                    
-                    # Extract account info
-                    current_account = extract_account_info(line)
-                    header = None
-                    data_lines = []
-                elif line.startswith('start_time'):
-                    header = line
-                elif '\t' in line and not line.startswith('Getting') and not line.startswith('Current'):
-                    data_lines.append(line)
-            
-            # Process the last account's data
-            if header and data_lines:
-                df = process_data_lines(header, data_lines, current_account)
-                if not df.empty:
-                    all_data.append(df)
-            
-            # Combine all data
-            if all_data:
-                return pd.concat(all_data, ignore_index=True)
-            return pd.DataFrame()
+        cache_key = response_cache_key(start_date, end_date, credentials)
+        if not revalidate:
+            cached = RESPONSE_CACHE.get(cache_key)
+            if cached is not None:
+                return cached
+        return RESPONSE_CACHE.get_or_fetch(
+            cache_key, lambda: load_date_range_once(start_date, end_date, credentials))
             
+    except Exception as e:
+        logger.error(f"Error in get_data_by_date_range: {str(e)}")
+        raise
+
+def response_cache_key(start_date, end_date, credentials):
+    """Key a fetched range in the response cache; opower works in whole days.
+
+    The password digest is part of the key so a request with the right
+    username but the wrong password is never answered from the cache.
+    """
+    return opower_client.credential_key(credentials) + (
+        start_date.strftime('%Y%m%d'),
+        end_date.strftime('%Y%m%d')
+    )
+
+def load_date_range_once(start_date, end_date, credentials):
+    """Load a date range, sharing any in-flight fetch for the same credential that covers it"""
+    flight_key = opower_client.credential_key(credentials)
+    return IN_FLIGHT_FETCHES.do(
+        flight_key,
+        start_date.date(),
+        end_date.date(),
+        lambda: load_date_range(start_date, end_date, credentials),
+        narrow=slice_date_range
+    )
+
+def refresh_date_range(start_date, end_date, credentials):
+    """Fetch a date range and replace its response cache entry, however fresh it is"""
+    df = load_date_range_once(start_date, end_date, credentials)
+    RESPONSE_CACHE.put(response_cache_key(start_date, end_date, credentials), df)
+    return df
+
+def prefetch_dashboard_data(credentials):
+    """Warm the current month and year-to-date ranges the dashboard reads"""
+    year_data = refresh_date_range(*year_to_date_range(), credentials)
+    start_date, end_date = current_month_range()
+    month_data = slice_date_range(year_data, start_date.date(), end_date.date())
+    RESPONSE_CACHE.put(response_cache_key(start_date, end_date, credentials), month_data)
+
+def validate_credentials(credentials):
+    """Check credentials with the utility as cheaply as the fetch backend allows.
+
+    The library backend only logs in and starts warming the dashboard's
+    ranges in the background; the dashboard's first fetch joins that load.
+    The subprocess backend can only check credentials by fetching, so it
+    fetches the dashboard's ranges and keeps them in the response cache.
+    """
+    if FETCH_BACKEND == 'library' and opower_client.is_available():
+        opower_client.get_client().validate(credentials)
+        mark_verified(credentials)
+        _warmup_executor.submit(_warm_after_login, dict(credentials))
+        return
+    prefetch_dashboard_data(credentials)
+
+def _warm_after_login(credentials):
+    try:
+        prefetch_dashboard_data(credentials)
+    except Exception as e:
+        logger.error(f"Error warming data after login: {str(e)}")
+
+def mark_verified(credentials):
+    """Record that the utility accepted a credential"""
+    key = opower_client.credential_key(credentials)
+    with _verified_lock:
+        _verified_logins[key] = time.monotonic()
+        _verified_logins.move_to_end(key)
+        while len(_verified_logins) > MAX_VERIFIED_LOGINS:
+            _verified_logins.popitem(last=False)
+
+def forget_verified(credentials):
+    """Drop a credential's verified login, e.g. after the utility rejected it"""
+    with _verified_lock:
+        _verified_logins.pop(opower_client.credential_key(credentials), None)
+
+def forget_login(credentials):
+    """Drop everything kept for a credential's login, e.g. when its user logs out"""
+    forget_verified(credentials)
+    if FETCH_BACKEND == 'library' and opower_client.is_available():
+        opower_client.get_client().forget(credentials)
+
+def is_verified(credentials):
+    """Return True if the utility accepted a credential within VERIFIED_LOGIN_TTL seconds"""
+    key = opower_client.credential_key(credentials)
+    with _verified_lock:
+        verified_at = _verified_logins.get(key)
+        if verified_at is None:
+            return False
+        if time.monotonic() - verified_at > VERIFIED_LOGIN_TTL:
+            del _verified_logins[key]
+            return False
+        return True
+
+def authenticate(credentials):
+    """Make sure the utility accepts a credential before its stored intervals are served.
+
+    The interval store is keyed by utility and username only, so a range
+    it can answer without fetching must not be returned to a caller with
+    the wrong password. The subprocess backend can only check by fetching
+    a day.
+    """
+    if is_verified(credentials):
+        return
+    try:
+        if FETCH_BACKEND == 'library' and opower_client.is_available():
+            opower_client.get_client().validate(credentials)
         else:
-            logger.error("No data received from command")
-            raise Exception("No data received from command")
+            end_date = datetime.now(pytz.UTC)
+            run_opower_command(credentials, end_date - timedelta(days=1), end_date)
+    except Exception:
+        forget_verified(credentials)
+        raise
+    mark_verified(credentials)
+
+def slice_date_range(df, start_day, end_day):
+    """Keep the rows of a fetched frame that start between two dates (inclusive)"""
+    if df.empty:
+        return df
+    start_times = pd.to_datetime(df['start_time'], utc=True)
+    lower = pd.Timestamp(start_day, tz='UTC')
+    upper = pd.Timestamp(end_day, tz='UTC') + pd.Timedelta(days=1)
+    return df[(start_times >= lower) & (start_times < upper)].reset_index(drop=True)
+
+def plan_date_range(start_date, end_date, credentials):
+    """Return the chunks load_date_range will request from the utility"""
+    if USE_INTERVAL_STORE:
+        ranges = interval_store.get_interval_store().missing_ranges(credentials, start_date, end_date)
+    else:
+        ranges = [(start_date, end_date)]
+    return [
+        chunk
+        for fetch_start, fetch_end in ranges
+        for chunk in fetch_scheduler.split_range(fetch_start, fetch_end, FETCH_CHUNK)
+    ]
+
+def load_date_range(start_date, end_date, credentials, on_progress=None):
+    """Load a date range from the interval store, fetching only missing dates"""
+    if not USE_INTERVAL_STORE:
+        fetched = fetch_range_chunks(credentials, start_date, end_date, on_progress=on_progress)
+        get_rollup(credentials).update(fetched)
+        return fetched
+    
+    # Only ask the utility for dates the local store does not have yet
+    store = interval_store.get_interval_store()
+    ranges = store.missing_ranges(credentials, start_date, end_date)
+    if not ranges:
+        authenticate(credentials)
+    for fetch_start, fetch_end in ranges:
+        logger.debug(f"Syncing intervals from {fetch_start} to {fetch_end}")
+        fetched = fetch_range_chunks(credentials, fetch_start, fetch_end, on_progress=on_progress)
+        mark_verified(credentials)
+        save_synced_range(store, credentials, fetched, fetch_start, fetch_end)
+    
+    return as_interval_frame(store.load(credentials, start_date, end_date))
+
+async def async_get_data_by_date_range(start_date, end_date, credentials):
+    """Awaitable get_data_by_date_range; the utility is queried without blocking the event loop"""
+    try:
+        cache_key = response_cache_key(start_date, end_date, credentials)
+        cached = RESPONSE_CACHE.get(
+            cache_key, refresh=lambda: load_date_range_once(start_date, end_date, credentials))
+        if cached is not None:
+            return cached
+        
+        df = await IN_FLIGHT_FETCHES.async_do(
+            opower_client.credential_key(credentials),
+            start_date.date(),
+            end_date.date(),
+            lambda: async_load_date_range(start_date, end_date, credentials),
+            narrow=slice_date_range
+        )
+        RESPONSE_CACHE.put(cache_key, df)
+        return df
             
     except Exception as e:
-        logger.error(f"Error in get_data_by_date_range: {str(e)}")
+        logger.error(f"Error in async_get_data_by_date_range: {str(e)}")
         raise
 
+async def async_load_date_range(start_date, end_date, credentials):
+    """Awaitable load_date_range; SQLite and rollup work runs in a thread so the event loop stays free"""
+    if not USE_INTERVAL_STORE:
+        fetched = await async_fetch_range_chunks(credentials, start_date, end_date)
+        await asyncio.to_thread(lambda: get_rollup(credentials).update(fetched))
+        return fetched
+    
+    store = interval_store.get_interval_store()
+    ranges = await asyncio.to_thread(store.missing_ranges, credentials, start_date, end_date)
+    if not ranges:
+        await asyncio.to_thread(authenticate, credentials)
+    for fetch_start, fetch_end in ranges:
+        logger.debug(f"Syncing intervals from {fetch_start} to {fetch_end}")
+        fetched = await async_fetch_range_chunks(credentials, fetch_start, fetch_end)
+        mark_verified(credentials)
+        await asyncio.to_thread(save_synced_range, store, credentials, fetched, fetch_start, fetch_end)
+    
+    stored = await asyncio.to_thread(store.load, credentials, start_date, end_date)
+    return as_interval_frame(stored)
+
+def save_synced_range(store, credentials, fetched, fetch_start, fetch_end):
+    """Upsert a fetched range into the store, mark it synced and fold it into the rollup"""
+    store.save(credentials, fetched)
+    store.mark_synced(credentials, fetch_start, fetch_end)
+    get_rollup(credentials).update(fetched)
+
+def get_rollup(credentials):
+    """Return the rollup cube of a credential, seeding it from the interval store on first use.
+
+    The module lock only guards the LRU lookup and insert. Seeding reads
+    the credential's whole synced window, so it runs under a lock of its
+    own and only callers of the same credential wait for it.
+    """
+    key = opower_client.credential_key(credentials)
+    with _rollups_lock:
+        cube = ROLLUPS.get(key)
+        if cube is not None:
+            ROLLUPS.move_to_end(key)
+            return cube
+        seed_lock = _seed_locks.setdefault(key, threading.Lock())
+    with seed_lock:
+        with _rollups_lock:
+            cube = ROLLUPS.get(key)
+        if cube is not None:
+            return cube
+        cube = rollups.RollupCube()
+        if USE_INTERVAL_STORE:
+            store = interval_store.get_interval_store()
+            window = store.synced_window(credentials)
+            if window is not None:
+                cube.update(store.load(credentials, *window))
+        with _rollups_lock:
+            ROLLUPS[key] = cube
+            _seed_locks.pop(key, None)
+            while len(ROLLUPS) > MAX_ROLLUPS:
+                ROLLUPS.popitem(last=False)
+        return cube
+
 def extract_account_info(line):
     """Extract account information from the opower output header line"""
     try:
@@ -194,8 +595,10 @@ def extract_account_info(line):
         if "Customer(uuid='" in line:
             account_info['customer_uuid'] = line.split("Customer(uuid='")[1].split("'")[0]
         
-        # Extract account UUID
-        if "uuid='" in line:
+        # Extract account UUID (the first uuid= belongs to the nested Customer)
+        if "), uuid='" in line:
+            account_info['account_uuid'] = line.split("), uuid='")[1].split("'")[0]
+        elif "uuid='" in line:
             account_info['account_uuid'] = line.split("uuid='")[1].split("'")[0]
         
         return account_info
@@ -203,39 +606,20 @@ def extract_account_info(line):
         logger.error(f"Error extracting account info: {str(e)}")
         return None
 
-def process_data_lines(header, data_lines, account_info):
-    """Process data lines for a single account"""
-    try:
-        if not header or len(data_lines) == 0 or not account_info:
-            return pd.DataFrame()
-        
-        data_str = header + '\n' + '\n'.join(data_lines)
-        df = pd.read_csv(
-            StringIO(data_str), 
-            delimiter='\t',
-            parse_dates=['start_time', 'end_time']
-        )
-        
-        if not df.empty:
-            # Add account information
-            df['account_id'] = account_info['utility_account_id']
-            df['customer_uuid'] = account_info['customer_uuid']
-            df['account_uuid'] = account_info['account_uuid']
-            
-            # Add a friendly account name
-            df['account_name'] = f"Account {account_info['utility_account_id']}"
-        
-        return df
-    except Exception as e:
-        logger.error(f"Error processing data lines: {str(e)}")
-        return pd.DataFrame()
+def parse_data_file(file_path):
+    """Parse a tab-delimited export into start_time, end_time (naive UTC), consumption and provided_cost"""
+    energy_data = pd.read_csv(
+        file_path, delimiter='\t', usecols=list(dat_cache.SIDECAR_COLUMNS),
+        dtype={'start_time': str, 'end_time': str, 'consumption': np.float64, 'provided_cost': np.float64},
+        na_values=['None']
+    )
+    for column in dat_cache.TIME_COLUMNS:
+        energy_data[column] = pd.to_datetime(energy_data[column], format=TIMESTAMP_FORMAT, utc=True).dt.tz_convert(None).dt.as_unit('ns')
+    return energy_data
 
 def load_data(file_path):
-    """Load data from a CSV file (kept for backward compatibility)"""
-    energy_data = pd.read_csv(file_path, delimiter='\t', parse_dates=['start_time', 'end_time'])
-    energy_data['start_time'] = pd.to_datetime(energy_data['start_time'], utc=True).dt.tz_convert(None)
-    energy_data['end_time'] = pd.to_datetime(energy_data['end_time'], utc=True).dt.tz_convert(None)
-    return energy_data
+    """Load data from a CSV file (kept for backward compatibility), from its binary sidecar after the first read"""
+    return dat_cache.load(file_path, parse_data_file)
 
 def resample_energy_data(energy_data, frequency):
     """Resample energy data to a specified frequency"""
@@ -245,15 +629,12 @@ def resample_energy_data(energy_data, frequency):
     })
     return resampled_data
 
-def get_current_year_data(credentials):
+def get_current_year_data(credentials, revalidate=True):
     """Get energy consumption data for the current year"""
     try:
-        # Get current year's start and today's date
-        current_year = datetime.now(pytz.UTC).year
-        start_date = datetime(current_year, 1, 1, tzinfo=pytz.UTC)
-        end_date = datetime.now(pytz.UTC)
+        start_date, end_date = year_to_date_range()
         logger.debug(f"Fetching current year data from {start_date} to {end_date}")
-        return run_opower_command(credentials, start_date, end_date)
+        return get_data_by_date_range(start_date, end_date, credentials, revalidate=revalidate)
     except Exception as e:
         logger.error(f"Error in get_current_year_data: {str(e)}")
         raise
@@ -261,39 +642,16 @@ def get_current_year_data(credentials):
 def get_quarterly_data(credentials):
     """Get energy consumption data for each quarter of the current year"""
     try:
-        # Get current year
-        current_year = datetime.now(pytz.UTC).year
-        all_quarterly_data = []
-        
-        # Define quarters
-        quarters = [
-            (datetime(current_year, 1, 1, tzinfo=pytz.UTC), datetime(current_year, 3, 31, tzinfo=pytz.UTC)),
-            (datetime(current_year, 4, 1, tzinfo=pytz.UTC), datetime(current_year, 6, 30, tzinfo=pytz.UTC)),
-            (datetime(current_year, 7, 1, tzinfo=pytz.UTC), datetime(current_year, 9, 30, tzinfo=pytz.UTC)),
-            (datetime(current_year, 10, 1, tzinfo=pytz.UTC), datetime(current_year, 12, 31, tzinfo=pytz.UTC))
-        ]
-        
-        # Fetch data for each quarter
-        for i, (start_date, end_date) in enumerate(quarters, 1):
-            # Only fetch data for quarters that have already started
-            if start_date > datetime.now(pytz.UTC):
-                continue
-                
-            try:
-                quarter_data = run_opower_command(credentials, start_date, end_date)
-                if not quarter_data.empty:
-                    quarter_data['quarter'] = f'Q{i}'
-                    all_quarterly_data.append(quarter_data)
-            except Exception as e:
-                logger.error(f"Error fetching data for Q{i}: {str(e)}")
+        # The year-to-date range is fetched as concurrent quarter chunks
+        start_date, end_date = year_to_date_range()
+        logger.debug(f"Fetching quarterly data from {start_date} to {end_date}")
+        quarterly_data = get_data_by_date_range(start_date, end_date, credentials)
+        if quarterly_data.empty:
+            return pd.DataFrame()
         
-        # Combine all quarterly data
-        if all_quarterly_data:
-            return pd.concat(all_quarterly_data, ignore_index=True)
-        return pd.DataFrame()
+        quarterly_data['quarter'] = 'Q' + pd.to_datetime(quarterly_data['start_time'], utc=True).dt.quarter.astype(str)
+        return quarterly_data
         
     except Exception as e:
         logger.error(f"Error in get_quarterly_data: {str(e)}")
         raise
-
-
@@ -0,0 +1,70 @@
+import numpy as np
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+METHODS = ['lttb', 'minmax']
+
+
+def lttb(x, y, n_out):
+    """Return the indices of n_out points picked by Largest-Triangle-Three-Buckets.
+
+    The first and last points are kept. Every bucket in between keeps the
+    point forming the largest triangle with the point kept before it and
+    the average of the next bucket, which preserves the visual shape.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    xf = np.asarray(x, dtype=np.float64)
+    yf = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        if bucket + 2 < len(edges):
+            next_start, next_end = edges[bucket + 1], edges[bucket + 2]
+        else:
+            next_start, next_end = n - 1, n
+        average_x = xf[next_start:next_end].mean()
+        average_y = yf[next_start:next_end].mean()
+        area = np.abs(
+            (xf[previous] - average_x) * (yf[start:end] - yf[previous])
+            - (xf[previous] - xf[start:end]) * (average_y - yf[previous])
+        )
+        previous = start + int(np.argmax(area))
+        indices[bucket + 1] = previous
+    return indices
+
+
+def minmax(x, y, n_out):
+    """Return the indices of the minimum and maximum point of n_out / 2 equal buckets, in order"""
+    n = len(x)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    yf = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(0, n, n_out // 2 + 1).astype(np.int64)
+    picked = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            picked.append(start + int(np.argmin(yf[start:end])))
+            picked.append(start + int(np.argmax(yf[start:end])))
+    return np.unique(picked)
+
+
+def downsample(x, y, n_out, method='lttb'):
+    """Reduce a series to about n_out points; x may be datetimes and NaN values are dropped"""
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {', '.join(METHODS)}")
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    valid = ~np.isnan(y)
+    x, y = x[valid], y[valid]
+    numeric_x = x.astype('datetime64[ns]').astype(np.int64) if np.issubdtype(x.dtype, np.datetime64) else x
+    pick = lttb if method == 'lttb' else minmax
+    indices = pick(numeric_x, y, n_out)
+    return x[indices], y[indices]
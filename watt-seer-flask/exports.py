@@ -0,0 +1,80 @@
+import logging
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # Arrow and Parquet exports are disabled
+    pa = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Rows serialized per streamed chunk
+CHUNK_ROWS = 10000
+
+# Export format name -> response mimetype
+EXPORT_FORMATS = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+# Formats that need pyarrow
+ARROW_FORMATS = ('arrow', 'parquet')
+
+
+def negotiate_format(accept_mimetypes, requested=None):
+    """Pick an export format from an explicit request or the Accept header"""
+    if requested:
+        if requested not in EXPORT_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+        return requested
+    mimetypes = {mimetype: name for name, mimetype in EXPORT_FORMATS.items()}
+    best = accept_mimetypes.best_match(list(EXPORT_FORMATS.values()), default='application/json')
+    return mimetypes.get(best, 'json')
+
+
+def arrow_available():
+    """Return True if Arrow IPC and Parquet exports can be produced"""
+    return pa is not None
+
+
+def to_arrow_table(df):
+    """Convert a frame to an Arrow table without copying its numeric buffers"""
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def arrow_ipc_bytes(df):
+    """Serialize a frame as an Arrow IPC stream"""
+    table = to_arrow_table(df)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table, max_chunksize=CHUNK_ROWS)
+    return sink.getvalue().to_pybytes()
+
+
+def parquet_bytes(df):
+    """Serialize a frame as a Parquet file"""
+    sink = pa.BufferOutputStream()
+    pa.parquet.write_table(to_arrow_table(df), sink)
+    return sink.getvalue().to_pybytes()
+
+
+def iter_ndjson(df, chunk_rows=CHUNK_ROWS):
+    """Yield a frame as newline-delimited JSON, one chunk of rows at a time"""
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        yield chunk.to_json(orient='records', lines=True, date_format='iso') + '\n'
+
+
+def iter_csv(df, chunk_rows=CHUNK_ROWS):
+    """Yield a frame as CSV, writing the header with the first chunk only"""
+    if df.empty:
+        yield df.to_csv(index=False)
+        return
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        yield chunk.to_csv(index=False, header=start == 0)
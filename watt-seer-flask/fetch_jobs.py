@@ -0,0 +1,217 @@
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import pytz
+import sqlite3
+import threading
+import pickle
+import uuid
+import time
+import os
+import logging
+import data_fetcher
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Default location of the job database
+DEFAULT_JOBS_PATH = os.environ.get(
+    'WATT_SEER_JOBS',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'jobs.sqlite3')
+)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    utility TEXT NOT NULL,
+    username TEXT NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    result BLOB
+);
+CREATE TABLE IF NOT EXISTS job_chunks (
+    job_id TEXT NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    status TEXT NOT NULL,
+    PRIMARY KEY (job_id, chunk_index)
+) WITHOUT ROWID;
+"""
+
+
+class FetchJobQueue:
+    """Run date range fetches in the background and keep their results for a while.
+
+    Jobs and their per-chunk progress are persisted in SQLite so status and
+    results survive a restart. Credentials are only held in memory by the
+    worker running the job, so jobs still queued or running when the process
+    stops are marked as failed on the next start.
+    """
+
+    def __init__(self, path=DEFAULT_JOBS_PATH, workers=2, result_ttl=3600):
+        self.path = path
+        self.result_ttl = result_ttl
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+        with self._conn:
+            self._conn.execute(
+                'UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status IN (?, ?)',
+                (FAILED, 'Interrupted by a restart', time.time(), QUEUED, RUNNING)
+            )
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fetch-job')
+
+    def close(self):
+        """Stop accepting jobs, wait for running ones and close the database"""
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self._conn.close()
+
+    def submit(self, credentials, start_date, end_date):
+        """Queue a fetch of a date range and return its job id"""
+        self.purge_expired()
+        job_id = uuid.uuid4().hex
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT INTO jobs (job_id, utility, username, start_date, end_date, status, created_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, credentials['utility'], credentials['username'],
+                 start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'), QUEUED, time.time())
+            )
+        self._executor.submit(self._run, job_id, dict(credentials), start_date, end_date)
+        logger.debug(f"Queued fetch job {job_id} for {start_date} to {end_date}")
+        return job_id
+
+    def status(self, job_id):
+        """Return the state and per-chunk progress of a job, or None if it is unknown or expired"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT start_date, end_date, status, error, created_at, finished_at FROM jobs WHERE job_id = ?',
+                (job_id,)
+            ).fetchone()
+            chunks = self._conn.execute(
+                'SELECT start_date, end_date, status FROM job_chunks WHERE job_id = ? ORDER BY chunk_index',
+                (job_id,)
+            ).fetchall()
+        if row is None or self._expired(row[5]):
+            return None
+        start_date, end_date, status, error, created_at, finished_at = row
+        return {
+            'job_id': job_id,
+            'status': status,
+            'start_date': start_date,
+            'end_date': end_date,
+            'error': error,
+            'created_at': _isoformat(created_at),
+            'finished_at': _isoformat(finished_at),
+            'expires_at': _isoformat(finished_at + self.result_ttl if finished_at else None),
+            'chunks_total': len(chunks),
+            'chunks_done': sum(1 for chunk in chunks if chunk[2] == DONE),
+            'chunks': [
+                {'start_date': chunk_start, 'end_date': chunk_end, 'status': chunk_status}
+                for chunk_start, chunk_end, chunk_status in chunks
+            ]
+        }
+
+    def result(self, job_id):
+        """Return the frame fetched by a finished job, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT result, finished_at FROM jobs WHERE job_id = ? AND status = ?',
+                (job_id, DONE)
+            ).fetchone()
+        if row is None or row[0] is None or self._expired(row[1]):
+            return None
+        return pickle.loads(row[0])
+
+    def purge_expired(self):
+        """Delete finished jobs whose results are older than the TTL"""
+        cutoff = time.time() - self.result_ttl
+        with self._lock, self._conn:
+            self._conn.execute(
+                'DELETE FROM job_chunks WHERE job_id IN (SELECT job_id FROM jobs WHERE finished_at < ?)',
+                (cutoff,)
+            )
+            deleted = self._conn.execute('DELETE FROM jobs WHERE finished_at < ?', (cutoff,)).rowcount
+        if deleted:
+            logger.debug(f"Purged {deleted} expired fetch jobs")
+        return deleted
+
+    def _run(self, job_id, credentials, start_date, end_date):
+        """Fetch a job's range, recording each chunk as it completes"""
+        try:
+            chunks = data_fetcher.plan_date_range(start_date, end_date, credentials)
+            with self._lock, self._conn:
+                self._conn.execute('UPDATE jobs SET status = ? WHERE job_id = ?', (RUNNING, job_id))
+                self._conn.executemany(
+                    'INSERT INTO job_chunks (job_id, chunk_index, start_date, end_date, status) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    [(job_id, index, chunk_start.strftime('%Y-%m-%d'), chunk_end.strftime('%Y-%m-%d'), QUEUED)
+                     for index, (chunk_start, chunk_end) in enumerate(chunks)]
+                )
+
+            def on_progress(index, chunk):
+                with self._lock, self._conn:
+                    self._conn.execute(
+                        'UPDATE job_chunks SET status = ? WHERE job_id = ? AND start_date = ? AND end_date = ?',
+                        (DONE, job_id, chunk[0].strftime('%Y-%m-%d'), chunk[1].strftime('%Y-%m-%d'))
+                    )
+
+            df = data_fetcher.load_date_range(start_date, end_date, credentials, on_progress=on_progress)
+            # A later /energy/range request for the same dates is answered from the cache
+            data_fetcher.RESPONSE_CACHE.put(data_fetcher.response_cache_key(start_date, end_date, credentials), df)
+            with self._lock, self._conn:
+                # Chunks another request synced in the meantime were not fetched by this job
+                self._conn.execute('UPDATE job_chunks SET status = ? WHERE job_id = ?', (DONE, job_id))
+                self._conn.execute(
+                    'UPDATE jobs SET status = ?, finished_at = ?, result = ? WHERE job_id = ?',
+                    (DONE, time.time(), pickle.dumps(df), job_id)
+                )
+            logger.debug(f"Fetch job {job_id} finished with {len(df)} rows")
+        except Exception as e:
+            logger.error(f"Fetch job {job_id} failed: {str(e)}")
+            with self._lock, self._conn:
+                self._conn.execute(
+                    'UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE job_id = ?',
+                    (FAILED, str(e), time.time(), job_id)
+                )
+
+    def _expired(self, finished_at):
+        return finished_at is not None and time.time() - finished_at > self.result_ttl
+
+
+def _isoformat(timestamp):
+    """Format epoch seconds as an ISO 8601 UTC string"""
+    if timestamp is None:
+        return None
+    return datetime.fromtimestamp(timestamp, tz=pytz.UTC).isoformat()
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the process-wide fetch job queue, opening it on first use"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = FetchJobQueue(
+                DEFAULT_JOBS_PATH,
+                workers=int(os.environ.get('WATT_SEER_JOB_WORKERS', '2')),
+                result_ttl=float(os.environ.get('WATT_SEER_JOB_TTL', '3600'))
+            )
+        return _queue
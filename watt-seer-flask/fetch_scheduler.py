@@ -0,0 +1,158 @@
+import pandas as pd
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from dateutil.relativedelta import relativedelta
+import pytz
+import asyncio
+import threading
+import random
+import time
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Columns identifying one interval when reassembling chunks
+INTERVAL_KEY = ['account_uuid', 'start_time']
+
+
+def _chunk_start(day, chunk):
+    """Return the start of the chunk containing a date"""
+    if chunk == 'month':
+        return day.replace(day=1)
+    if chunk == 'quarter':
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    return day
+
+
+def _chunk_step(chunk):
+    """Return the length of one chunk"""
+    if chunk == 'month':
+        return relativedelta(months=1)
+    if chunk == 'quarter':
+        return relativedelta(months=3)
+    if isinstance(chunk, timedelta):
+        return chunk
+    return timedelta(days=int(chunk))
+
+
+def split_range(start_date, end_date, chunk='quarter'):
+    """Split a date range into consecutive (start, end) chunks.
+
+    chunk is 'month', 'quarter', a number of days or a timedelta. Calendar
+    chunks are aligned to month or quarter starts. Neighbouring chunks share
+    their boundary day; reassembly drops the duplicate intervals.
+    """
+    start = datetime(start_date.year, start_date.month, start_date.day, tzinfo=pytz.UTC)
+    end = datetime(end_date.year, end_date.month, end_date.day, tzinfo=pytz.UTC)
+    step = _chunk_step(chunk)
+    chunks = []
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(_chunk_start(chunk_start, chunk) + step, end)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end
+    return chunks or [(start, end)]
+
+
+def reassemble(frames):
+    """Concatenate chunk results in order and drop intervals repeated at chunk boundaries"""
+    frames = [frame for frame in frames if frame is not None and not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+    key = [column for column in INTERVAL_KEY if column in df.columns]
+    if 'start_time' in key:
+        key = key if 'account_uuid' in key else ['account_name', 'start_time']
+        df = df.drop_duplicates(subset=key, keep='last')
+        df = df.sort_values(key).reset_index(drop=True)
+    # Categoricals with different categories concatenate to plain objects
+    for column in df.columns:
+        if column in frames[0].columns and isinstance(frames[0][column].dtype, pd.CategoricalDtype) and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    return df
+
+
+class FetchScheduler:
+    """Run range chunks concurrently with a per-utility limit and per-chunk retries"""
+
+    def __init__(self, max_workers=8, per_utility_limit=4, retries=2, backoff=1.0, no_retry=()):
+        self.per_utility_limit = per_utility_limit
+        self.retries = retries
+        self.backoff = backoff
+        self.no_retry = tuple(no_retry)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fetch-chunk')
+        self._limits = {}
+        self._async_limits = {}
+        self._limits_lock = threading.Lock()
+
+    def fetch_chunks(self, credentials, chunks, fetch, on_progress=None):
+        """Call fetch(credentials, start, end) for every chunk and reassemble the results in order"""
+        if len(chunks) == 1:
+            frames = [self._fetch_with_retry(credentials, chunks[0], fetch)]
+            if on_progress:
+                on_progress(0, chunks[0])
+            return reassemble(frames)
+
+        futures = [
+            self._executor.submit(self._fetch_with_retry, credentials, chunk, fetch)
+            for chunk in chunks
+        ]
+        frames = []
+        for index, future in enumerate(futures):
+            frames.append(future.result())
+            if on_progress:
+                on_progress(index, chunks[index])
+        return reassemble(frames)
+
+    async def async_fetch_chunks(self, credentials, chunks, fetch):
+        """Await fetch(credentials, start, end) for every chunk concurrently and reassemble the results"""
+        frames = await asyncio.gather(*(
+            self._async_fetch_with_retry(credentials, chunk, fetch) for chunk in chunks
+        ))
+        return reassemble(frames)
+
+    def _limit(self, utility):
+        with self._limits_lock:
+            if utility not in self._limits:
+                self._limits[utility] = threading.BoundedSemaphore(self.per_utility_limit)
+            return self._limits[utility]
+
+    def _fetch_with_retry(self, credentials, chunk, fetch):
+        start_date, end_date = chunk
+        attempt = 0
+        while True:
+            try:
+                with self._limit(credentials['utility']):
+                    return fetch(credentials, start_date, end_date)
+            except Exception as e:
+                if attempt >= self.retries or isinstance(e, self.no_retry):
+                    logger.error(f"Chunk {start_date:%Y-%m-%d} to {end_date:%Y-%m-%d} failed: {str(e)}")
+                    raise
+                delay = self.backoff * (2 ** attempt) * (1 + random.random() / 2)
+                logger.debug(f"Retrying chunk {start_date:%Y-%m-%d} to {end_date:%Y-%m-%d} in {delay:.1f}s: {str(e)}")
+                time.sleep(delay)
+                attempt += 1
+
+    def _async_limit(self, utility):
+        loop = asyncio.get_running_loop()
+        key = (id(loop), utility)
+        if key not in self._async_limits:
+            self._async_limits[key] = asyncio.Semaphore(self.per_utility_limit)
+        return self._async_limits[key]
+
+    async def _async_fetch_with_retry(self, credentials, chunk, fetch):
+        start_date, end_date = chunk
+        attempt = 0
+        while True:
+            try:
+                async with self._async_limit(credentials['utility']):
+                    return await fetch(credentials, start_date, end_date)
+            except Exception as e:
+                if attempt >= self.retries or isinstance(e, self.no_retry):
+                    logger.error(f"Chunk {start_date:%Y-%m-%d} to {end_date:%Y-%m-%d} failed: {str(e)}")
+                    raise
+                delay = self.backoff * (2 ** attempt) * (1 + random.random() / 2)
+                logger.debug(f"Retrying chunk {start_date:%Y-%m-%d} to {end_date:%Y-%m-%d} in {delay:.1f}s: {str(e)}")
+                await asyncio.sleep(delay)
+                attempt += 1
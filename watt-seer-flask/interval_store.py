@@ -0,0 +1,226 @@
+import pandas as pd
+from datetime import datetime, date, timedelta
+import pytz
+import sqlite3
+import threading
+import os
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Default location of the on-disk interval store
+DEFAULT_STORE_PATH = os.environ.get(
+    'WATT_SEER_STORE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'intervals.sqlite3')
+)
+
+# Accounts whose last interval is this many days older than the newest
+# account's are dormant (closed or moved) and no longer hold back the sync
+STALE_ACCOUNT_DAYS = int(os.environ.get('WATT_SEER_STALE_ACCOUNT_DAYS', 7))
+
+# Columns kept for every stored interval
+INTERVAL_COLUMNS = [
+    'start_time', 'end_time', 'consumption', 'provided_cost',
+    'account_id', 'customer_uuid', 'account_uuid', 'account_name'
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS intervals (
+    utility TEXT NOT NULL,
+    username TEXT NOT NULL,
+    account_uuid TEXT NOT NULL,
+    month TEXT NOT NULL,
+    start_time INTEGER NOT NULL,
+    end_time INTEGER NOT NULL,
+    account_id TEXT,
+    customer_uuid TEXT,
+    consumption REAL,
+    provided_cost REAL,
+    PRIMARY KEY (utility, username, account_uuid, start_time)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS intervals_by_month
+    ON intervals (utility, username, month);
+CREATE TABLE IF NOT EXISTS sync_state (
+    utility TEXT NOT NULL,
+    username TEXT NOT NULL,
+    synced_from TEXT NOT NULL,
+    synced_to TEXT NOT NULL,
+    PRIMARY KEY (utility, username)
+);
+"""
+
+
+def _to_day(value):
+    """Normalize a datetime or date to a date in UTC"""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(pytz.UTC)
+        return value.date()
+    return value
+
+
+def _day_start(day):
+    """Return the UTC midnight of a date as a timezone-aware datetime"""
+    return datetime(day.year, day.month, day.day, tzinfo=pytz.UTC)
+
+
+def _epoch_seconds(series):
+    """Convert a series of timestamps to integer seconds since the epoch (UTC)"""
+    timestamps = pd.to_datetime(series, utc=True)
+    return (timestamps - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)
+
+
+class IntervalStore:
+    """SQLite-backed store of hourly intervals keyed by utility, username and account.
+
+    Past intervals never change, so each (utility, username) keeps a synced
+    window and a per-account high-water mark. Only dates outside the window,
+    or after the last stored interval, need to be fetched from the utility.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        """Close the underlying database connection"""
+        with self._lock:
+            self._conn.close()
+
+    def high_water_marks(self, credentials):
+        """Return the start time of the last stored interval for each account"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT account_uuid, MAX(start_time) FROM intervals '
+                'WHERE utility = ? AND username = ? GROUP BY account_uuid',
+                (credentials['utility'], credentials['username'])
+            ).fetchall()
+        return {
+            account_uuid: datetime.fromtimestamp(start_time, tz=pytz.UTC)
+            for account_uuid, start_time in rows
+        }
+
+    def synced_window(self, credentials):
+        """Return the (first, last) dates already requested from the utility, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT synced_from, synced_to FROM sync_state WHERE utility = ? AND username = ?',
+                (credentials['utility'], credentials['username'])
+            ).fetchone()
+        if row is None:
+            return None
+        return date.fromisoformat(row[0]), date.fromisoformat(row[1])
+
+    def missing_ranges(self, credentials, start_date, end_date):
+        """Return the (start, end) datetime ranges that still have to be fetched"""
+        start_day = _to_day(start_date)
+        end_day = _to_day(end_date)
+        window = self.synced_window(credentials)
+        if window is None:
+            return [(_day_start(start_day), _day_start(end_day))]
+
+        synced_from, synced_to = window
+        ranges = []
+        if start_day < synced_from:
+            ranges.append((_day_start(start_day), _day_start(synced_from)))
+
+        # Resume from the day of the oldest per-account high-water mark so a
+        # partially published last day is fetched again and upserted.
+        # Dormant accounts are left out so they do not pin the resume day.
+        marks = [_to_day(mark) for mark in self.high_water_marks(credentials).values()]
+        if marks:
+            cutoff = max(marks) - timedelta(days=STALE_ACCOUNT_DAYS)
+            resume_day = min(mark for mark in marks if mark >= cutoff)
+        else:
+            resume_day = synced_from
+        resume_day = min(resume_day, synced_to)
+        if end_day > resume_day:
+            ranges.append((_day_start(resume_day), _day_start(end_day)))
+        return ranges
+
+    def save(self, credentials, df):
+        """Upsert fetched intervals for a credential"""
+        if df is None or df.empty:
+            return 0
+        start_seconds = _epoch_seconds(df['start_time'])
+        end_seconds = _epoch_seconds(df['end_time'])
+        months = pd.to_datetime(df['start_time'], utc=True).dt.strftime('%Y-%m')
+        provided_cost = df['provided_cost'] if 'provided_cost' in df.columns else pd.Series(None, index=df.index)
+        rows = list(zip(
+            [credentials['utility']] * len(df),
+            [credentials['username']] * len(df),
+            df['account_uuid'].astype(str),
+            months,
+            start_seconds.tolist(),
+            end_seconds.tolist(),
+            df['account_id'].astype(str),
+            df['customer_uuid'].astype(str),
+            df['consumption'].astype(float).tolist(),
+            pd.to_numeric(provided_cost, errors='coerce').tolist()
+        ))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO intervals (utility, username, account_uuid, month, start_time, '
+                'end_time, account_id, customer_uuid, consumption, provided_cost) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+        logger.debug(f"Stored {len(rows)} intervals for {credentials['username']}")
+        return len(rows)
+
+    def mark_synced(self, credentials, start_date, end_date):
+        """Extend the synced window to cover the given dates"""
+        start_day = _to_day(start_date)
+        # Dates in the future have not been published yet
+        end_day = min(_to_day(end_date), datetime.now(pytz.UTC).date())
+        if start_day > end_day:
+            return
+        window = self.synced_window(credentials)
+        if window is not None:
+            start_day = min(start_day, window[0])
+            end_day = max(end_day, window[1])
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO sync_state (utility, username, synced_from, synced_to) '
+                'VALUES (?, ?, ?, ?)',
+                (credentials['utility'], credentials['username'], start_day.isoformat(), end_day.isoformat())
+            )
+
+    def load(self, credentials, start_date, end_date):
+        """Load stored intervals between two dates (end date inclusive)"""
+        start_seconds = int(_day_start(_to_day(start_date)).timestamp())
+        end_seconds = int((_day_start(_to_day(end_date)) + timedelta(days=1)).timestamp())
+        with self._lock:
+            df = pd.read_sql_query(
+                'SELECT start_time, end_time, consumption, provided_cost, account_id, customer_uuid, account_uuid '
+                'FROM intervals WHERE utility = ? AND username = ? AND start_time >= ? AND start_time < ? '
+                'ORDER BY account_uuid, start_time',
+                self._conn,
+                params=(credentials['utility'], credentials['username'], start_seconds, end_seconds)
+            )
+        if df.empty:
+            return pd.DataFrame(columns=INTERVAL_COLUMNS)
+        df['start_time'] = pd.to_datetime(df['start_time'], unit='s', utc=True)
+        df['end_time'] = pd.to_datetime(df['end_time'], unit='s', utc=True)
+        df['account_name'] = 'Account ' + df['account_id']
+        return df[INTERVAL_COLUMNS]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_interval_store():
+    """Return the process-wide interval store, opening it on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = IntervalStore(DEFAULT_STORE_PATH)
+        return _store
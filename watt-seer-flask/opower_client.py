@@ -0,0 +1,232 @@
+import pandas as pd
+import asyncio
+from collections import OrderedDict
+import threading
+import hashlib
+import atexit
+import os
+import logging
+
+try:
+    import aiohttp
+    from opower import Opower, AggregateType, InvalidAuth, create_cookie_jar
+    from opower.exceptions import ApiException
+    from opower import MfaChallenge
+    # Errors that another attempt with the same credentials cannot fix
+    NON_RETRYABLE_ERRORS = (InvalidAuth, MfaChallenge)
+except ImportError:  # The subprocess backend is used instead
+    Opower = None
+    NON_RETRYABLE_ERRORS = ()
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a single fetch before giving up
+FETCH_TIMEOUT = 300
+
+# Seconds to wait for a login check
+LOGIN_TIMEOUT = 60
+
+# Logged-in sessions kept at most; the least recently used idle ones are closed first
+MAX_LOGINS = int(os.environ.get('WATT_SEER_MAX_LOGINS', 256))
+
+# Columns produced for every interval, matching the parsed command line output
+READ_COLUMNS = [
+    'start_time', 'end_time', 'consumption', 'provided_cost',
+    'account_id', 'customer_uuid', 'account_uuid', 'account_name'
+]
+
+
+def is_available():
+    """Return True if the opower library can be used in-process"""
+    return Opower is not None
+
+
+def credential_key(credentials):
+    """Return a hashable key identifying one login"""
+    password_hash = hashlib.sha256(credentials['password'].encode('utf-8')).hexdigest()
+    return credentials['utility'], credentials['username'], password_hash
+
+
+class _Login:
+    """An authenticated opower session and the accounts it can read"""
+
+    def __init__(self, http_session, opower):
+        self.http_session = http_session
+        self.opower = opower
+        self.accounts = None
+        self.generation = 0
+        self.active = 0
+        self.lock = asyncio.Lock()
+
+
+class OpowerClient:
+    """Fetch usage through the opower library on a long-lived event loop.
+
+    One logged-in session is kept per credential, so a dashboard refresh
+    does not pay for interpreter startup or a fresh utility login. Expired
+    tokens are refreshed by logging in again on the same session. Sessions
+    are dropped when a login fails, on forget() and, least recently used
+    first, beyond MAX_LOGINS.
+    """
+
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='opower-client', daemon=True)
+        self._thread.start()
+        self._logins = OrderedDict()
+        self._login_locks = {}
+
+    @property
+    def loop(self):
+        """The event loop all sessions of this client run on"""
+        return self._loop
+
+    def fetch(self, credentials, start_date, end_date):
+        """Fetch hourly reads for all accounts of a credential as a DataFrame"""
+        future = asyncio.run_coroutine_threadsafe(
+            self.async_fetch(credentials, start_date, end_date), self._loop)
+        return future.result(FETCH_TIMEOUT)
+
+    def validate(self, credentials):
+        """Log in with a credential without reading any usage; raises if the utility rejects it.
+
+        The session is kept, so the fetches that follow a successful login
+        do not log in again.
+        """
+        future = asyncio.run_coroutine_threadsafe(self._async_get_login(credentials), self._loop)
+        future.result(LOGIN_TIMEOUT)
+
+    def forget(self, credentials):
+        """Close and drop the session of a credential, e.g. when its user logs out"""
+        future = asyncio.run_coroutine_threadsafe(self._async_forget(credential_key(credentials)), self._loop)
+        future.result(LOGIN_TIMEOUT)
+
+    def close(self):
+        """Close all sessions and stop the event loop"""
+        if not self._loop.is_running():
+            return
+        future = asyncio.run_coroutine_threadsafe(self._async_close(), self._loop)
+        try:
+            future.result(10)
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def async_fetch(self, credentials, start_date, end_date):
+        """Fetch hourly reads on the client loop, logging in again if the token expired"""
+        login = await self._async_get_login(credentials, hold=True)
+        try:
+            rows = await self._async_read_with_login(credentials, login, start_date, end_date)
+        finally:
+            login.active -= 1
+        df = pd.DataFrame(rows, columns=READ_COLUMNS)
+        df['start_time'] = pd.to_datetime(df['start_time'], utc=True)
+        df['end_time'] = pd.to_datetime(df['end_time'], utc=True)
+        return df
+
+    async def _async_read_with_login(self, credentials, login, start_date, end_date):
+        """Read with a login, logging in again once if its token expired"""
+        generation = login.generation
+        try:
+            return await self._async_read_all(login, start_date, end_date)
+        except (ApiException, InvalidAuth) as e:
+            if getattr(e, 'status', 401) not in (401, 403):
+                raise
+            # Concurrent chunk reads share the session; only one of them logs in again
+            async with login.lock:
+                if login.generation == generation:
+                    logger.debug(f"Session for {credentials['username']} expired, logging in again")
+                    try:
+                        await login.opower.async_login()
+                    except Exception:
+                        await self._async_forget(credential_key(credentials))
+                        raise
+                    login.generation += 1
+            return await self._async_read_all(login, start_date, end_date)
+
+    async def _async_get_login(self, credentials, hold=False):
+        """Return the cached login for a credential, creating it if needed.
+
+        With hold=True the login is marked active so it is not evicted; the
+        caller decrements login.active when done with it.
+        """
+        key = credential_key(credentials)
+        lock = self._login_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            login = self._logins.get(key)
+            if login is not None:
+                self._logins.move_to_end(key)
+                login.active += int(hold)
+                return login
+
+            http_session = aiohttp.ClientSession(cookie_jar=create_cookie_jar())
+            opower = Opower(
+                http_session,
+                credentials['utility'],
+                credentials['username'],
+                credentials['password'],
+                credentials.get('totp_secret')
+            )
+            try:
+                await opower.async_login()
+            except Exception:
+                await http_session.close()
+                self._login_locks.pop(key, None)
+                raise
+            logger.debug(f"Logged in to {credentials['utility']} as {credentials['username']}")
+            login = _Login(http_session, opower)
+            login.active += int(hold)
+            self._logins[key] = login
+        await self._async_evict(keep=key)
+        return login
+
+    async def _async_evict(self, keep):
+        """Close the least recently used idle sessions beyond MAX_LOGINS, except the one just handed out"""
+        for key in list(self._logins):
+            if len(self._logins) <= MAX_LOGINS:
+                break
+            login = self._logins.get(key)
+            if key != keep and login is not None and login.active == 0:
+                await self._async_forget(key)
+
+    async def _async_forget(self, key):
+        login = self._logins.pop(key, None)
+        self._login_locks.pop(key, None)
+        if login is not None:
+            await login.http_session.close()
+
+    async def _async_read_all(self, login, start_date, end_date):
+        """Read hourly cost data for every account of a login"""
+        if login.accounts is None:
+            login.accounts = await login.opower.async_get_accounts()
+        rows = []
+        for account in login.accounts:
+            reads = await login.opower.async_get_cost_reads(
+                account, AggregateType.HOUR, start_date, end_date)
+            account_name = f"Account {account.utility_account_id}"
+            for read in reads:
+                rows.append((
+                    read.start_time, read.end_time, read.consumption, read.provided_cost,
+                    account.utility_account_id, account.customer.uuid, account.uuid, account_name
+                ))
+        return rows
+
+    async def _async_close(self):
+        for login in self._logins.values():
+            await login.http_session.close()
+        self._logins.clear()
+        self._login_locks.clear()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide opower client, starting its event loop on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OpowerClient()
+            atexit.register(_client.close)
+        return _client
@@ -0,0 +1,285 @@
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+import multiprocessing
+import threading
+import json
+import os
+import logging
+import data_fetcher
+import interval_store
+from rollups import period_start
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# JSON file listing the credentials of every managed household; unset disables portfolio mode
+DEFAULT_PORTFOLIO_PATH = os.environ.get('WATT_SEER_PORTFOLIO')
+
+# Groupings and statistics served by the fleet views
+GROUPINGS = ['utility', 'member', 'account']
+PERCENTILES = (0.1, 0.5, 0.9)
+
+MEMBER_COLUMNS = ['utility', 'username']
+
+
+class CredentialRegistry:
+    """Credentials of every household managed in portfolio mode, keyed by utility and username"""
+
+    def __init__(self, members=()):
+        self._members = {}
+        self._lock = threading.Lock()
+        for credentials in members:
+            self.add(credentials)
+
+    @classmethod
+    def from_file(cls, path):
+        """Load a registry from a JSON list of {utility, username, password} objects"""
+        with open(path) as f:
+            members = json.load(f)
+        logger.debug(f"Loaded {len(members)} portfolio credentials from {path}")
+        return cls(members)
+
+    def add(self, credentials):
+        """Add or replace a household's credentials"""
+        for field in ('utility', 'username', 'password'):
+            if not credentials.get(field):
+                raise ValueError(f"Portfolio credentials need a {field}")
+        with self._lock:
+            self._members[(credentials['utility'], credentials['username'])] = dict(credentials)
+
+    def remove(self, credentials):
+        """Stop managing a household"""
+        with self._lock:
+            self._members.pop((credentials['utility'], credentials['username']), None)
+
+    def members(self):
+        """Return the credentials of every household"""
+        with self._lock:
+            return [dict(credentials) for credentials in self._members.values()]
+
+    def utilities(self):
+        """Return the number of households per utility"""
+        with self._lock:
+            counts = {}
+            for utility, _ in self._members:
+                counts[utility] = counts.get(utility, 0) + 1
+            return counts
+
+    def __len__(self):
+        return len(self._members)
+
+
+def _fetch_member(credentials, start_date, end_date):
+    """Fetch one household's range in a worker process"""
+    return data_fetcher.fetch_range_chunks(credentials, start_date, end_date)
+
+
+class PortfolioFetcher:
+    """Refresh every household of a registry on a process pool.
+
+    Fetches are sharded across worker processes so parsing and reassembly
+    use every core. At most per_utility_limit households of one utility are
+    in flight at a time. Results are written to the interval store and the
+    per-household rollups by this process, and the latest fleet frame is
+    kept for the fleet views.
+    """
+
+    def __init__(self, processes=None, per_utility_limit=8):
+        self.processes = processes or os.cpu_count() or 1
+        self.per_utility_limit = per_utility_limit
+        self._executor = None
+        self._lock = threading.Lock()
+        self._frame = pd.DataFrame()
+        self._thread = None
+        self._wake = threading.Event()
+        self.refreshed_at = None
+
+    def close(self):
+        """Stop the worker processes"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
+    def refresh(self, registry, start_date, end_date):
+        """Fetch what is missing for every household and rebuild the fleet frame; return failures by member.
+
+        Each utility has its own queue of ranges. Up to per_utility_limit of
+        them are in flight per utility, and a finished fetch is stored and
+        rolled up as soon as it completes, which frees its slot for the
+        next range of the same utility.
+        """
+        members = registry.members()
+        queues = {}
+        for credentials in members:
+            for fetch_start, fetch_end in self._missing_ranges(credentials, start_date, end_date):
+                queues.setdefault(credentials['utility'], deque()).append((credentials, fetch_start, fetch_end))
+
+        pending = {}
+        running = dict.fromkeys(queues, 0)
+        fetched = {}
+        failures = {}
+        while True:
+            for utility, queue in queues.items():
+                while queue and running[utility] < self.per_utility_limit:
+                    credentials, fetch_start, fetch_end = queue.popleft()
+                    future = self._get_executor().submit(_fetch_member, credentials, fetch_start, fetch_end)
+                    pending[future] = (credentials, fetch_start, fetch_end)
+                    running[utility] += 1
+            if not pending:
+                break
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                credentials, fetch_start, fetch_end = pending.pop(future)
+                running[credentials['utility']] -= 1
+                member = (credentials['utility'], credentials['username'])
+                try:
+                    df = data_fetcher.as_interval_frame(future.result())
+                except Exception as e:
+                    logger.error(f"Portfolio fetch failed for {member[1]}: {str(e)}")
+                    failures[member] = str(e)
+                    continue
+                if data_fetcher.USE_INTERVAL_STORE:
+                    store = interval_store.get_interval_store()
+                    store.save(credentials, df)
+                    store.mark_synced(credentials, fetch_start, fetch_end)
+                else:
+                    fetched.setdefault(member, []).append(df)
+                data_fetcher.get_rollup(credentials).update(df)
+
+        frames = []
+        for credentials in members:
+            member = (credentials['utility'], credentials['username'])
+            if data_fetcher.USE_INTERVAL_STORE:
+                df = interval_store.get_interval_store().load(credentials, start_date, end_date)
+            else:
+                df = pd.concat(fetched.get(member, [pd.DataFrame()]), ignore_index=True)
+            if not df.empty:
+                frames.append(member_frame(df, credentials))
+        frame = combine_members(frames)
+        with self._lock:
+            self._frame = frame
+            self.refreshed_at = pd.Timestamp.now(tz='UTC')
+        logger.debug(f"Refreshed portfolio of {len(members)} households ({len(frame)} intervals, {len(failures)} failed)")
+        return failures
+
+    def start(self, registry, interval=3600):
+        """Refresh the year-to-date range of every household every interval seconds on a daemon thread"""
+        def loop():
+            while True:
+                try:
+                    self.refresh(registry, *data_fetcher.year_to_date_range())
+                except Exception as e:
+                    logger.error(f"Error refreshing portfolio: {str(e)}")
+                self._wake.wait(interval)
+                self._wake.clear()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=loop, name='portfolio-refresh', daemon=True)
+                self._thread.start()
+
+    def refresh_soon(self):
+        """Wake the refresh thread now instead of at its next interval"""
+        self._wake.set()
+
+    def frame(self):
+        """Return the fleet frame of the last refresh"""
+        with self._lock:
+            return self._frame
+
+    def _missing_ranges(self, credentials, start_date, end_date):
+        if data_fetcher.USE_INTERVAL_STORE:
+            return interval_store.get_interval_store().missing_ranges(credentials, start_date, end_date)
+        return [(start_date, end_date)]
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Worker processes must not inherit the opower client's event loop thread
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.processes, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+
+def member_frame(df, credentials):
+    """Reduce one household's intervals to the columns of the fleet frame"""
+    return pd.DataFrame({
+        'utility': credentials['utility'],
+        'username': credentials['username'],
+        'account_name': df['account_name'].astype(str).to_numpy(),
+        'start_time': pd.to_datetime(df['start_time'], utc=True),
+        'consumption': pd.to_numeric(df['consumption'], errors='coerce').to_numpy(dtype=np.float64),
+        'provided_cost': pd.to_numeric(df['provided_cost'], errors='coerce').to_numpy(dtype=np.float64)
+        if 'provided_cost' in df.columns else np.nan
+    })
+
+
+def combine_members(frames):
+    """Concatenate member frames with categorical identifier columns"""
+    if not frames:
+        return pd.DataFrame(columns=MEMBER_COLUMNS + ['account_name', 'start_time', 'consumption', 'provided_cost'])
+    df = pd.concat(frames, ignore_index=True)
+    for column in MEMBER_COLUMNS + ['account_name']:
+        df[column] = df[column].astype('category')
+    return df
+
+
+def portfolio_rollup(df, by='utility', resolution='month', field='consumption', percentiles=PERCENTILES):
+    """Aggregate a fleet frame per group and period with vectorized grouping.
+
+    Each account is first summed per period. Groups then report the total,
+    the number of accounts and the given percentiles of the per-account
+    totals, so a utility's p90 is the 90th percentile account in that period.
+    """
+    if by not in GROUPINGS:
+        raise ValueError(f"by must be one of {', '.join(GROUPINGS)}")
+    percentile_columns = [f'p{int(round(q * 100))}' for q in percentiles]
+    group_columns = {'utility': ['utility'], 'member': MEMBER_COLUMNS, 'account': MEMBER_COLUMNS + ['account_name']}[by]
+    columns = group_columns + ['period', 'total', 'accounts'] + percentile_columns
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+
+    hours = pd.DatetimeIndex(df['start_time']).tz_convert(None).floor('h')
+    keys = [df[column].to_numpy() for column in MEMBER_COLUMNS + ['account_name']]
+    keys.append(pd.Index(period_start(hours, resolution), name='period').to_numpy())
+    per_account = (
+        df[field].groupby(keys).sum()
+        .rename_axis(MEMBER_COLUMNS + ['account_name', 'period'])
+        .reset_index(name='value')
+    )
+    grouped = per_account.groupby(group_columns + ['period'], observed=True)['value']
+    result = grouped.agg(total='sum', accounts='count')
+    if percentiles:
+        quantiles = grouped.quantile(list(percentiles)).unstack()
+        quantiles.columns = percentile_columns
+        result = result.join(quantiles)
+    result = result.reset_index()
+    result['period'] = pd.to_datetime(result['period']).dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+    return result[columns]
+
+
+_registry = None
+_fetcher = None
+_portfolio_lock = threading.Lock()
+
+
+def is_enabled():
+    """Return True if a portfolio file is configured"""
+    return bool(DEFAULT_PORTFOLIO_PATH)
+
+
+def get_portfolio():
+    """Return the process-wide registry and fetcher, loading the registry and starting refreshes on first use"""
+    global _registry, _fetcher
+    with _portfolio_lock:
+        if _registry is None:
+            _registry = CredentialRegistry.from_file(DEFAULT_PORTFOLIO_PATH) if DEFAULT_PORTFOLIO_PATH else CredentialRegistry()
+            _fetcher = PortfolioFetcher(
+                processes=int(os.environ.get('WATT_SEER_PORTFOLIO_PROCESSES', '0')) or None,
+                per_utility_limit=int(os.environ.get('WATT_SEER_PORTFOLIO_PER_UTILITY', '8'))
+            )
+            if DEFAULT_PORTFOLIO_PATH:
+                _fetcher.start(_registry, interval=float(os.environ.get('WATT_SEER_PORTFOLIO_REFRESH', '3600')))
+        return _registry, _fetcher
@@ -0,0 +1,161 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import random
+import time
+import os
+import logging
+import data_fetcher
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class _Session:
+    """Credentials of an active dashboard session and when to warm them next"""
+
+    def __init__(self, credentials, last_seen, next_run):
+        self.credentials = credentials
+        self.last_seen = last_seen
+        self.next_run = next_run
+        self.running = False
+
+
+class PrefetchScheduler:
+    """Warm the dashboard data of active sessions ahead of their refresh ticks.
+
+    Every active credential is refreshed once per cadence, at offset seconds
+    into each cadence slot (when the utility has usually published the last
+    hour) plus a random jitter so sessions do not all fetch at once. Fetch
+    starts for one utility are spaced at least per_utility_interval seconds
+    apart. Sessions not seen for session_ttl seconds are dropped.
+    """
+
+    def __init__(self, warm, cadence=3600, offset=900, jitter=120, per_utility_interval=10,
+                 session_ttl=3600, workers=2, clock=time.time):
+        self.warm = warm
+        self.cadence = cadence
+        self.offset = offset
+        self.jitter = jitter
+        self.per_utility_interval = per_utility_interval
+        self.session_ttl = session_ttl
+        self.clock = clock
+        self._sessions = {}
+        self._utility_next_start = {}
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+        self._thread = None
+        self._stopped = False
+
+    def register(self, credentials):
+        """Add a session or mark it as still active"""
+        key = (credentials['utility'], credentials['username'])
+        now = self.clock()
+        with self._condition:
+            session = self._sessions.get(key)
+            if session is None:
+                self._sessions[key] = _Session(dict(credentials), now, self.next_slot(now))
+                logger.debug(f"Prefetching for {credentials['username']} from {self._sessions[key].next_run:.0f}")
+            else:
+                session.credentials = dict(credentials)
+                session.last_seen = now
+            self._condition.notify()
+
+    def unregister(self, credentials):
+        """Stop prefetching for a session"""
+        with self._condition:
+            self._sessions.pop((credentials['utility'], credentials['username']), None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def next_slot(self, now):
+        """Return the next aligned refresh time after now, with jitter"""
+        slot = (now - self.offset) // self.cadence * self.cadence + self.offset
+        if slot <= now:
+            slot += self.cadence
+        return slot + random.uniform(0, self.jitter)
+
+    def run_pending(self):
+        """Start warming every due session the rate limits allow; return the started futures"""
+        now = self.clock()
+        futures = []
+        with self._condition:
+            for key, session in list(self._sessions.items()):
+                if now - session.last_seen > self.session_ttl:
+                    logger.debug(f"Dropping idle prefetch session {key[1]}")
+                    del self._sessions[key]
+                    continue
+                if session.running or session.next_run > now:
+                    continue
+                utility = key[0]
+                next_start = self._utility_next_start.get(utility, now)
+                if next_start > now:
+                    session.next_run = next_start
+                    continue
+                self._utility_next_start[utility] = now + self.per_utility_interval
+                session.running = True
+                futures.append(self._executor.submit(self._warm, key, session))
+        return futures
+
+    def start(self):
+        """Run the scheduler on a daemon thread"""
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name='prefetch-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the scheduler thread and wait for running warm-ups"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _loop(self):
+        while True:
+            self.run_pending()
+            with self._condition:
+                if self._stopped:
+                    return
+                due = [session.next_run for session in self._sessions.values() if not session.running]
+                timeout = min(due) - self.clock() if due else self.cadence
+                self._condition.wait(timeout=max(1.0, min(timeout, self.cadence)))
+                if self._stopped:
+                    return
+
+    def _warm(self, key, session):
+        started = self.clock()
+        try:
+            self.warm(session.credentials)
+            logger.debug(f"Prefetched dashboard data for {key[1]} in {self.clock() - started:.1f}s")
+        except Exception as e:
+            logger.error(f"Error prefetching data for {key[1]}: {str(e)}")
+        finally:
+            with self._condition:
+                session.running = False
+                session.next_run = self.next_slot(self.clock())
+                self._condition.notify()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_prefetch_scheduler():
+    """Return the process-wide prefetch scheduler, starting it on first use"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = PrefetchScheduler(
+                data_fetcher.prefetch_dashboard_data,
+                cadence=float(os.environ.get('WATT_SEER_PREFETCH_CADENCE', '3600')),
+                offset=float(os.environ.get('WATT_SEER_PREFETCH_OFFSET', '900')),
+                jitter=float(os.environ.get('WATT_SEER_PREFETCH_JITTER', '120')),
+                per_utility_interval=float(os.environ.get('WATT_SEER_PREFETCH_PER_UTILITY_INTERVAL', '10')),
+                session_ttl=float(os.environ.get('WATT_SEER_PREFETCH_SESSION_TTL', '3600'))
+            )
+            _scheduler.start()
+        return _scheduler
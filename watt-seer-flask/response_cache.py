@@ -0,0 +1,169 @@
+import pandas as pd
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+def frame_size(value):
+    """Approximate the memory used by a cached value in bytes"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return 0
+
+
+class _Entry:
+    """A cached value with the time it was stored"""
+
+    def __init__(self, value, size):
+        self.value = value
+        self.size = size
+        self.stored_at = time.monotonic()
+
+
+class ResponseCache:
+    """Bounded TTL + LRU cache with stale-while-revalidate.
+
+    A fresh entry is returned as is. An entry older than ttl but younger
+    than max_stale is returned immediately while a background thread
+    fetches a replacement. Least recently used entries are evicted once
+    max_entries or max_bytes is exceeded.
+
+    If partition maps keys to tenants, each tenant is also held to
+    max_partition_bytes by evicting its own least recently used entries,
+    so one large household cannot push everyone else out of the cache.
+    """
+
+    def __init__(self, ttl=300, max_stale=86400, max_entries=128, max_bytes=256 * 1024 * 1024,
+                 refresh_workers=2, partition=None, max_partition_bytes=None):
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.partition = partition
+        self.max_partition_bytes = max_partition_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._partition_bytes = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='cache-refresh')
+
+    def get(self, key, refresh=None):
+        """Return the cached value for key or None; a stale hit is refreshed with refresh() in the background"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            age = time.monotonic() - entry.stored_at
+            if age > self.max_stale:
+                return None
+            self._entries.move_to_end(key)
+            if age > self.ttl and refresh is not None and key not in self._refreshing:
+                self._refreshing.add(key)
+                self._executor.submit(self._refresh, key, refresh)
+            logger.debug(f"Cache hit for {key} (age {age:.0f}s)")
+            return self._share(entry.value)
+
+    def get_or_fetch(self, key, fetch):
+        """Return the cached value for key, calling fetch() on a miss"""
+        value = self.get(key, refresh=fetch)
+        if value is not None:
+            return value
+
+        logger.debug(f"Cache miss for {key}")
+        value = fetch()
+        self.put(key, value)
+        return self._share(value)
+
+    def put(self, key, value, size=None):
+        """Store a value and evict least recently used entries over the limits; size defaults to frame_size(value)"""
+        size = frame_size(value) if size is None else size
+        limit = self.max_bytes
+        if self.max_partition_bytes is not None and self.partition is not None:
+            limit = min(limit, self.max_partition_bytes)
+        if size > limit:
+            logger.debug(f"Not caching {key}: {size} bytes exceeds the cache limit")
+            return
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = _Entry(value, size)
+            self._bytes += size
+            tenant = self._tenant(key)
+            if tenant is not None:
+                self._partition_bytes[tenant] = self._partition_bytes.get(tenant, 0) + size
+                if self.max_partition_bytes is not None:
+                    for tenant_key in [k for k in self._entries if self._tenant(k) == tenant]:
+                        if self._partition_bytes.get(tenant, 0) <= self.max_partition_bytes:
+                            break
+                        self._pop(tenant_key)
+                        logger.debug(f"Evicted {tenant_key} over the quota of its partition")
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                evicted_key = next(iter(self._entries))
+                self._pop(evicted_key)
+                logger.debug(f"Evicted {evicted_key} from the response cache")
+
+    def invalidate(self, key):
+        """Drop one entry"""
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        """Drop all entries"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._partition_bytes.clear()
+
+    def partition_bytes(self, tenant):
+        """Bytes currently held by one tenant's cached values"""
+        return self._partition_bytes.get(tenant, 0)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size_bytes(self):
+        """Bytes currently held by cached values"""
+        return self._bytes
+
+    def _refresh(self, key, fetch):
+        """Replace a stale entry in the background"""
+        try:
+            self.put(key, fetch())
+            logger.debug(f"Refreshed stale cache entry {key}")
+        except Exception as e:
+            logger.error(f"Error refreshing cache entry {key}: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _tenant(self, key):
+        return self.partition(key) if self.partition is not None else None
+
+    def _pop(self, key):
+        """Remove an entry and its size from the totals; the lock must be held"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        tenant = self._tenant(key)
+        if tenant is not None:
+            remaining = self._partition_bytes.get(tenant, 0) - entry.size
+            if remaining > 0:
+                self._partition_bytes[tenant] = remaining
+            else:
+                self._partition_bytes.pop(tenant, None)
+
+    @staticmethod
+    def _share(value):
+        """Hand out a shallow copy so callers adding columns do not touch the cached frame"""
+        if isinstance(value, pd.DataFrame):
+            return value.copy(deep=False)
+        return value
@@ -0,0 +1,194 @@
+import pandas as pd
+import numpy as np
+import itertools
+import threading
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Name of the pseudo-account that sums all accounts
+TOTAL_ACCOUNT = 'Total'
+
+# Granularities kept by the cube, finest first, with their pandas period codes
+LEVELS = {
+    'hour': None,
+    'day': 'D',
+    'week': 'W',
+    'month': 'M',
+    'quarter': 'Q',
+    'year': 'Y'
+}
+
+VALUE_COLUMNS = ['consumption', 'provided_cost']
+
+# One version counter shared by every cube
+_versions = itertools.count(1)
+
+
+def period_start(hours, level):
+    """Map hourly timestamps (naive UTC) to the start of their period at a level"""
+    if level == 'hour':
+        return hours
+    if level == 'day':
+        return hours.floor('D')
+    return hours.to_period(LEVELS[level]).start_time
+
+
+class RollupCube:
+    """Pre-aggregated consumption and cost per account at every granularity.
+
+    Hourly values are kept per account as columns: sorted hour timestamps
+    (epoch nanoseconds) and a matching value array. An update only looks at
+    the hours it carries: the difference to any value already stored for
+    that hour is rolled up into the day, week, month, quarter and year
+    cells of the account and of the 'Total' pseudo-account. Refresh cost
+    therefore depends on the number of new hours, not on the length of the
+    history, and an hourly window is read by slicing the columns.
+
+    version changes with every update that changed a value. Versions are
+    drawn from one counter shared by all cubes, so a cube rebuilt after
+    eviction never repeats a version an older cube already handed out.
+    """
+
+    def __init__(self):
+        self._hourly = {}
+        self._cells = {level: {} for level in LEVELS if level != 'hour'}
+        self._lock = threading.Lock()
+        self.version = 0
+
+    def update(self, df):
+        """Fold new or re-fetched hourly rows into the cube; return the number of hours changed"""
+        if df is None or df.empty:
+            return 0
+        hours = pd.DatetimeIndex(pd.to_datetime(df['start_time'], utc=True)).tz_convert(None).floor('h')
+        hours = hours.astype('datetime64[ns]')
+        frame = pd.DataFrame({
+            'account_name': df['account_name'].astype(str).to_numpy(),
+            'hour': hours,
+            'consumption': pd.to_numeric(df['consumption'], errors='coerce').fillna(0).to_numpy(dtype=np.float64),
+            'provided_cost': (pd.to_numeric(df['provided_cost'], errors='coerce').fillna(0).to_numpy(dtype=np.float64)
+                              if 'provided_cost' in df.columns else 0.0)
+        }).drop_duplicates(subset=['account_name', 'hour'], keep='last').reset_index(drop=True)
+
+        delta = np.zeros((len(frame), len(VALUE_COLUMNS)))
+        changed = np.zeros(len(frame), dtype=bool)
+        with self._lock:
+            for account_name, positions in frame.groupby('account_name', sort=False).indices.items():
+                keys = frame['hour'].to_numpy()[positions].astype('int64')
+                values = frame[VALUE_COLUMNS].to_numpy()[positions]
+                delta[positions], changed[positions] = self._store_hours(account_name, keys, values)
+            if not changed.any():
+                return 0
+
+            delta_frame = frame.loc[changed, ['account_name', 'hour']].copy()
+            delta_frame[VALUE_COLUMNS] = delta[changed]
+            hour_index = pd.DatetimeIndex(delta_frame['hour'])
+            for level, cells in self._cells.items():
+                delta_frame['period'] = period_start(hour_index, level)
+                per_account = delta_frame.groupby(['period', 'account_name'])[VALUE_COLUMNS].sum()
+                per_period = delta_frame.groupby('period')[VALUE_COLUMNS].sum()
+                for (period, account_name), row in zip(per_account.index, per_account.to_numpy()):
+                    self._add(cells, (period, account_name), row)
+                for period, row in zip(per_period.index, per_period.to_numpy()):
+                    self._add(cells, (period, TOTAL_ACCOUNT), row)
+            self.version = next(_versions)
+        logger.debug(f"Rolled up {int(changed.sum())} changed hours (version {self.version})")
+        return int(changed.sum())
+
+    def frame(self, level, start=None, end=None, accounts=None, include_total=True):
+        """Return the cells of a level as a frame with period, account_name and value columns"""
+        if level not in LEVELS:
+            raise ValueError(f"Unknown rollup level: {level}")
+        if level == 'hour':
+            df = self._hour_frame(start, end, include_total)
+        else:
+            with self._lock:
+                rows = [(period, account_name, value[0], value[1])
+                        for (period, account_name), value in self._cells[level].items()]
+            df = pd.DataFrame(rows, columns=['period', 'account_name'] + VALUE_COLUMNS)
+        if start is not None:
+            df = df[df['period'] >= _naive_utc(start)]
+        if end is not None:
+            df = df[df['period'] < _naive_utc(end)]
+        if accounts is not None:
+            df = df[df['account_name'].isin(accounts)]
+        if not include_total:
+            df = df[df['account_name'] != TOTAL_ACCOUNT]
+        return df.sort_values(['period', 'account_name']).reset_index(drop=True)
+
+    def hour_count(self, start=None, end=None):
+        """Return the number of account hours stored in [start, end)"""
+        low = None if start is None else _naive_utc(start).as_unit('ns').value
+        high = None if end is None else _naive_utc(end).as_unit('ns').value
+        with self._lock:
+            return sum(
+                (len(hours) if high is None else int(np.searchsorted(hours, high)))
+                - (0 if low is None else int(np.searchsorted(hours, low)))
+                for hours, _ in self._hourly.values()
+            )
+
+    def accounts(self):
+        """Return the names of all accounts in the cube"""
+        with self._lock:
+            return sorted(self._hourly)
+
+    def _store_hours(self, account_name, keys, values):
+        """Upsert one account's hours; the lock must be held. Return the value deltas and which hours changed"""
+        hours, stored = self._hourly.get(account_name, (np.empty(0, dtype=np.int64), np.empty((0, len(VALUE_COLUMNS)))))
+        positions = np.searchsorted(hours, keys)
+        exists = positions < len(hours)
+        exists[exists] = hours[positions[exists]] == keys[exists]
+        previous = np.zeros_like(values)
+        previous[exists] = stored[positions[exists]]
+        delta = values - previous
+        stored[positions[exists]] = values[exists]
+        if not exists.all():
+            hours = np.concatenate([hours, keys[~exists]])
+            stored = np.concatenate([stored, values[~exists]])
+            order = np.argsort(hours, kind='stable')
+            hours, stored = hours[order], stored[order]
+        self._hourly[account_name] = (hours, stored)
+        return delta, np.any(delta != 0, axis=1) | ~exists
+
+    def _hour_frame(self, start, end, include_total):
+        """Slice every account's hourly columns to [start, end) and add the per-hour total"""
+        low = None if start is None else _naive_utc(start).as_unit('ns').value
+        high = None if end is None else _naive_utc(end).as_unit('ns').value
+        names, hours, values = [], [], []
+        with self._lock:
+            for account_name, (account_hours, stored) in self._hourly.items():
+                first = 0 if low is None else np.searchsorted(account_hours, low)
+                last = len(account_hours) if high is None else np.searchsorted(account_hours, high)
+                names.append(np.full(last - first, account_name, dtype=object))
+                hours.append(account_hours[first:last].copy())
+                values.append(stored[first:last].copy())
+        if not hours:
+            return pd.DataFrame(columns=['period', 'account_name'] + VALUE_COLUMNS)
+        names, hours, values = np.concatenate(names), np.concatenate(hours), np.concatenate(values)
+        if include_total and len(hours):
+            total_hours, inverse = np.unique(hours, return_inverse=True)
+            totals = np.column_stack([
+                np.bincount(inverse, weights=values[:, column], minlength=len(total_hours))
+                for column in range(len(VALUE_COLUMNS))
+            ])
+            names = np.concatenate([names, np.full(len(total_hours), TOTAL_ACCOUNT, dtype=object)])
+            hours = np.concatenate([hours, total_hours])
+            values = np.concatenate([values, totals])
+        df = pd.DataFrame(values, columns=VALUE_COLUMNS)
+        df.insert(0, 'account_name', names)
+        df.insert(0, 'period', hours.view('datetime64[ns]'))
+        return df
+
+    @staticmethod
+    def _add(cells, key, row):
+        current = cells.get(key)
+        cells[key] = (row[0], row[1]) if current is None else (current[0] + row[0], current[1] + row[1])
+
+
+def _naive_utc(value):
+    """Convert a date or datetime to a naive UTC timestamp for comparing with periods"""
+    timestamp = pd.Timestamp(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.tz_convert('UTC').tz_localize(None)
+    return timestamp
@@ -0,0 +1,95 @@
+import threading
+import asyncio
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """One in-flight fetch and the range it covers"""
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent fetches of the same credential and range.
+
+    A caller whose range lies inside a fetch that is already running for
+    the same key waits for that fetch and shares its result instead of
+    starting another one. narrow(value, start, end) trims the shared result
+    down to the caller's range.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, start, end, fetch, narrow=None):
+        """Run fetch() for (key, start, end) unless a covering fetch is in flight"""
+        leader, own = self._join(key, start, end)
+        if leader is not None:
+            logger.debug(f"Waiting on in-flight fetch for {key} {leader.start} to {leader.end}")
+            leader.done.wait()
+            return self._shared(leader, start, end, narrow)
+
+        try:
+            own.value = fetch()
+            return own.value
+        except Exception as e:
+            own.error = e
+            raise
+        finally:
+            self._leave(key, own)
+
+    async def async_do(self, key, start, end, fetch, narrow=None):
+        """Awaitable do(); fetch() returns an awaitable, and fetches from threads and coroutines are shared"""
+        leader, own = self._join(key, start, end)
+        if leader is not None:
+            logger.debug(f"Waiting on in-flight fetch for {key} {leader.start} to {leader.end}")
+            await asyncio.to_thread(leader.done.wait)
+            return self._shared(leader, start, end, narrow)
+
+        try:
+            own.value = await fetch()
+            return own.value
+        except BaseException as e:
+            own.error = e
+            raise
+        finally:
+            self._leave(key, own)
+
+    def _join(self, key, start, end):
+        """Return (a covering in-flight call, None) or (None, a new call registered for the range)"""
+        with self._lock:
+            for call in self._calls.get(key, []):
+                if call.start <= start and end <= call.end:
+                    return call, None
+            own = _Call(start, end)
+            self._calls.setdefault(key, []).append(own)
+            return None, own
+
+    def _shared(self, leader, start, end, narrow):
+        if leader.error is not None:
+            raise leader.error
+        if narrow is not None and (leader.start, leader.end) != (start, end):
+            return narrow(leader.value, start, end)
+        return leader.value
+
+    def _leave(self, key, own):
+        with self._lock:
+            calls = self._calls[key]
+            calls.remove(own)
+            if not calls:
+                del self._calls[key]
+        own.done.set()
+
+    def in_flight(self, key):
+        """Return the number of fetches currently running for a key"""
+        with self._lock:
+            return len(self._calls.get(key, []))
@@ -0,0 +1,244 @@
+import pandas as pd
+import numpy as np
+import functools
+import json
+import os
+import pytz
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Local time TOU periods and billing months are evaluated in unless a plan sets its own
+DEFAULT_TIMEZONE = os.environ.get('WATT_SEER_TARIFF_TZ', 'America/Los_Angeles')
+
+# Most plans priced in one request
+MAX_PLANS = int(os.environ.get('WATT_SEER_TARIFF_MAX_PLANS', '100'))
+
+DAY_TYPES = ['all', 'weekdays', 'weekends']
+
+RESULT_COLUMNS = [
+    'plan', 'account_name', 'consumption', 'energy_charge', 'tier_charge', 'fixed_charge',
+    'total', 'provided_cost', 'difference'
+]
+
+
+def _number(value, name, minimum=None):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{name} must be a number")
+    if minimum is not None and value < minimum:
+        raise ValueError(f"{name} must be at least {minimum}")
+    return float(value)
+
+
+def _integers(values, name, low, high):
+    if not isinstance(values, list) or not values:
+        raise ValueError(f"{name} must be a non-empty list")
+    if any(isinstance(value, bool) or not isinstance(value, int) or not low <= value <= high for value in values):
+        raise ValueError(f"{name} must be integers from {low} to {high}")
+    return sorted(set(values))
+
+
+def parse_plan(plan):
+    """Validate a rate plan and return it normalized.
+
+    A plan is a dict with a name, a default energy_rate ($/kWh) and
+    optional fixed_monthly ($ per account and billing month), timezone,
+    periods and tiers. Each period is a {rate, hours, months, days} dict
+    that sets the rate of the local hours (0-23) it matches, in the given
+    months (1-12; all when omitted) on 'all', 'weekdays' or 'weekends'.
+    Later periods override earlier ones, so seasons and TOU windows
+    compose. Tiers are {up_to, adder} dicts applied to each billing
+    month's consumption in order, with up_to null for the last tier.
+    """
+    if not isinstance(plan, dict):
+        raise ValueError("Each plan must be an object")
+    name = plan.get('name')
+    if not isinstance(name, str) or not name:
+        raise ValueError("Each plan needs a name")
+    timezone = plan.get('timezone', DEFAULT_TIMEZONE)
+    if timezone not in pytz.all_timezones_set:
+        raise ValueError(f"Plan {name}: unknown timezone {timezone}")
+
+    for field in ('periods', 'tiers'):
+        if not isinstance(plan.get(field, []), list):
+            raise ValueError(f"Plan {name}: {field} must be a list")
+
+    periods = []
+    for period in plan.get('periods', []):
+        if not isinstance(period, dict):
+            raise ValueError(f"Plan {name}: each period must be an object")
+        days = period.get('days', 'all')
+        if days not in DAY_TYPES:
+            raise ValueError(f"Plan {name}: days must be one of {', '.join(DAY_TYPES)}")
+        periods.append({
+            'rate': _number(period.get('rate'), f"Plan {name}: period rate"),
+            'hours': _integers(period.get('hours', list(range(24))), f"Plan {name}: period hours", 0, 23),
+            'months': _integers(period.get('months', list(range(1, 13))), f"Plan {name}: period months", 1, 12),
+            'days': days
+        })
+
+    tiers = []
+    previous = 0.0
+    for index, tier in enumerate(plan.get('tiers', [])):
+        if not isinstance(tier, dict):
+            raise ValueError(f"Plan {name}: each tier must be an object")
+        up_to = tier.get('up_to')
+        if up_to is None and index != len(plan['tiers']) - 1:
+            raise ValueError(f"Plan {name}: only the last tier can be unbounded")
+        if up_to is not None:
+            up_to = _number(up_to, f"Plan {name}: tier up_to", minimum=previous)
+            previous = up_to
+        tiers.append({'up_to': up_to, 'adder': _number(tier.get('adder', 0.0), f"Plan {name}: tier adder")})
+
+    return {
+        'name': name,
+        'energy_rate': _number(plan.get('energy_rate'), f"Plan {name}: energy_rate"),
+        'fixed_monthly': _number(plan.get('fixed_monthly', 0.0), f"Plan {name}: fixed_monthly", minimum=0),
+        'timezone': timezone,
+        'periods': periods,
+        'tiers': tiers
+    }
+
+
+def parse_plans(plans):
+    """Validate a request's list of rate plans"""
+    if not isinstance(plans, list) or not plans:
+        raise ValueError("plans must be a non-empty list")
+    if len(plans) > MAX_PLANS:
+        raise ValueError(f"At most {MAX_PLANS} plans can be compared at once")
+    parsed = [parse_plan(plan) for plan in plans]
+    names = [plan['name'] for plan in parsed]
+    if len(set(names)) != len(names):
+        raise ValueError("Plan names must be unique")
+    return parsed
+
+
+def plan_key(plan):
+    """Return a hashable key of a plan's pricing, ignoring its name"""
+    return json.dumps({key: value for key, value in plan.items() if key != 'name'}, sort_keys=True)
+
+
+@functools.lru_cache(maxsize=512)
+def _year_prices(key, year):
+    """Price per kWh of every UTC hour of a year for a plan key"""
+    plan = json.loads(key)
+    hours = pd.date_range(f'{year}-01-01', f'{year + 1}-01-01', freq='h', tz='UTC', inclusive='left')
+    local = hours.tz_convert(plan['timezone'])
+    hour = local.hour.to_numpy()
+    month = local.month.to_numpy()
+    weekend = local.dayofweek.to_numpy() >= 5
+    prices = np.full(len(hours), plan['energy_rate'])
+    for period in plan['periods']:
+        mask = np.isin(hour, period['hours']) & np.isin(month, period['months'])
+        if period['days'] == 'weekdays':
+            mask &= ~weekend
+        elif period['days'] == 'weekends':
+            mask &= weekend
+        prices[mask] = period['rate']
+    prices.flags.writeable = False
+    return prices
+
+
+def price_vector(plan, hours):
+    """Return a plan's price per kWh for each of the given UTC hours"""
+    hours = pd.DatetimeIndex(hours)
+    key = plan_key(plan)
+    prices = np.empty(len(hours))
+    years = hours.year.to_numpy()
+    for year in np.unique(years):
+        in_year = years == year
+        offsets = (hours[in_year] - pd.Timestamp(int(year), 1, 1, tz='UTC')) // pd.Timedelta(hours=1)
+        prices[in_year] = _year_prices(key, int(year))[np.asarray(offsets)]
+    return prices
+
+
+def price_matrix(plans, hours):
+    """Stack the price vectors of several plans into a (plans x hours) matrix"""
+    return np.vstack([price_vector(plan, hours) for plan in plans])
+
+
+def consumption_matrix(df, account_columns=('account_name',)):
+    """Pivot intervals onto an hourly grid.
+
+    Returns the UTC hours, a frame of the account keys, an
+    (accounts x hours) consumption matrix with missing hours as zero,
+    and each account's provided cost.
+    """
+    account_columns = list(account_columns)
+    start_times = pd.to_datetime(df['start_time'], utc=True).dt.floor('h')
+    hours = pd.date_range(start_times.min(), start_times.max(), freq='h')
+    grouped = df.groupby(account_columns, sort=False, observed=True)
+    codes = grouped.ngroup().to_numpy()
+    accounts = grouped.size().index.to_frame(index=False)
+    positions = ((start_times - hours[0]) // pd.Timedelta(hours=1)).to_numpy()
+    consumption = pd.to_numeric(df['consumption'], errors='coerce').fillna(0).to_numpy()
+    matrix = np.bincount(codes * len(hours) + positions, weights=consumption,
+                         minlength=len(accounts) * len(hours)).reshape(len(accounts), len(hours))
+    cost = pd.to_numeric(df['provided_cost'], errors='coerce').fillna(0).to_numpy() \
+        if 'provided_cost' in df.columns else np.zeros(len(df))
+    provided_cost = np.bincount(codes, weights=cost, minlength=len(accounts))
+    return hours, accounts, matrix, provided_cost
+
+
+def monthly_consumption(matrix, hours, timezone):
+    """Sum an (accounts x hours) matrix per local billing month; return (accounts x months) and whether each account had data"""
+    local = pd.DatetimeIndex(hours).tz_convert(timezone)
+    months = local.year.to_numpy() * 12 + local.month.to_numpy()
+    starts = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+    monthly = np.add.reduceat(matrix, starts, axis=1)
+    return monthly, np.add.reduceat(matrix != 0, starts, axis=1) > 0
+
+
+def tier_charges(monthly, tiers):
+    """Charge each tier's adder on the part of every month's consumption that falls in the tier"""
+    if not tiers:
+        return np.zeros(monthly.shape[0])
+    lower = np.array([0.0] + [tier['up_to'] for tier in tiers[:-1]])
+    upper = np.array([np.inf if tier['up_to'] is None else tier['up_to'] for tier in tiers])
+    adders = np.array([tier['adder'] for tier in tiers])
+    in_tier = np.clip(monthly[..., None] - lower, 0, upper - lower)
+    return (in_tier * adders).sum(axis=(1, 2))
+
+
+def compare_plans(df, plans, account_columns=('account_name',)):
+    """Price every account's hourly consumption under every plan.
+
+    The energy charge of all plans and accounts is one matrix product of
+    the (accounts x hours) consumption and the (hours x plans) prices.
+    Tier and fixed charges are added per local billing month. Returns
+    one row per plan and account with the difference from the cost the
+    utility reported.
+    """
+    columns = RESULT_COLUMNS[:1] + list(account_columns) + RESULT_COLUMNS[2:]
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+    hours, accounts, matrix, provided_cost = consumption_matrix(df, account_columns)
+    energy = matrix @ price_matrix(plans, hours).T
+    consumption = matrix.sum(axis=1)
+
+    tier_charge = np.empty_like(energy)
+    fixed_charge = np.empty_like(energy)
+    monthly_by_timezone = {}
+    for index, plan in enumerate(plans):
+        if plan['timezone'] not in monthly_by_timezone:
+            monthly_by_timezone[plan['timezone']] = monthly_consumption(matrix, hours, plan['timezone'])
+        monthly, billed = monthly_by_timezone[plan['timezone']]
+        tier_charge[:, index] = tier_charges(monthly, plan['tiers'])
+        fixed_charge[:, index] = plan['fixed_monthly'] * billed.sum(axis=1)
+
+    # One row per plan and account, plans outermost
+    count = len(accounts)
+    total = energy + tier_charge + fixed_charge
+    result = pd.DataFrame({'plan': np.repeat([plan['name'] for plan in plans], count)})
+    for column in account_columns:
+        result[column] = np.tile(accounts[column].to_numpy(), len(plans))
+    result['consumption'] = np.tile(consumption, len(plans))
+    result['energy_charge'] = energy.T.ravel()
+    result['tier_charge'] = tier_charge.T.ravel()
+    result['fixed_charge'] = fixed_charge.T.ravel()
+    result['total'] = total.T.ravel()
+    result['provided_cost'] = np.tile(provided_cost, len(plans))
+    result['difference'] = result['total'] - result['provided_cost']
+    logger.debug(f"Priced {len(plans)} plans for {count} accounts over {len(hours)} hours")
+    return result[columns]
@@ -3,6 +3,23 @@ from app import server, app
 from flask import session
 import data_fetcher
 from unittest.mock import patch, MagicMock
+from contextlib import contextmanager
+import asyncio
+import json
+import threading
+import numpy as np
+import pandas as pd
+from dash import Patch, no_update
+from dash.exceptions import PreventUpdate
+import app as app_module
+from app import (sync_data, update_daily_figure, update_monthly_figure, update_quarterly_figure,
+                 update_account_figure, update_hourly_figure, zoom_hourly_figure, FIGURE_CACHE)
+import asgi
+import fetch_jobs
+import portfolio
+import rollups
+import user_sessions
+import views
 
 @pytest.fixture
 def client():
@@ -29,9 +46,7 @@ def test_login_page_loads(client):
 
 def test_login_with_valid_credentials(client):
     """Test login with valid credentials"""
-    with patch('data_fetcher.get_current_month_data') as mock_get_data:
-        mock_get_data.return_value = MagicMock()  # Return a mock DataFrame
-        
+    with patch('data_fetcher.validate_credentials') as mock_validate:
         response = client.post('/login', data={
             'username': 'test@example.com',
             'password': 'testpass',
@@ -40,6 +55,7 @@ def test_login_with_valid_credentials(client):
         
         assert response.status_code == 302
         assert response.location == '/dashboard'
+        mock_validate.assert_called_once()
         
         # Check if session was created
         with client.session_transaction() as sess:
@@ -50,8 +66,8 @@ def test_login_with_valid_credentials(client):
 
 def test_login_with_invalid_credentials(client):
     """Test login with invalid credentials"""
-    with patch('data_fetcher.get_current_month_data') as mock_get_data:
-        mock_get_data.side_effect = Exception('Invalid credentials')
+    with patch('data_fetcher.validate_credentials') as mock_validate:
+        mock_validate.side_effect = Exception('Invalid credentials')
         
         response = client.post('/login', data={
             'username': 'wrong@example.com',
@@ -75,9 +91,7 @@ def test_dashboard_requires_login(client):
 
 def test_dashboard_accessible_after_login(client):
     """Test that dashboard is accessible after successful login"""
-    with patch('data_fetcher.get_current_month_data') as mock_get_data:
-        mock_get_data.return_value = MagicMock()
-        
+    with patch('data_fetcher.validate_credentials'):
         # First login
         client.post('/login', data={
             'username': 'test@example.com',
@@ -89,11 +103,29 @@ def test_dashboard_accessible_after_login(client):
         response = client.get('/dashboard')
         assert response.status_code == 200
 
+def test_lost_server_session_redirects_to_login(client):
+    """Test that a cookie whose server-side session is gone is cleared instead of serving a blank dashboard"""
+    with patch('data_fetcher.validate_credentials'):
+        client.post('/login', data={
+            'username': 'test@example.com',
+            'password': 'testpass',
+            'utility': 'portlandgeneral'
+        })
+    with client.session_transaction() as sess:
+        user_sessions.SESSIONS.delete(sess['sid'])
+
+    response = client.post('/_dash-update-component', json={})
+    assert response.status_code == 302
+    assert response.location == '/login'
+    with client.session_transaction() as sess:
+        assert 'user' not in sess
+        assert 'sid' not in sess
+    assert client.get('/dashboard').location == '/login'
+
 def test_logout_clears_session(client):
     """Test that logout clears the session"""
-    with patch('data_fetcher.get_current_month_data') as mock_get_data:
-        mock_get_data.return_value = MagicMock()
-        
+    with patch('data_fetcher.validate_credentials'), \
+         patch('user_sessions.SESSIONS', user_sessions.SessionStore()):
         # Login first
         client.post('/login', data={
             'username': 'test@example.com',
@@ -107,15 +139,37 @@ def test_logout_clears_session(client):
             assert 'utility' in sess
         
         # Logout
-        response = client.get('/logout')
+        with patch('data_fetcher.forget_login') as mock_forget:
+            response = client.get('/logout')
         assert response.status_code == 302
         assert response.location == '/login'
+        mock_forget.assert_called_once()
+        assert mock_forget.call_args.args[0]['username'] == 'test@example.com'
         
         # Check session is cleared
         with client.session_transaction() as sess:
             assert 'user' not in sess
             assert 'utility' not in sess
 
+def test_logout_keeps_prefetching_for_other_sessions_of_the_household(client):
+    """Test that prefetching and the utility login stop only when the household's last session logs out"""
+    scheduler = MagicMock()
+    form = {'username': 'test@example.com', 'password': 'testpass', 'utility': 'portlandgeneral'}
+    with patch('data_fetcher.validate_credentials'), \
+         patch('user_sessions.SESSIONS', user_sessions.SessionStore()), \
+         patch('app.PREFETCH_ENABLED', True), \
+         patch('prefetch.get_prefetch_scheduler', return_value=scheduler), \
+         patch('data_fetcher.forget_login') as mock_forget:
+        other = server.test_client()
+        client.post('/login', data=form)
+        other.post('/login', data=form)
+        client.get('/logout')
+        scheduler.unregister.assert_not_called()
+        mock_forget.assert_not_called()
+        other.get('/logout')
+    scheduler.unregister.assert_called_once_with({'utility': 'portlandgeneral', 'username': 'test@example.com'})
+    mock_forget.assert_called_once()
+
 def test_dash_routes_protected(client):
     """Test that Dash routes are protected"""
     response = client.get('/_dash/')
@@ -126,4 +180,409 @@ def test_assets_routes_protected(client):
     """Test that assets routes are protected"""
     response = client.get('/assets/')
     assert response.status_code == 302
-    assert response.location == '/login' 
\ No newline at end of file
+    assert response.location == '/login' 
+
+@contextmanager
+def logged_in_request(username):
+    """Run a request whose session belongs to a logged-in user"""
+    with server.test_request_context('/_dash-update-component'):
+        session['sid'] = user_sessions.SESSIONS.create(
+            {'username': username, 'password': 'testpass', 'utility': 'portlandgeneral'})
+        session['user'] = username
+        yield
+
+def make_year_data(hours=48):
+    """Build hourly year-to-date rows ending at the current hour"""
+    now = pd.Timestamp.now(tz='UTC').floor('h')
+    return pd.DataFrame({
+        'start_time': pd.date_range(end=now, periods=hours, freq='h'),
+        'consumption': [1.0] * hours,
+        'account_name': 'Account 7277230355'
+    })
+
+def test_sync_fetches_once_and_skips_unchanged_data():
+    """Test that a tick syncs once and leaves the figures alone when the rollups did not change"""
+    year_data = make_year_data()
+    cube = rollups.RollupCube()
+    cube.update(year_data)
+    with patch('data_fetcher.get_current_year_data', return_value=year_data) as mock_year, \
+         patch('data_fetcher.get_rollup', return_value=cube), \
+         patch('data_fetcher.get_current_month_data') as mock_month, \
+         patch('data_fetcher.get_quarterly_data') as mock_quarterly:
+        with logged_in_request('test@example.com'):
+            version = sync_data(0, None)
+            assert sync_data(1, version) is no_update
+            figures = [
+                update(version, year_data['start_time'].iloc[-1].year, None)[0]
+                for update in (update_quarterly_figure, update_monthly_figure, update_account_figure)
+            ]
+    assert mock_year.call_count == 2
+    mock_month.assert_not_called()
+    mock_quarterly.assert_not_called()
+    assert version['version'] == cube.version
+    assert all(figure['data'] for figure in figures)
+
+def apply_patch(figure, patch_update):
+    """Apply a Patch's Assign and Extend operations to a serialized figure the way the browser does"""
+    for operation in patch_update.to_plotly_json()['operations']:
+        *path, last = operation['location']
+        target = figure
+        for part in path:
+            target = target[part]
+        if operation['operation'] == 'Extend':
+            target[last].extend(operation['params']['value'])
+        else:
+            assert operation['operation'] == 'Assign'
+            target[last] = operation['params']['value']
+    return figure
+
+def test_daily_figure_patches_new_day():
+    """Test that new hours are sent as a Patch that extends the serialized figure to the rebuilt one"""
+    cube = rollups.RollupCube()
+    start = pd.Timestamp('2024-03-01', tz='UTC')
+    cube.update(pd.DataFrame({
+        'start_time': pd.date_range(start, periods=48, freq='h'),
+        'consumption': [1.0] * 48,
+        'account_name': 'Account 7277230355'
+    }))
+    version = {'user': 'test@example.com', 'version': cube.version, 'empty': False}
+    with patch('data_fetcher.get_rollup', return_value=cube), \
+         patch('data_fetcher.get_data_by_date_range'):
+        with logged_in_request('test@example.com'):
+            figure, meta, title = update_daily_figure(version, 2024, 'March', None)
+            figure = json.loads(json.dumps(figure))
+            assert len(figure['data']) == 2
+            # The browser only keeps the version and a summary of each trace
+            assert meta['version'] == cube.version
+            assert [trace[:2] for trace in meta['traces']] == [['Account 7277230355', 2], ['Total', 2]]
+            assert all(isinstance(trace['y'], list) for trace in figure['data'])
+            cube.update(pd.DataFrame({
+                'start_time': pd.date_range(start + pd.Timedelta(days=2), periods=24, freq='h'),
+                'consumption': [2.0] * 24,
+                'account_name': 'Account 7277230355'
+            }))
+            version = dict(version, version=cube.version)
+            patch_update, meta, _ = update_daily_figure(version, 2024, 'March', meta)
+            FIGURE_CACHE.clear()
+            rebuilt, _, _ = update_daily_figure(version, 2024, 'March', None)
+    assert title == 'Daily Energy Consumption for test@example.com (March 2024)'
+    assert isinstance(patch_update, Patch)
+    operations = patch_update.to_plotly_json()['operations']
+    assert all(operation['operation'] == 'Extend' for operation in operations)
+    patched = apply_patch(figure, patch_update)
+    assert [trace['y'] for trace in patched['data']] == [trace['y'] for trace in rebuilt['data']]
+    assert patched['data'][0]['y'] == [24.0, 24.0, 48.0]
+
+def test_energy_range_aggregates_on_server(client):
+    """Test that /energy/range returns daily totals when a resolution is requested"""
+    start_times = pd.date_range('2024-01-01', periods=48, freq='h', tz='UTC')
+    df = pd.DataFrame({
+        'start_time': start_times,
+        'consumption': [1.0] * 48,
+        'provided_cost': [0.5] * 48,
+        'account_id': '7277230355',
+        'account_name': 'Account 7277230355'
+    })
+    with patch('data_fetcher.get_data_by_date_range', return_value=df):
+        response = client.post('/energy/range', json={
+            'credentials': {'username': 'u', 'password': 'p', 'utility': 'portlandgeneral'},
+            'start_date': '2024-01-01',
+            'end_date': '2024-01-02',
+            'resolution': 'day',
+            'fields': ['consumption'],
+            'agg': 'sum'
+        })
+    assert response.status_code == 200
+    assert response.get_json() == [
+        {'period': '2024-01-01T00:00:00Z', 'account_name': 'Account 7277230355', 'consumption': 24.0},
+        {'period': '2024-01-02T00:00:00Z', 'account_name': 'Account 7277230355', 'consumption': 24.0}
+    ]
+
+def test_energy_range_reads_whole_periods_from_the_rollup(client):
+    """Test that summed periods come from the rollup cube and only the cut edge periods are regrouped"""
+    credentials = {'username': 'u', 'password': 'p', 'utility': 'portlandgeneral'}
+    start_times = pd.date_range('2024-01-03 05:00', '2024-02-20 17:00', freq='h', tz='UTC')
+    df = pd.DataFrame({
+        'start_time': start_times,
+        'consumption': np.arange(len(start_times), dtype=float),
+        'provided_cost': 0.5,
+        'account_id': '7277230355',
+        'account_name': 'Account 7277230355'
+    })
+    data_fetcher.ROLLUPS.clear()
+    with patch('data_fetcher.USE_INTERVAL_STORE', False):
+        data_fetcher.get_rollup(credentials).update(df)
+    request = {'credentials': credentials, 'start_date': '2024-01-03', 'end_date': '2024-02-20',
+               'accounts': ['7277230355'], 'fields': ['consumption']}
+    responses = {}
+    with patch('data_fetcher.get_data_by_date_range', return_value=df), \
+         patch('views.aggregate_intervals', wraps=views.aggregate_intervals) as regroup:
+        for resolution in ('day', 'week', 'month'):
+            responses[resolution] = client.post('/energy/range', json=dict(request, resolution=resolution)).get_json()
+            if resolution != 'month':
+                # Only the partial first and last periods are regrouped
+                assert len(regroup.call_args.args[0]) < len(df) / 5
+            expected = views.aggregate_intervals(df, resolution, ['7277230355'], ['consumption'])
+            assert responses[resolution] == expected.to_dict(orient='records')
+    data_fetcher.ROLLUPS.clear()
+    assert [row['period'] for row in responses['month']] == ['2024-01-01T00:00:00Z', '2024-02-01T00:00:00Z']
+
+def test_energy_endpoint_rejects_unknown_resolution(client):
+    """Test that invalid aggregation parameters are rejected before fetching"""
+    with patch('data_fetcher.get_current_month_data') as mock_get_data:
+        response = client.post('/energy/daily', json={
+            'credentials': {'username': 'u', 'password': 'p', 'utility': 'portlandgeneral'},
+            'resolution': 'minute'
+        })
+    assert response.status_code == 400
+    mock_get_data.assert_not_called()
+
+def test_energy_endpoint_rejects_mistyped_accounts_and_fields(client):
+    """Test that accounts and fields that are neither a string nor a list of strings are a 400, not a 500"""
+    credentials = {'username': 'u', 'password': 'p', 'utility': 'portlandgeneral'}
+    with patch('data_fetcher.get_current_month_data') as mock_get_data:
+        for params in ({'accounts': 7277230355}, {'fields': {'consumption': True}}, {'accounts': [1, 2]}):
+            response = client.post('/energy/daily', json=dict(params, credentials=credentials))
+            assert response.status_code == 400
+            assert 'must be a list of strings' in response.get_json()['error']
+    mock_get_data.assert_not_called()
+
+def make_range_frame(hours=48):
+    """Build an hourly frame as returned by the data fetcher"""
+    start_times = pd.date_range('2024-01-01', periods=hours, freq='h', tz='UTC')
+    return pd.DataFrame({
+        'start_time': start_times,
+        'consumption': [1.0] * hours,
+        'provided_cost': [0.5] * hours,
+        'account_name': 'Account 7277230355'
+    })
+
+RANGE_REQUEST = {
+    'credentials': {'username': 'u', 'password': 'p', 'utility': 'portlandgeneral'},
+    'start_date': '2024-01-01',
+    'end_date': '2024-01-02'
+}
+
+def test_energy_range_streams_csv(client):
+    """Test that /energy/range streams CSV chunks when asked for text/csv"""
+    with patch('data_fetcher.get_data_by_date_range', return_value=make_range_frame()), \
+         patch('exports.CHUNK_ROWS', 10):
+        response = client.post('/energy/range', json=RANGE_REQUEST, headers={'Accept': 'text/csv'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    lines = response.get_data(as_text=True).strip().split('\n')
+    assert lines[0] == 'start_time,consumption,provided_cost,account_name'
+    assert len(lines) == 49
+
+def test_energy_range_returns_arrow_stream(client):
+    """Test that /energy/range returns an Arrow IPC stream readable by pyarrow"""
+    pa = pytest.importorskip('pyarrow')
+    with patch('data_fetcher.get_data_by_date_range', return_value=make_range_frame()):
+        response = client.post('/energy/range', json=dict(RANGE_REQUEST, format='arrow'))
+    assert response.status_code == 200
+    table = pa.ipc.open_stream(response.get_data()).read_all()
+    assert table.num_rows == 48
+    assert table.column('consumption').to_pylist()[0] == 1.0
+
+def run_asgi(application, path, body, method='POST'):
+    """Send one HTTP request through an ASGI application and return the messages it sent"""
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'raw_path': path.encode(),
+        'root_path': '', 'scheme': 'http', 'query_string': b'', 'server': ('testserver', 80),
+        'client': ('127.0.0.1', 1234), 'http_version': '1.1', 'asgi': {'version': '3.0'},
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    }
+    received = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    sent = []
+
+    async def receive():
+        if received:
+            return received.pop(0)
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(application(scope, receive, send))
+    return sent
+
+def test_asgi_fetches_on_event_loop_before_serving_from_cache():
+    """Test that the ASGI entry point awaits the fetch so the Flask view answers from the cache"""
+    body = json.dumps(dict(RANGE_REQUEST, resolution='day')).encode()
+
+    async def async_fetch(credentials, start_date, end_date):
+        return make_range_frame()
+
+    data_fetcher.RESPONSE_CACHE.clear()
+    with patch('data_fetcher.USE_INTERVAL_STORE', False), \
+         patch('data_fetcher.async_fetch_intervals', side_effect=async_fetch), \
+         patch('data_fetcher.fetch_intervals') as mock_fetch:
+        sent = run_asgi(asgi.application, '/energy/range', body)
+    data_fetcher.RESPONSE_CACHE.clear()
+    data_fetcher.ROLLUPS.clear()
+
+    mock_fetch.assert_not_called()
+    assert sent[0]['status'] == 200
+    rows = json.loads(b''.join(message.get('body', b'') for message in sent[1:]))
+    assert [row['consumption'] for row in rows] == [24.0, 24.0]
+
+def test_asgi_rejects_invalid_requests_before_fetching():
+    """Test that a request the Flask view rejects is not fetched on the event loop first"""
+    with patch('data_fetcher.async_fetch_intervals') as mock_async_fetch, \
+         patch('data_fetcher.fetch_intervals') as mock_fetch:
+        bad_resolution = run_asgi(asgi.application, '/energy/range',
+                                  json.dumps(dict(RANGE_REQUEST, resolution='fortnight')).encode())
+        with patch('exports.arrow_available', return_value=False):
+            no_arrow = run_asgi(asgi.application, '/energy/range',
+                                json.dumps(dict(RANGE_REQUEST, format='arrow')).encode())
+    mock_async_fetch.assert_not_called()
+    mock_fetch.assert_not_called()
+    assert bad_resolution[0]['status'] == 400
+    assert no_arrow[0]['status'] == 406
+
+def test_asgi_serves_wsgi_requests_concurrently():
+    """Test that WSGI requests run on a thread pool instead of one shared thread"""
+    barrier = threading.Barrier(2, timeout=5)
+
+    def wsgi_app(environ, start_response):
+        # Only returns if the other request is running at the same time
+        barrier.wait()
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'ok']
+
+    application = asgi.ThreadPoolWsgiToAsgi(wsgi_app)
+
+    async def both():
+        await asyncio.gather(*(asyncio.to_thread(run_asgi, application, '/', b'', 'GET') for _ in range(2)))
+        return True
+
+    assert asyncio.run(both())
+    assert not barrier.broken
+
+def test_energy_job_returns_id_then_status_and_result(client, tmp_path):
+    """Test that /energy/jobs queues a fetch, reports its chunks and serves the result"""
+    queue = fetch_jobs.FetchJobQueue(str(tmp_path / 'jobs.sqlite3'), workers=1)
+    with patch('fetch_jobs.get_job_queue', return_value=queue), \
+         patch('data_fetcher.USE_INTERVAL_STORE', False), \
+         patch('data_fetcher.fetch_intervals', return_value=make_range_frame()):
+        response = client.post('/energy/jobs', json=RANGE_REQUEST)
+        assert response.status_code == 202
+        job_id = response.get_json()['job_id']
+        queue._executor.shutdown(wait=True)
+
+        status = client.get(f'/energy/jobs/{job_id}').get_json()
+        assert status['status'] == 'done'
+        assert status['chunks_done'] == status['chunks_total'] == 1
+        result = client.get(f"{status['result_url']}?resolution=day&fields=consumption")
+        assert client.get('/energy/jobs/unknown').status_code == 404
+    data_fetcher.RESPONSE_CACHE.clear()
+    data_fetcher.ROLLUPS.clear()
+    queue.close()
+    assert [row['consumption'] for row in result.get_json()] == [24.0, 24.0]
+
+def test_figures_resolve_credentials_per_session():
+    """Test that concurrent users each see their own data and anonymous callbacks do nothing"""
+    year_data = make_year_data(2)
+    cube = rollups.RollupCube()
+    cube.update(year_data)
+    now = year_data['start_time'].iloc[-1]
+    titles = []
+    with patch('data_fetcher.get_current_year_data', return_value=year_data) as mock_year, \
+         patch('data_fetcher.get_rollup', return_value=cube):
+        for username in ('alice@example.com', 'bob@example.com'):
+            with logged_in_request(username):
+                version = sync_data(0, None)
+                titles.append(update_daily_figure(version, now.year, now.strftime('%B'), None)[2])
+        with server.test_request_context('/_dash-update-component'):
+            with pytest.raises(PreventUpdate):
+                sync_data(0, None)
+    assert 'alice@example.com' in titles[0]
+    assert 'bob@example.com' in titles[1]
+    assert [call.args[0]['username'] for call in mock_year.call_args_list] == ['alice@example.com', 'bob@example.com']
+
+def test_portfolio_summary_requires_token(client):
+    """Test that fleet views are only served with the portfolio token"""
+    fleet = (portfolio.CredentialRegistry(), portfolio.PortfolioFetcher())
+    with patch('portfolio.DEFAULT_PORTFOLIO_PATH', 'portfolio.json'), \
+         patch.dict('os.environ', {'WATT_SEER_PORTFOLIO_TOKEN': 'secret'}), \
+         patch('portfolio.get_portfolio', return_value=fleet):
+        assert client.get('/portfolio/summary').status_code == 401
+        assert client.get('/portfolio/summary', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+        response = client.get('/portfolio/summary?by=member', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert response.get_json() == {'households': 0, 'refreshed_at': None, 'rows': []}
+
+def test_figures_are_memoized_and_unchanged_views_send_nothing():
+    """Test that a figure built from the same data is served from the figure cache"""
+    year_data = make_year_data()
+    cube = rollups.RollupCube()
+    cube.update(year_data)
+    version = {'user': 'test@example.com', 'version': cube.version, 'empty': False}
+    year = year_data['start_time'].iloc[-1].year
+    app_module.FIGURE_CACHE.clear()
+    with patch('data_fetcher.get_rollup', return_value=cube), \
+         patch('app.monthly_figure', wraps=app_module.monthly_figure) as mock_build, \
+         patch('app.figure_traces', wraps=app_module.figure_traces) as mock_traces:
+        mock_build.__name__ = 'monthly_figure'
+        with logged_in_request('test@example.com'):
+            first, meta = update_monthly_figure(version, year, None)
+            second, _ = update_monthly_figure(dict(version, version=version['version'] + 1), year, None)
+            unchanged = update_monthly_figure(dict(version, version=version['version'] + 2), year, meta)
+    assert mock_build.call_count == 1
+    assert mock_traces.call_count == 1
+    assert first == second
+    assert unchanged == (no_update, no_update)
+
+def test_hourly_view_is_downsampled_and_resampled_on_zoom():
+    """Test that the hourly view sends at most HOURLY_POINTS per trace and zooms in at full resolution"""
+    cube = rollups.RollupCube()
+    cube.update(pd.DataFrame({
+        'start_time': pd.date_range('2024-01-01', periods=24 * 120, freq='h', tz='UTC'),
+        'consumption': [1.0] * (24 * 120),
+        'account_name': 'Account 7277230355'
+    }))
+    # An account that only has data after the zoomed range
+    cube.update(pd.DataFrame({
+        'start_time': pd.date_range('2024-04-01', periods=24 * 20, freq='h', tz='UTC'),
+        'consumption': [2.0] * (24 * 20),
+        'account_name': 'Account 0858033726'
+    }))
+    version = {'user': 'test@example.com', 'version': cube.version, 'empty': False}
+    with patch('data_fetcher.get_rollup', return_value=cube), \
+         patch('data_fetcher.get_data_by_date_range'), \
+         patch('app.HOURLY_POINTS', 100):
+        with logged_in_request('test@example.com'):
+            figure = update_hourly_figure(version, 2024, None)
+            zoomed = zoom_hourly_figure(
+                {'xaxis.range[0]': '2024-02-01 00:00', 'xaxis.range[1]': '2024-02-02 00:00'}, version, 2024)
+    assert [trace.name for trace in figure.data] == ['Account 0858033726', 'Account 7277230355', 'Total']
+    assert [trace.type for trace in figure.data] == ['scattergl'] * 3
+    assert all(len(trace.x) == 100 for trace in figure.data)
+    # Traces are patched at the positions of the drawn ones, and emptied when out of range
+    points = {tuple(operation['location']): len(operation['params']['value'])
+              for operation in zoomed.to_plotly_json()['operations']}
+    assert points == {
+        ('data', 0, 'x'): 0, ('data', 0, 'y'): 0,
+        ('data', 1, 'x'): 24, ('data', 1, 'y'): 24,
+        ('data', 2, 'x'): 24, ('data', 2, 'y'): 24
+    }
+
+def test_tariff_compare_prices_every_plan_for_every_account(client):
+    """Test that /energy/tariff-compare returns one row per plan and account and the cheapest plan"""
+    plans = [
+        {'name': 'Flat', 'energy_rate': 0.2},
+        {'name': 'Night', 'energy_rate': 0.3, 'periods': [{'rate': 0.05, 'hours': list(range(0, 8))}]}
+    ]
+    with patch('data_fetcher.get_data_by_date_range', return_value=make_range_frame()) as mock_get_data:
+        response = client.post('/energy/tariff-compare', json=dict(RANGE_REQUEST, plans=plans))
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['plans'] == ['Flat', 'Night']
+    assert [(row['plan'], row['total']) for row in body['rows']] == [('Flat', pytest.approx(9.6)), ('Night', pytest.approx(10.4))]
+    assert body['best_plan'] == {'Account 7277230355': 'Flat'}
+    mock_get_data.assert_called_once()
+
+    with patch('data_fetcher.get_data_by_date_range') as mock_get_data:
+        response = client.post('/energy/tariff-compare', json=dict(RANGE_REQUEST, plans=[{'name': 'Flat'}]))
+    assert response.status_code == 400
+    mock_get_data.assert_not_called()
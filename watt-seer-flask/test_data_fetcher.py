@@ -0,0 +1,658 @@
+import pytest
+import pandas as pd
+import numpy as np
+from datetime import datetime
+import pytz
+import data_fetcher
+import opower_client
+import interval_store
+import response_cache
+import rollups
+import fetch_scheduler
+import fetch_jobs
+import prefetch
+import portfolio
+import downsampling
+import dat_cache
+import tariffs
+import views
+import os
+import time
+import threading
+import asyncio
+from unittest.mock import patch, MagicMock
+
+CREDENTIALS = {
+    'username': 'test@example.com',
+    'password': 'testpass',
+    'utility': 'portlandgeneral'
+}
+
+def make_intervals(start, hours, account_id='7277230355'):
+    """Build an hourly frame shaped like the parsed opower output"""
+    start_times = pd.date_range(start, periods=hours, freq='h', tz='UTC')
+    return pd.DataFrame({
+        'start_time': start_times,
+        'end_time': start_times + pd.Timedelta(hours=1),
+        'consumption': [1.0] * hours,
+        'provided_cost': [0.2] * hours,
+        'account_id': account_id,
+        'customer_uuid': 'customer-uuid',
+        'account_uuid': f'uuid-{account_id}',
+        'account_name': f'Account {account_id}'
+    })
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    data_fetcher.RESPONSE_CACHE.clear()
+    data_fetcher.ROLLUPS.clear()
+    data_fetcher._verified_logins.clear()
+    yield
+    data_fetcher.RESPONSE_CACHE.clear()
+    data_fetcher.ROLLUPS.clear()
+    data_fetcher._verified_logins.clear()
+
+@pytest.fixture
+def store(tmp_path):
+    store = interval_store.IntervalStore(str(tmp_path / 'intervals.sqlite3'))
+    with patch('interval_store.get_interval_store', return_value=store):
+        yield store
+    store.close()
+
+def test_store_round_trip(store):
+    """Test that saved intervals are loaded back with account columns"""
+    store.save(CREDENTIALS, make_intervals('2024-01-01', 48))
+    df = store.load(CREDENTIALS, datetime(2024, 1, 1, tzinfo=pytz.UTC), datetime(2024, 1, 1, tzinfo=pytz.UTC))
+    assert len(df) == 24
+    assert df['account_name'].iloc[0] == 'Account 7277230355'
+    assert df['consumption'].sum() == 24.0
+
+def test_second_fetch_only_requests_new_days(store):
+    """Test that a repeated range only asks the utility for days after the high-water mark"""
+    start = datetime(2024, 1, 1, tzinfo=pytz.UTC)
+    end = datetime(2024, 1, 10, tzinfo=pytz.UTC)
+    with patch('data_fetcher.fetch_intervals') as mock_run:
+        mock_run.return_value = make_intervals('2024-01-01', 9 * 24)
+        first = data_fetcher.get_data_by_date_range(start, end, CREDENTIALS)
+        assert mock_run.call_count == 1
+        assert len(first) == 9 * 24
+
+        mock_run.return_value = make_intervals('2024-01-09', 2 * 24)
+        second = data_fetcher.get_data_by_date_range(start, datetime(2024, 1, 11, tzinfo=pytz.UTC), CREDENTIALS)
+        fetch_start = mock_run.call_args[0][1]
+        assert fetch_start.date().isoformat() == '2024-01-09'
+        assert len(second) == 10 * 24
+
+def test_stored_range_requires_an_accepted_password(store):
+    """Test that intervals already in the store are only served after the utility accepts the password"""
+    start = datetime(2024, 1, 1, tzinfo=pytz.UTC)
+    end = datetime(2024, 1, 3, tzinfo=pytz.UTC)
+    with patch('data_fetcher.fetch_intervals', return_value=make_intervals('2024-01-01', 9 * 24)):
+        data_fetcher.get_data_by_date_range(start, datetime(2024, 1, 10, tzinfo=pytz.UTC), CREDENTIALS)
+    assert store.missing_ranges(CREDENTIALS, start, end) == []
+
+    wrong = dict(CREDENTIALS, password='wrong')
+    client = MagicMock()
+    client.validate.side_effect = RuntimeError("Login failed")
+    with patch('data_fetcher.FETCH_BACKEND', 'library'), \
+         patch('opower_client.is_available', return_value=True), \
+         patch('opower_client.get_client', return_value=client), \
+         patch('data_fetcher.fetch_intervals') as mock_run:
+        with pytest.raises(RuntimeError):
+            data_fetcher.get_data_by_date_range(start, end, wrong, revalidate=False)
+        assert mock_run.call_count == 0
+        assert client.validate.call_args[0][0]['password'] == 'wrong'
+
+        # The password that synced the store was accepted, so it is served without another login
+        assert len(data_fetcher.get_data_by_date_range(start, end, CREDENTIALS)) == 3 * 24
+        assert client.validate.call_count == 1
+
+def test_earlier_range_fetches_only_missing_head(store):
+    """Test that extending the range backwards fetches only the missing dates"""
+    with patch('data_fetcher.fetch_intervals') as mock_run:
+        mock_run.return_value = make_intervals('2024-02-01', 24)
+        data_fetcher.get_data_by_date_range(
+            datetime(2024, 2, 1, tzinfo=pytz.UTC), datetime(2024, 2, 2, tzinfo=pytz.UTC), CREDENTIALS)
+
+        mock_run.return_value = make_intervals('2024-01-30', 48)
+        ranges = store.missing_ranges(
+            CREDENTIALS, datetime(2024, 1, 30, tzinfo=pytz.UTC), datetime(2024, 2, 1, tzinfo=pytz.UTC))
+        assert [(s.date().isoformat(), e.date().isoformat()) for s, e in ranges] == [('2024-01-30', '2024-02-01')]
+
+def test_dormant_account_does_not_pin_the_resume_day(store):
+    """Test that an account that stopped reporting weeks ago is not re-fetched from its last interval"""
+    store.save(CREDENTIALS, make_intervals('2024-01-01', 24, account_id='0858033726'))
+    store.save(CREDENTIALS, make_intervals('2024-01-01', 60 * 24))
+    store.mark_synced(CREDENTIALS, datetime(2024, 1, 1, tzinfo=pytz.UTC), datetime(2024, 3, 1, tzinfo=pytz.UTC))
+    ranges = store.missing_ranges(CREDENTIALS, datetime(2024, 1, 1, tzinfo=pytz.UTC), datetime(2024, 3, 5, tzinfo=pytz.UTC))
+    assert [(s.date().isoformat(), e.date().isoformat()) for s, e in ranges] == [('2024-02-29', '2024-03-05')]
+
+def test_fetch_intervals_uses_library_client():
+    """Test that the in-process client is used when the library backend is available"""
+    with patch('data_fetcher.FETCH_BACKEND', 'library'), \
+         patch('opower_client.is_available', return_value=True), \
+         patch('opower_client.get_client') as mock_get_client, \
+         patch('data_fetcher.run_opower_command') as mock_run:
+        mock_get_client.return_value.fetch.return_value = make_intervals('2024-01-01', 24)
+        df = data_fetcher.fetch_intervals(CREDENTIALS, datetime(2024, 1, 1), datetime(2024, 1, 2))
+        assert len(df) == 24
+        mock_run.assert_not_called()
+
+def test_fetch_intervals_falls_back_to_subprocess():
+    """Test that the subprocess backend is used when configured"""
+    with patch('data_fetcher.FETCH_BACKEND', 'subprocess'), \
+         patch('opower_client.get_client') as mock_get_client, \
+         patch('data_fetcher.run_opower_command') as mock_run:
+        mock_run.return_value = make_intervals('2024-01-01', 24)
+        data_fetcher.fetch_intervals(CREDENTIALS, datetime(2024, 1, 1), datetime(2024, 1, 2))
+        mock_run.assert_called_once()
+        mock_get_client.assert_not_called()
+
+def test_opower_client_drops_failed_forgotten_and_least_recent_logins():
+    """Test that the client keeps no state for rejected logins, forgets on request and bounds its sessions"""
+    class FakeOpower:
+        def __init__(self, http_session, utility, username, password, totp_secret=None):
+            self.password = password
+
+        async def async_login(self):
+            if self.password == 'wrong':
+                raise RuntimeError('Login failed')
+
+    client = opower_client.OpowerClient()
+    users = [dict(CREDENTIALS, username=f'{name}@example.com') for name in 'abc']
+    try:
+        with patch('opower_client.Opower', FakeOpower), patch('opower_client.MAX_LOGINS', 2):
+            for credentials in users:
+                client.validate(credentials)
+            assert list(client._logins) == [opower_client.credential_key(credentials) for credentials in users[1:]]
+
+            wrong = dict(CREDENTIALS, password='wrong')
+            with pytest.raises(RuntimeError):
+                client.validate(wrong)
+            assert opower_client.credential_key(wrong) not in client._logins
+            assert opower_client.credential_key(wrong) not in client._login_locks
+
+            client.forget(users[1])
+            assert list(client._logins) == [opower_client.credential_key(users[2])]
+            assert set(client._login_locks) == {opower_client.credential_key(users[2])}
+    finally:
+        client.close()
+
+def test_response_cache_serves_repeated_range():
+    """Test that a repeated range within the TTL is served from memory"""
+    start = datetime(2024, 1, 1, tzinfo=pytz.UTC)
+    end = datetime(2024, 1, 2, tzinfo=pytz.UTC)
+    with patch('data_fetcher.load_date_range', return_value=make_intervals('2024-01-01', 24)) as mock_load:
+        data_fetcher.get_data_by_date_range(start, end, CREDENTIALS)
+        df = data_fetcher.get_data_by_date_range(start, end, CREDENTIALS)
+        assert mock_load.call_count == 1
+        assert len(df) == 24
+
+def test_response_cache_returns_stale_and_refreshes():
+    """Test that a stale entry is returned immediately and refreshed in the background"""
+    cache = response_cache.ResponseCache(ttl=0, max_stale=60)
+    cache.put('key', make_intervals('2024-01-01', 24))
+    fetch = lambda: make_intervals('2024-01-01', 48)
+    assert len(cache.get_or_fetch('key', fetch)) == 24
+    deadline = time.monotonic() + 5
+    while cache._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+    cache.ttl = 60
+    assert len(cache.get_or_fetch('key', fetch)) == 48
+
+def test_response_cache_evicts_least_recently_used():
+    """Test that entries beyond the limit are evicted in LRU order"""
+    cache = response_cache.ResponseCache(max_entries=2)
+    cache.put('a', make_intervals('2024-01-01', 1))
+    cache.put('b', make_intervals('2024-01-01', 1))
+    cache.get_or_fetch('a', lambda: None)
+    cache.put('c', make_intervals('2024-01-01', 1))
+    assert len(cache) == 2
+    assert cache.get_or_fetch('b', lambda: 'fetched') == 'fetched'
+
+def test_concurrent_fetches_share_one_load():
+    """Test that concurrent callers for a covered range wait on one in-flight fetch"""
+    from concurrent.futures import ThreadPoolExecutor
+    started = threading.Event()
+    release = threading.Event()
+    def slow_load(start_date, end_date, credentials):
+        started.set()
+        release.wait(5)
+        return make_intervals('2024-01-01', 10 * 24)
+    year = (datetime(2024, 1, 1, tzinfo=pytz.UTC), datetime(2024, 1, 10, tzinfo=pytz.UTC))
+    week = (datetime(2024, 1, 2, tzinfo=pytz.UTC), datetime(2024, 1, 8, tzinfo=pytz.UTC))
+    with patch('data_fetcher.load_date_range', side_effect=slow_load) as mock_load, \
+         ThreadPoolExecutor(max_workers=3) as pool:
+        leader = pool.submit(data_fetcher.get_data_by_date_range, *year, CREDENTIALS)
+        assert started.wait(5)
+        same = pool.submit(data_fetcher.get_data_by_date_range, *year, CREDENTIALS)
+        inner = pool.submit(data_fetcher.get_data_by_date_range, *week, CREDENTIALS)
+        # Give the followers time to find the in-flight fetch
+        time.sleep(0.1)
+        release.set()
+        assert len(leader.result()) == 10 * 24
+        assert len(same.result()) == 10 * 24
+        assert len(inner.result()) == 7 * 24
+        assert mock_load.call_count == 1
+
+OPOWER_OUTPUT = """Current bill forecast: Forecast(account=...)
+
+Getting historical data: account= Account(customer=Customer(uuid='cust-1'), uuid='acct-1', utility_account_id='7277230355', id='7277230355') aggregate_type= hour
+start_time\tend_time\tconsumption\tprovided_cost\tstart_minus_prev_end\tend_minus_prev_end
+2024-03-10 00:00:00-08:00\t2024-03-10 01:00:00-08:00\t0.377\t0.065\tNone\tNone
+2024-03-10 01:00:00-08:00\t2024-03-10 03:00:00-07:00\t0.355\tNone\t0:00:00\t1:00:00
+
+Getting historical data: account= Account(customer=Customer(uuid='cust-1'), uuid='acct-2', utility_account_id='0858033726', id='0858033726') aggregate_type= hour
+start_time\tend_time\tconsumption\tprovided_cost\tstart_minus_prev_end\tend_minus_prev_end
+2024-03-10 00:00:00-08:00\t2024-03-10 01:00:00-08:00\t1.5\t0.25\tNone\tNone
+"""
+
+def test_output_parser_builds_one_frame_for_all_accounts():
+    """Test that streamed opower output is parsed into one typed frame"""
+    parser = data_fetcher.OpowerOutputParser()
+    for line in OPOWER_OUTPUT.splitlines(keepends=True):
+        parser.feed(line)
+    df = parser.to_frame()
+    assert len(df) == 3
+    assert list(df['account_name']) == ['Account 7277230355', 'Account 7277230355', 'Account 0858033726']
+    assert list(df['account_uuid']) == ['acct-1', 'acct-1', 'acct-2']
+    assert df['start_time'].iloc[1] == pd.Timestamp('2024-03-10 09:00', tz='UTC')
+    assert pd.isna(df['provided_cost'].iloc[1])
+    assert df['consumption'].sum() == pytest.approx(2.232)
+
+def test_parsed_frame_uses_categorical_accounts_and_typed_values():
+    """Test that account columns are categorical and values use the configured dtype"""
+    parser = data_fetcher.OpowerOutputParser()
+    with patch('data_fetcher.VALUE_DTYPE', np.dtype('float32')):
+        for line in OPOWER_OUTPUT.splitlines(keepends=True):
+            parser.feed(line)
+        df = parser.to_frame()
+    for column in data_fetcher.ACCOUNT_COLUMNS:
+        assert isinstance(df[column].dtype, pd.CategoricalDtype)
+    assert list(df['customer_uuid'].cat.categories) == ['cust-1']
+    assert df['consumption'].dtype == np.float32
+    assert str(df['start_time'].dtype).endswith('UTC]')
+
+def test_rollup_cube_folds_only_changed_hours():
+    """Test that re-fetched hours replace their old values in every rollup level"""
+    cube = rollups.RollupCube()
+    assert cube.update(make_intervals('2024-01-01', 48)) == 48
+    assert cube.update(make_intervals('2024-01-02', 24)) == 0
+
+    refetched = make_intervals('2024-01-02', 24)
+    refetched['consumption'] = 2.0
+    assert cube.update(refetched) == 24
+
+    daily = cube.frame('day')
+    totals = daily[daily['account_name'] == 'Total']
+    assert list(totals['consumption']) == [24.0, 48.0]
+    monthly = cube.frame('month', include_total=False)
+    assert monthly['consumption'].tolist() == [72.0]
+    assert cube.frame('year', start=datetime(2025, 1, 1, tzinfo=pytz.UTC)).empty
+
+    # Hourly windows are sliced from the stored columns, with the per-hour total
+    hourly = cube.frame('hour', start=datetime(2024, 1, 2, 22, tzinfo=pytz.UTC), end=datetime(2024, 1, 3, tzinfo=pytz.UTC))
+    assert hourly['period'].tolist() == [pd.Timestamp('2024-01-02 22:00')] * 2 + [pd.Timestamp('2024-01-02 23:00')] * 2
+    assert hourly['consumption'].tolist() == [2.0, 2.0, 2.0, 2.0]
+    assert len(cube.frame('hour', include_total=False)) == 48
+
+def test_sync_feeds_rollup(store):
+    """Test that fetched intervals are rolled up for the credential"""
+    with patch('data_fetcher.fetch_intervals', return_value=make_intervals('2024-01-01', 24)):
+        data_fetcher.get_data_by_date_range(
+            datetime(2024, 1, 1, tzinfo=pytz.UTC), datetime(2024, 1, 1, tzinfo=pytz.UTC), CREDENTIALS)
+    quarterly = data_fetcher.get_rollup(CREDENTIALS).frame('quarter')
+    assert quarterly['consumption'].tolist() == [24.0, 24.0]
+
+def test_rollups_keep_only_the_most_recently_used_credentials():
+    """Test that rollup cubes beyond MAX_ROLLUPS are dropped least recently used first"""
+    with patch('data_fetcher.USE_INTERVAL_STORE', False), patch('data_fetcher.MAX_ROLLUPS', 2):
+        first = data_fetcher.get_rollup(CREDENTIALS)
+        data_fetcher.get_rollup(dict(CREDENTIALS, username='b@example.com'))
+        assert data_fetcher.get_rollup(CREDENTIALS) is first
+        data_fetcher.get_rollup(dict(CREDENTIALS, username='c@example.com'))
+    assert len(data_fetcher.ROLLUPS) == 2
+    assert opower_client.credential_key(CREDENTIALS) in data_fetcher.ROLLUPS
+
+def test_seeding_a_rollup_only_blocks_its_own_credential():
+    """Test that a slow cold seed of one credential leaves other credentials' cubes available"""
+    other = dict(CREDENTIALS, username='b@example.com')
+    data_fetcher.ROLLUPS[opower_client.credential_key(other)] = rollups.RollupCube()
+    loading = threading.Event()
+    release = threading.Event()
+    store = MagicMock()
+    store.synced_window.return_value = (datetime(2024, 1, 1).date(), datetime(2024, 1, 2).date())
+    def load(credentials, start, end):
+        loading.set()
+        release.wait(5)
+        return make_intervals('2024-01-01', 48)
+    store.load.side_effect = load
+    with patch('data_fetcher.USE_INTERVAL_STORE', True), \
+         patch('interval_store.get_interval_store', return_value=store):
+        seeds = [threading.Thread(target=data_fetcher.get_rollup, args=(CREDENTIALS,)) for _ in range(2)]
+        for seed in seeds:
+            seed.start()
+        assert loading.wait(5)
+        started = time.monotonic()
+        data_fetcher.get_rollup(other)
+        assert time.monotonic() - started < 1
+        release.set()
+        for seed in seeds:
+            seed.join(5)
+    assert store.load.call_count == 1
+    assert data_fetcher.get_rollup(CREDENTIALS).hour_count() == 48
+    assert not data_fetcher._seed_locks
+
+def test_split_range_aligns_chunks_to_quarters():
+    """Test that a range is split into quarter-aligned chunks sharing boundary days"""
+    chunks = fetch_scheduler.split_range(datetime(2024, 2, 15), datetime(2024, 8, 1), 'quarter')
+    assert [(s.date().isoformat(), e.date().isoformat()) for s, e in chunks] == [
+        ('2024-02-15', '2024-04-01'), ('2024-04-01', '2024-07-01'), ('2024-07-01', '2024-08-01')]
+
+def test_scheduler_reassembles_chunks_in_order_without_overlap():
+    """Test that chunks are fetched concurrently, retried, and de-duplicated on reassembly"""
+    attempts = []
+    def fetch(credentials, start_date, end_date):
+        attempts.append(start_date)
+        if start_date.month == 4 and attempts.count(start_date) == 1:
+            raise Exception('rate limited')
+        hours = int((end_date - start_date).total_seconds() // 3600) + 24
+        return make_intervals(start_date.strftime('%Y-%m-%d'), hours)
+    scheduler = fetch_scheduler.FetchScheduler(max_workers=4, per_utility_limit=2, backoff=0)
+    chunks = fetch_scheduler.split_range(datetime(2024, 1, 1), datetime(2024, 7, 1), 'quarter')
+    df = scheduler.fetch_chunks(CREDENTIALS, chunks, fetch)
+    assert len(attempts) == 3
+    assert df['start_time'].is_monotonic_increasing
+    assert not df.duplicated(subset=['account_uuid', 'start_time']).any()
+    assert df['start_time'].iloc[0] == pd.Timestamp('2024-01-01', tz='UTC')
+
+def test_async_range_fetch_streams_subprocess_and_fills_cache():
+    """Test that the async path parses the child's output and the sync getter then hits the cache"""
+    cmd = ['python', '-c', f'import sys; sys.stdout.write({OPOWER_OUTPUT!r})']
+    start_date = datetime(2024, 3, 10, tzinfo=pytz.UTC)
+    with patch('data_fetcher.FETCH_BACKEND', 'subprocess'), \
+         patch('data_fetcher.USE_INTERVAL_STORE', False), \
+         patch('data_fetcher.build_opower_command', return_value=cmd):
+        df = asyncio.run(data_fetcher.async_get_data_by_date_range(start_date, start_date, CREDENTIALS))
+    assert len(df) == 3
+    assert isinstance(df['account_name'].dtype, pd.CategoricalDtype)
+    with patch('data_fetcher.fetch_intervals') as mock_fetch:
+        cached = data_fetcher.get_data_by_date_range(start_date, start_date, CREDENTIALS)
+    mock_fetch.assert_not_called()
+    assert len(cached) == 3
+
+def test_async_range_joins_in_flight_fetches_and_stores_off_the_loop(store):
+    """Test that concurrent async loads share one fetch and do their SQLite work outside the event loop"""
+    start = datetime(2024, 1, 1, tzinfo=pytz.UTC)
+    end = datetime(2024, 1, 3, tzinfo=pytz.UTC)
+    fetches = []
+    loop_threads = set()
+    save = store.save
+
+    async def async_fetch(credentials, start_date, end_date):
+        fetches.append(start_date)
+        loop_threads.add(threading.get_ident())
+        await asyncio.sleep(0.05)
+        return make_intervals('2024-01-01', 3 * 24)
+
+    def record_save(credentials, df):
+        assert threading.get_ident() not in loop_threads
+        return save(credentials, df)
+
+    async def load_twice():
+        return await asyncio.gather(*(data_fetcher.async_get_data_by_date_range(start, end, CREDENTIALS) for _ in range(2)))
+
+    with patch('data_fetcher.async_fetch_intervals', side_effect=async_fetch), \
+         patch.object(store, 'save', side_effect=record_save) as mock_save:
+        first, second = asyncio.run(load_twice())
+    assert len(fetches) == 1
+    assert mock_save.call_count == 1
+    assert len(first) == len(second) == 3 * 24
+
+def test_fetch_job_records_chunk_progress_and_result(store, tmp_path):
+    """Test that a background job reports every chunk and keeps its result until the TTL passes"""
+    def fetch(credentials, start_date, end_date):
+        return make_intervals(start_date.strftime('%Y-%m-%d'), 24)
+    queue = fetch_jobs.FetchJobQueue(str(tmp_path / 'jobs.sqlite3'), workers=1, result_ttl=60)
+    with patch('data_fetcher.fetch_intervals', side_effect=fetch):
+        job_id = queue.submit(CREDENTIALS, datetime(2024, 1, 1, tzinfo=pytz.UTC), datetime(2024, 5, 1, tzinfo=pytz.UTC))
+        queue.close()
+    # Status and results survive reopening the job database
+    reopened = fetch_jobs.FetchJobQueue(str(tmp_path / 'jobs.sqlite3'), workers=1, result_ttl=60)
+    status = reopened.status(job_id)
+    assert status['status'] == fetch_jobs.DONE
+    assert (status['chunks_done'], status['chunks_total']) == (2, 2)
+    assert status['chunks'][0] == {'start_date': '2024-01-01', 'end_date': '2024-04-01', 'status': fetch_jobs.DONE}
+    assert len(reopened.result(job_id)) == 48
+    reopened.result_ttl = 0
+    assert reopened.purge_expired() == 1
+    assert reopened.status(job_id) is None
+    reopened.close()
+
+def test_prefetch_scheduler_aligns_rate_limits_and_expires_sessions():
+    """Test that sessions are warmed at aligned slots, spaced per utility, and dropped when idle"""
+    now = [1000.0]
+    warmed = []
+    scheduler = prefetch.PrefetchScheduler(
+        lambda credentials: warmed.append(credentials['username']),
+        cadence=3600, offset=900, jitter=0, per_utility_interval=30, session_ttl=7200,
+        workers=1, clock=lambda: now[0])
+    scheduler.register(CREDENTIALS)
+    scheduler.register(dict(CREDENTIALS, username='neighbour@example.com'))
+    assert scheduler.run_pending() == []
+
+    now[0] = 3600 + 900
+    for future in scheduler.run_pending():
+        future.result()
+    assert warmed == ['test@example.com']
+    assert scheduler.run_pending() == []
+
+    now[0] += 30
+    for future in scheduler.run_pending():
+        future.result()
+    assert warmed == ['test@example.com', 'neighbour@example.com']
+
+    now[0] = 3 * 3600 + 900
+    scheduler.register(CREDENTIALS)
+    now[0] += 7200
+    scheduler.run_pending()
+    assert len(scheduler) == 1
+    scheduler.stop()
+
+def test_prefetch_fills_month_and_year_cache_entries():
+    """Test that a prefetch lets the dashboard read both ranges without fetching"""
+    with patch('data_fetcher.USE_INTERVAL_STORE', False), \
+         patch('data_fetcher.fetch_intervals', return_value=make_intervals(datetime.now(pytz.UTC).strftime('%Y-%m-%d'), 1)):
+        data_fetcher.prefetch_dashboard_data(CREDENTIALS)
+    with patch('data_fetcher.fetch_intervals') as mock_fetch:
+        year_data = data_fetcher.get_current_year_data(CREDENTIALS, revalidate=False)
+        month_data = data_fetcher.get_current_month_data(CREDENTIALS)
+    mock_fetch.assert_not_called()
+    assert len(year_data) == len(month_data) == 1
+
+def test_response_cache_holds_each_tenant_to_its_quota():
+    """Test that one tenant's entries are evicted to its quota without touching other tenants"""
+    frame = make_intervals('2024-01-01', 24)
+    size = response_cache.frame_size(frame)
+    cache = response_cache.ResponseCache(partition=lambda key: key[0], max_partition_bytes=2 * size)
+    cache.put(('alice', 1), frame)
+    cache.put(('bob', 1), frame)
+    cache.put(('alice', 2), frame)
+    cache.put(('alice', 3), frame)
+    assert cache.get(('alice', 1)) is None
+    assert cache.get(('bob', 1)) is not None
+    assert cache.partition_bytes('alice') == 2 * size
+
+def test_cached_range_requires_the_same_password():
+    """Test that a cached range is not served to a request with a different password"""
+    day = datetime(2024, 1, 1, tzinfo=pytz.UTC)
+    with patch('data_fetcher.USE_INTERVAL_STORE', False), \
+         patch('data_fetcher.fetch_intervals', return_value=make_intervals('2024-01-01', 24)) as mock_fetch:
+        data_fetcher.get_data_by_date_range(day, day, CREDENTIALS)
+        data_fetcher.get_data_by_date_range(day, day, dict(CREDENTIALS, password='wrong'))
+    assert mock_fetch.call_count == 2
+
+def test_portfolio_refresh_rolls_up_fleet_by_utility():
+    """Test that a portfolio refresh fetches every household and reports fleet percentiles"""
+    from concurrent.futures import ThreadPoolExecutor
+    registry = portfolio.CredentialRegistry([
+        dict(CREDENTIALS, username='a@example.com'),
+        dict(CREDENTIALS, username='b@example.com'),
+        dict(CREDENTIALS, username='c@example.com', utility='pacificpower')
+    ])
+    def fetch(credentials, start_date, end_date):
+        df = make_intervals('2024-01-01', 24, account_id=credentials['username'][0])
+        df['consumption'] = {'a': 1.0, 'b': 3.0, 'c': 2.0}[credentials['username'][0]]
+        return df
+    fetcher = portfolio.PortfolioFetcher(per_utility_limit=1)
+    fetcher._executor = ThreadPoolExecutor(max_workers=2)
+    with patch('data_fetcher.USE_INTERVAL_STORE', False), \
+         patch('data_fetcher.fetch_range_chunks', side_effect=fetch):
+        failures = fetcher.refresh(registry, datetime(2024, 1, 1, tzinfo=pytz.UTC), datetime(2024, 1, 1, tzinfo=pytz.UTC))
+    fetcher.close()
+    assert failures == {}
+    summary = portfolio.portfolio_rollup(fetcher.frame(), by='utility', resolution='day')
+    assert summary['utility'].tolist() == ['pacificpower', 'portlandgeneral']
+    assert summary['total'].tolist() == [48.0, 96.0]
+    assert summary['accounts'].tolist() == [1, 2]
+    assert summary['p50'].tolist() == [48.0, 48.0]
+
+def test_portfolio_refresh_runs_members_on_spawned_processes(tmp_path, monkeypatch):
+    """Test that _fetch_member and its arguments pickle into spawned workers, which fetch through the subprocess backend"""
+    # A fake "python -m opower" for the workers; spawned processes inherit the environment, not patches
+    (tmp_path / 'opower').mkdir()
+    (tmp_path / 'opower' / '__init__.py').write_text('')
+    (tmp_path / 'opower' / '__main__.py').write_text(f'import sys\nsys.stdout.write({OPOWER_OUTPUT!r})\n')
+    monkeypatch.setenv('PYTHONPATH', str(tmp_path))
+    monkeypatch.setenv('WATT_SEER_FETCH_BACKEND', 'subprocess')
+    registry = portfolio.CredentialRegistry([
+        dict(CREDENTIALS, username='a@example.com'),
+        dict(CREDENTIALS, username='b@example.com', utility='pacificpower')
+    ])
+    fetcher = portfolio.PortfolioFetcher(processes=2, per_utility_limit=1)
+    day = datetime(2024, 3, 10, tzinfo=pytz.UTC)
+    try:
+        with patch('data_fetcher.USE_INTERVAL_STORE', False):
+            failures = fetcher.refresh(registry, day, day)
+    finally:
+        fetcher.close()
+    assert failures == {}
+    frame = fetcher.frame()
+    assert sorted(frame['username'].unique()) == ['a@example.com', 'b@example.com']
+    assert frame.groupby('username', observed=True)['consumption'].sum().tolist() == [pytest.approx(2.232)] * 2
+
+def test_login_validation_only_logs_in_and_warms_dashboard_data():
+    """Test that the library backend validates with a login and the warmed data serves the dashboard"""
+    from concurrent.futures import ThreadPoolExecutor
+    today = datetime.now(pytz.UTC).strftime('%Y-%m-%d')
+    warmup = ThreadPoolExecutor(max_workers=1)
+    with patch('data_fetcher._warmup_executor', warmup), \
+         patch('data_fetcher.FETCH_BACKEND', 'library'), \
+         patch('data_fetcher.USE_INTERVAL_STORE', False), \
+         patch('opower_client.is_available', return_value=True), \
+         patch('opower_client.get_client') as mock_get_client:
+        mock_get_client.return_value.fetch.return_value = make_intervals(today, 1)
+        data_fetcher.validate_credentials(CREDENTIALS)
+        mock_get_client.return_value.validate.assert_called_once_with(CREDENTIALS)
+        warmup.shutdown(wait=True)
+        warmup_fetches = mock_get_client.return_value.fetch.call_count
+        year_data = data_fetcher.get_current_year_data(CREDENTIALS)
+    assert len(year_data) == 1
+    assert warmup_fetches > 0
+    assert mock_get_client.return_value.fetch.call_count == warmup_fetches
+
+def test_login_validation_by_fetch_keeps_the_result():
+    """Test that the subprocess backend's validating fetch is kept for the dashboard"""
+    today = datetime.now(pytz.UTC).strftime('%Y-%m-%d')
+    with patch('data_fetcher.FETCH_BACKEND', 'subprocess'), \
+         patch('data_fetcher.USE_INTERVAL_STORE', False), \
+         patch('data_fetcher.run_opower_command', return_value=make_intervals(today, 1)) as mock_run:
+        data_fetcher.validate_credentials(CREDENTIALS)
+        validation_fetches = mock_run.call_count
+        data_fetcher.get_current_year_data(CREDENTIALS)
+        data_fetcher.get_current_month_data(CREDENTIALS)
+    assert validation_fetches > 0
+    assert mock_run.call_count == validation_fetches
+
+def test_downsampling_keeps_endpoints_and_peaks():
+    """Test that LTTB and min/max decimation bound the points and keep the extremes"""
+    hours = pd.date_range('2024-01-01', periods=24 * 366, freq='h').to_numpy()
+    values = np.sin(np.arange(len(hours)) / 50.0)
+    values[1234] = 10.0
+    x, y = downsampling.downsample(hours, values, 500)
+    assert len(x) == 500
+    assert x[0] == hours[0] and x[-1] == hours[-1]
+    assert 10.0 in y
+    x, y = downsampling.downsample(hours, values, 500, method='minmax')
+    assert len(x) <= 500
+    assert y.max() == 10.0 and y.min() == values.min()
+    assert (np.diff(x.astype('int64')) > 0).all()
+
+def test_hour_day_matrix_reshapes_the_year():
+    """Test that a year of hourly totals becomes a 24 x days matrix"""
+    cube = rollups.RollupCube()
+    cube.update(make_intervals('2024-01-01', 48))
+    matrix, days = views.hour_day_matrix(cube, pd.Timestamp(2024, 1, 1))
+    assert matrix.shape == (24, 366)
+    assert len(days) == 366
+    assert matrix[5, 1] == 1.0
+    assert np.isnan(matrix[0, 2])
+
+def test_load_data_uses_sidecar_until_the_export_changes(tmp_path):
+    """Test that .dat exports are parsed once and re-parsed only when their content changes"""
+    export = tmp_path / 'energy.dat'
+    export.write_text(OPOWER_OUTPUT.split('aggregate_type= hour\n')[1].split('\n\n')[0] + '\n')
+    parsed = data_fetcher.load_data(str(export))
+    assert os.path.exists(os.path.join(dat_cache.sidecar_path(str(export)), 'meta.json'))
+
+    with patch('data_fetcher.parse_data_file') as mock_parse:
+        cached = data_fetcher.load_data(str(export))
+        # Touching the file keeps the sidecar because the content hash still matches
+        os.utime(export, ns=(0, 0))
+        data_fetcher.load_data(str(export))
+    assert mock_parse.call_count == 0
+    pd.testing.assert_frame_equal(cached, parsed)
+    assert cached['start_time'].iloc[1] == pd.Timestamp('2024-03-10 09:00')
+    assert pd.isna(cached['provided_cost'].iloc[1])
+
+    export.write_text(export.read_text().replace('0.377', '0.477'))
+    assert data_fetcher.load_data(str(export))['consumption'].iloc[0] == 0.477
+
+def test_concurrent_sidecar_writers_do_not_share_files(tmp_path):
+    """Test that interleaved sidecar writes of one export each publish whole columns and leave no temporary files"""
+    export = tmp_path / 'energy.dat'
+    export.write_text(OPOWER_OUTPUT.split('aggregate_type= hour\n')[1].split('\n\n')[0] + '\n')
+    parsed = data_fetcher.parse_data_file(str(export))
+    chunks = [parsed.iloc[:1], parsed.iloc[1:]]
+    abandoned = dat_cache.cache_chunks(str(export), chunks)
+    next(abandoned)
+    abandoned.close()
+    first = dat_cache.cache_chunks(str(export), chunks)
+    next(first)
+    assert len(list(dat_cache.cache_chunks(str(export), chunks))) == 2
+    assert len(list(first)) == 1
+    assert not [name for name in os.listdir(dat_cache.sidecar_path(str(export))) if name.endswith('.tmp')]
+    pd.testing.assert_frame_equal(dat_cache.sidecar_frame(dat_cache.read_sidecar(str(export))), parsed)
+
+def test_tariff_engine_prices_tou_tiers_and_fixed_charges():
+    """Test that plans are priced per local hour with monthly tiers and fixed charges"""
+    df = pd.concat([make_intervals('2024-07-01 07:00', 48), make_intervals('2024-07-01 07:00', 24, '0858033726')])
+    flat, tou = tariffs.parse_plans([
+        {'name': 'Flat', 'energy_rate': 0.1, 'fixed_monthly': 10,
+         'tiers': [{'up_to': 30, 'adder': 0.0}, {'up_to': None, 'adder': 0.05}]},
+        {'name': 'TOU', 'energy_rate': 0.1, 'periods': [
+            {'rate': 0.5, 'hours': [17, 18, 19, 20], 'days': 'weekdays', 'months': [6, 7, 8, 9]},
+            {'rate': 0.05, 'hours': [0, 1, 2, 3, 4, 5]}
+        ]}
+    ])
+    result = tariffs.compare_plans(df, [flat, tou]).set_index(['plan', 'account_name'])
+    # Monday and Tuesday, July 1-2 local time, for the first account; Monday only for the second
+    assert result.loc[('Flat', 'Account 7277230355'), 'energy_charge'] == pytest.approx(4.8)
+    assert result.loc[('Flat', 'Account 7277230355'), 'tier_charge'] == pytest.approx(18 * 0.05)
+    assert result.loc[('Flat', 'Account 0858033726'), 'tier_charge'] == 0
+    assert result.loc[('Flat', 'Account 0858033726'), 'fixed_charge'] == 10
+    assert result.loc[('TOU', 'Account 0858033726'), 'energy_charge'] == pytest.approx(4 * 0.5 + 6 * 0.05 + 14 * 0.1)
+    assert result.loc[('TOU', 'Account 7277230355'), 'total'] == pytest.approx(2 * (4 * 0.5 + 6 * 0.05 + 14 * 0.1))
+    assert result.loc[('TOU', 'Account 7277230355'), 'provided_cost'] == pytest.approx(48 * 0.2)
+    with pytest.raises(ValueError):
+        tariffs.parse_plans([{'name': 'Bad', 'energy_rate': 0.1, 'periods': [{'rate': 0.2, 'hours': [24]}]}])
@@ -0,0 +1,73 @@
+import threading
+import secrets
+import time
+import os
+import logging
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class SessionStore:
+    """Server-side credentials of logged-in dashboard sessions.
+
+    The Flask session cookie is signed but not encrypted, so it only
+    carries a random session id. Credentials stay in this process and are
+    dropped after idle_timeout seconds without a request. Other worker
+    processes cannot see them, so the app needs a single worker process
+    or sticky sessions.
+    """
+
+    def __init__(self, idle_timeout=86400, clock=time.monotonic):
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def create(self, credentials):
+        """Store credentials for a new session and return its id"""
+        session_id = secrets.token_urlsafe(32)
+        with self._lock:
+            self._expire()
+            self._sessions[session_id] = [dict(credentials), self.clock()]
+        logger.debug(f"Created session for {credentials['username']}")
+        return session_id
+
+    def get(self, session_id):
+        """Return the credentials of a session, or None if it is unknown or expired"""
+        if not session_id:
+            return None
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            now = self.clock()
+            if now - entry[1] > self.idle_timeout:
+                del self._sessions[session_id]
+                return None
+            entry[1] = now
+            return dict(entry[0])
+
+    def delete(self, session_id):
+        """Forget a session"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def holds(self, credentials):
+        """Return whether any live session belongs to the credentials' utility and username"""
+        household = (credentials['utility'], credentials['username'])
+        with self._lock:
+            self._expire()
+            return any((stored['utility'], stored['username']) == household for stored, _ in self._sessions.values())
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _expire(self):
+        """Drop idle sessions; the lock must be held"""
+        now = self.clock()
+        for session_id in [sid for sid, (_, seen) in self._sessions.items() if now - seen > self.idle_timeout]:
+            del self._sessions[session_id]
+
+
+SESSIONS = SessionStore(idle_timeout=float(os.environ.get('WATT_SEER_SESSION_IDLE_TIMEOUT', '86400')))
@@ -0,0 +1,161 @@
+import pandas as pd
+from datetime import datetime
+import pytz
+import logging
+from rollups import TOTAL_ACCOUNT, LEVELS, period_start
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+def daily_totals(cube, month_start):
+    """Daily consumption per account plus the total for one month"""
+    totals = cube.frame('day', start=month_start, end=month_start + pd.offsets.MonthBegin(1))
+    totals['date'] = totals['period'].dt.date
+    return totals
+
+
+def quarterly_totals(cube, year_start):
+    """Quarterly consumption per account plus the total for one year"""
+    totals = cube.frame('quarter', start=year_start, end=year_start + pd.offsets.YearBegin(1))
+    totals['quarter'] = 'Q' + totals['period'].dt.quarter.astype(str)
+    return totals
+
+
+def monthly_totals(cube, year_start):
+    """Monthly consumption per account plus the total for one year, in calendar order"""
+    totals = cube.frame('month', start=year_start, end=year_start + pd.offsets.YearBegin(1))
+    totals['month'] = totals['period'].dt.strftime('%B %Y')
+    return totals
+
+
+def account_totals(cube, year_start):
+    """Total consumption per account plus the total for one year"""
+    return cube.frame('year', start=year_start, end=year_start + pd.offsets.YearBegin(1))
+
+
+def build_views(cube, now=None):
+    """Read the daily, quarterly, monthly and per-account views from a rollup cube"""
+    now = now or datetime.now(pytz.UTC)
+    month_start = pd.Timestamp(now.year, now.month, 1)
+    year_start = pd.Timestamp(now.year, 1, 1)
+    logger.debug(f"Building views from rollup version {cube.version}")
+    return {
+        'daily': daily_totals(cube, month_start),
+        'quarterly': quarterly_totals(cube, year_start),
+        'monthly': monthly_totals(cube, year_start),
+        'accounts': account_totals(cube, year_start)
+    }
+
+
+def hourly_series(cube, start, end):
+    """Hourly consumption per account plus the total between two timestamps"""
+    return cube.frame('hour', start=start, end=end)
+
+
+def hour_day_matrix(cube, year_start):
+    """Total consumption of one year as a 24 x days matrix (hour of day by day of year)"""
+    year_end = year_start + pd.offsets.YearBegin(1)
+    hours = pd.date_range(year_start, year_end, freq='h', inclusive='left')
+    totals = cube.frame('hour', start=year_start, end=year_end, accounts=[TOTAL_ACCOUNT])
+    values = totals.set_index('period')['consumption'].reindex(hours).to_numpy(dtype=float)
+    days = pd.date_range(year_start, year_end, freq='D', inclusive='left')
+    return values.reshape(len(days), 24).T, days
+
+
+# Aggregation parameters accepted by the /energy/* endpoints
+RESOLUTIONS = ['hour', 'day', 'week', 'month', 'quarter', 'year']
+AGGREGATIONS = ['sum', 'mean', 'max']
+FIELDS = ['consumption', 'provided_cost']
+AGGREGATION_PARAMETERS = ['resolution', 'accounts', 'fields', 'agg']
+
+
+def parse_aggregation(params):
+    """Validate resolution/accounts/fields/agg request parameters; return None if none were given"""
+    if not any(name in params for name in AGGREGATION_PARAMETERS):
+        return None
+    resolution = params.get('resolution', 'hour')
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"resolution must be one of {', '.join(RESOLUTIONS)}")
+    agg = params.get('agg', 'sum')
+    if agg not in AGGREGATIONS:
+        raise ValueError(f"agg must be one of {', '.join(AGGREGATIONS)}")
+    fields = _names(params.get('fields'), 'fields') or FIELDS
+    unknown = [field for field in fields if field not in FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    accounts = _names(params.get('accounts'), 'accounts')
+    return {'resolution': resolution, 'accounts': accounts, 'fields': list(fields), 'agg': agg}
+
+
+def _names(value, name):
+    """Return a comma-separated string or list of strings as a list, or None when empty"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = value.split(',') if value else []
+    if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+        raise ValueError(f"{name} must be a list of strings or a comma-separated string")
+    return value or None
+
+
+def aggregate_intervals(df, resolution='hour', accounts=None, fields=None, agg='sum'):
+    """Aggregate hourly intervals per account to a resolution with vectorized grouping"""
+    fields = fields or FIELDS
+    columns = ['period', 'account_name'] + fields
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+    if accounts:
+        selected = df['account_name'].astype(str).isin(accounts)
+        if 'account_id' in df.columns:
+            selected |= df['account_id'].astype(str).isin(accounts)
+        df = df[selected]
+        if df.empty:
+            return pd.DataFrame(columns=columns)
+
+    hours = pd.DatetimeIndex(pd.to_datetime(df['start_time'], utc=True)).tz_convert(None).floor('h')
+    periods = pd.Index(period_start(hours, resolution), name='period')
+    account_names = pd.Index(df['account_name'].astype(str).to_numpy(), name='account_name')
+    values = df[fields].apply(pd.to_numeric, errors='coerce')
+    values.index = pd.RangeIndex(len(values))
+    result = values.groupby([periods, account_names]).agg(agg).reset_index()
+    result['period'] = result['period'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+    return result[columns]
+
+
+def rollup_intervals(cube, df, resolution='hour', accounts=None, fields=None, agg='sum'):
+    """Read summed day to year rows of intervals from a rollup cube; return None to group the raw rows instead.
+
+    Periods that lie inside the intervals' time span are read from the
+    cube. Periods the span cuts at either end are grouped from their raw
+    rows only. Hourly resolutions, means and maxima, sub-hourly intervals
+    and a cube that does not hold the same hours all return None.
+    """
+    fields = fields or FIELDS
+    if resolution == 'hour' or agg != 'sum' or df.empty:
+        return None
+    times = pd.DatetimeIndex(pd.to_datetime(df['start_time'], utc=True)).tz_convert(None)
+    first = times.min().floor('h')
+    last = times.max().floor('h') + pd.Timedelta(hours=1)
+    inner_start = period_start(pd.DatetimeIndex([first]), resolution)[0]
+    if inner_start != first:
+        inner_start = (pd.Period(first, LEVELS[resolution]) + 1).start_time
+    inner_end = period_start(pd.DatetimeIndex([last]), resolution)[0]
+    if inner_start >= inner_end:
+        return None
+    inner = (times >= inner_start) & (times < inner_end)
+    if cube.hour_count(inner_start, inner_end) != int(inner.sum()):
+        return None
+
+    names = accounts
+    if accounts and 'account_id' in df.columns:
+        by_id = df['account_id'].astype(str).isin(accounts)
+        names = sorted(set(accounts) | set(df.loc[by_id, 'account_name'].astype(str)))
+    result = cube.frame(resolution, start=inner_start, end=inner_end, accounts=names, include_total=False)
+    result['period'] = result['period'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+    edges = aggregate_intervals(df[~inner], resolution, accounts, fields, agg)
+    columns = ['period', 'account_name'] + fields
+    parts = [part for part in (result[columns], edges) if not part.empty]
+    if not parts:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(parts, ignore_index=True).sort_values(['period', 'account_name']).reset_index(drop=True)